@@ -0,0 +1,230 @@
+"""
+Bulk user onboarding from CSV.
+
+Password hashing is deliberately slow (hundreds of ms per hash), so the
+hashes are computed in a process pool while earlier batches are being
+inserted. Users go in with bulk_create, which does not send post_save, and
+tenant profiles are then created per batch by create_tenant_profiles
+instead of one INSERT per user from the signal. A batch that hits an email
+taken since validation (a concurrent signup) is retried row by row, and
+the taken rows are reported like any other.
+
+The web endpoint hashes in one small pool shared by every request
+(request_pool) instead of starting a pool per upload.
+
+Expected columns: email (required), password, first_name, last_name,
+phone_number, role ("tenant" or "landlord", default tenant). Rows without
+a password get an unusable one and must go through a password reset.
+"""
+import csv
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from phonenumber_field.phonenumber import PhoneNumber, to_python as to_phone_number
+
+from dashboard import sharding
+from .signals import create_tenant_profiles
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+ROLES = ('tenant', 'landlord')
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    tenant_profiles: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def users_per_second(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'tenant_profiles': self.tenant_profiles,
+            'errors': self.errors,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'users_per_second': round(self.users_per_second, 1),
+        }
+
+
+def _init_worker(settings_module):
+    # Needed when workers are spawned rather than forked
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def _hash_password(password):
+    return make_password(password or None)
+
+
+def parse_rows(lines):
+    """
+    Validate CSV rows and yield (line number, User) for the good ones.
+    Problems are yielded as (line number, error message) strings instead.
+    """
+    reader = csv.DictReader(lines)
+    missing = {'email'} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
+
+    seen = set()
+    for row in reader:
+        line = reader.line_num
+        email = User.objects.normalize_email((row.get('email') or '').strip())
+        role = (row.get('role') or 'tenant').strip().lower()
+        phone = (row.get('phone_number') or '').strip()
+        try:
+            validate_email(email)
+        except ValidationError:
+            yield line, f"invalid email {email!r}"
+            continue
+        if email.lower() in seen:
+            yield line, f"duplicate email {email} in file"
+            continue
+        if role not in ROLES:
+            yield line, f"role must be one of {', '.join(ROLES)}"
+            continue
+        number = to_phone_number(phone) if phone else None
+        if phone and not (isinstance(number, PhoneNumber) and number.is_valid()):
+            yield line, f"invalid phone number {phone!r}"
+            continue
+        seen.add(email.lower())
+        user = User(
+            email=email,
+            first_name=(row.get('first_name') or '').strip(),
+            last_name=(row.get('last_name') or '').strip(),
+            phone_number=phone,
+            landlord=role == 'landlord',
+            tenant=role == 'tenant',
+        )
+        # Hashed later in the pool; kept raw on the unsaved instance until then
+        user.password = row.get('password') or ''
+        yield line, user
+
+
+_request_pool = None
+_request_pool_lock = threading.Lock()
+
+
+def request_pool():
+    """The hashing pool shared by web requests, USER_IMPORT_REQUEST_WORKERS processes"""
+    global _request_pool
+    if _request_pool is None:
+        with _request_pool_lock:
+            if _request_pool is None:
+                _request_pool = ProcessPoolExecutor(
+                    max_workers=settings.USER_IMPORT_REQUEST_WORKERS,
+                    initializer=_init_worker, initargs=(settings.SETTINGS_MODULE,),
+                )
+    return _request_pool
+
+
+def _insert(users):
+    """Create `users` and their tenant profiles in one transaction. Returns (users, tenant profiles) created"""
+    with transaction.atomic():
+        created = User.objects.bulk_create(users)
+        sharding.replicate_users(created)
+        return len(created), len(create_tenant_profiles(created))
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def import_users(lines, batch_size=None, workers=None, dry_run=False, shared_pool=False):
+    """
+    Create users (and tenant profiles) from CSV `lines`. Rows with errors or
+    whose email already exists are reported and skipped; each batch is
+    inserted in its own transaction. Passwords are hashed in a pool of
+    `workers` processes started for this import, or with shared_pool in
+    the long-lived request_pool(). Returns an ImportResult.
+    """
+    batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+    if shared_pool:
+        workers = settings.USER_IMPORT_REQUEST_WORKERS
+    workers = workers or settings.USER_IMPORT_WORKERS or os.cpu_count()
+    started = time.perf_counter()
+    result = ImportResult()
+
+    users = []
+    for line, parsed in parse_rows(lines):
+        if isinstance(parsed, str):
+            result.errors.append({'line': line, 'error': parsed})
+        else:
+            users.append((line, parsed))
+
+    existing = set()
+    for batch in _batches([user.email for _, user in users], batch_size):
+        existing.update(email.lower() for email in User.objects.filter(email__in=batch).values_list('email', flat=True))
+    for line, user in users:
+        if user.email.lower() in existing:
+            result.errors.append({'line': line, 'error': f"user {user.email} already exists"})
+    users = [(line, user) for line, user in users if user.email.lower() not in existing]
+    result.errors.sort(key=lambda error: error['line'])
+
+    if dry_run:
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    pool = None
+    if workers > 1 and len(users) > workers:
+        pool = request_pool() if shared_pool else ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(settings.SETTINGS_MODULE,)
+        )
+        # Results come back in order, so batch N is inserted while the
+        # workers are still hashing the passwords of the batches after it
+        hashes = pool.map(
+            _hash_password, [user.password for _, user in users],
+            chunksize=max(1, min(batch_size, len(users)) // (workers * 4)),
+        )
+    else:
+        hashes = map(_hash_password, [user.password for _, user in users])
+
+    try:
+        for batch in _batches(users, batch_size):
+            for (_, user), password_hash in zip(batch, hashes):
+                user.password = password_hash
+            try:
+                created, profiles = _insert([user for _, user in batch])
+            except IntegrityError:
+                # An email was taken after validation; find which row by row
+                created = profiles = 0
+                for line, user in batch:
+                    try:
+                        row_created, row_profiles = _insert([user])
+                    except IntegrityError:
+                        result.errors.append({'line': line, 'error': f"user {user.email} already exists"})
+                        continue
+                    created += row_created
+                    profiles += row_profiles
+            result.created += created
+            result.tenant_profiles += profiles
+            logger.info(f"Imported {result.created}/{len(users)} users")
+    finally:
+        if pool is not None and not shared_pool:
+            pool.shutdown(cancel_futures=True)
+    result.errors.sort(key=lambda error: error['line'])
+
+    result.elapsed = time.perf_counter() - started
+    logger.info(
+        f"User import created {result.created} users in {result.elapsed:.1f}s "
+        f"({result.users_per_second:.0f} users/s), {len(result.errors)} rows skipped"
+    )
+    return result
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importer import import_users
+
+
+class Command(BaseCommand):
+    help = 'Create users and tenant profiles from a CSV file (email, password, first_name, last_name, phone_number, role)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Users inserted per transaction (default: USER_IMPORT_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Password hashing processes (default: USER_IMPORT_WORKERS or one per CPU)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without creating anyone')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_path'], newline='', encoding='utf-8-sig') as lines:
+                result = import_users(
+                    lines,
+                    batch_size=options['batch_size'],
+                    workers=options['workers'],
+                    dry_run=options['dry_run'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if options['dry_run']:
+            self.stdout.write(f'{len(result.errors)} rows would be skipped')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created} users ({result.tenant_profiles} tenant profiles) in '
+            f'{result.elapsed:.1f}s: {result.users_per_second:.0f} users/s, {len(result.errors)} rows skipped'
+        ))
@@ -1,6 +1,8 @@
 from .models import User
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.utils import timezone
+from dashboard import delta, portfolio, sharding
 from dashboard.models import Property, Tenant
 from datetime import datetime, timedelta
 
@@ -53,41 +55,42 @@ class TenantAssignmentSerializer(serializers.Serializer):
     lease_start = serializers.DateField(required=False)
     lease_end = serializers.DateField(required=False)
     
-    def validate_property_id(self, value):
-        try:
-            property_obj = Property.objects.get(id=value)
-            if not property_obj.is_vacant:
-                raise serializers.ValidationError("This property is not available")
-            return value
-        except Property.DoesNotExist:
-            raise serializers.ValidationError("Property does not exist")
-    
     def create(self, validated_data):
         user = self.context['request'].user
         property_id = validated_data['property_id']
         lease_start = validated_data.get('lease_start', datetime.now().date())
         lease_end = validated_data.get('lease_end', (datetime.now() + timedelta(days=365)).date())
         
-        # Get or create tenant profile
-        tenant, created = Tenant.objects.get_or_create(
-            user=user,
-            defaults={
-                'lease_start': lease_start,
-                'lease_end': lease_end,
-                'property_id': property_id
-            }
-        )
-        
-        if not created:
-            tenant.property_id = property_id
-            tenant.lease_start = lease_start
-            tenant.lease_end = lease_end
-            tenant.save()
+        shard = sharding.current_shard()
+        if sharding.enabled():
+            # The unit decides the shard; the tenant's profile follows it there
+            shard = sharding.locate(Property, id=property_id)
+            if shard is None:
+                raise serializers.ValidationError({"property_id": ["Property does not exist"]})
+            if sharding.move_tenant_profiles([user.pk], shard):
+                raise serializers.ValidationError({"property_id": ["Tenants with payment history cannot move to this landlord yet"]})
         
-        # Mark property as occupied
-        property_obj = Property.objects.get(id=property_id)
-        property_obj.is_vacant = False
-        property_obj.save()
+        with sharding.using_shard(shard), sharding.atomic():
+            # Claim the unit in one conditional UPDATE: of any number of
+            # concurrent requests only one can flip is_vacant, the rest see 0 rows
+            claimed = Property.objects.filter(id=property_id, is_vacant=True).update(is_vacant=False, updated_at=timezone.now())
+            if not claimed:
+                if Property.objects.filter(id=property_id).exists():
+                    raise serializers.ValidationError({"property_id": ["This property is not available"]})
+                raise serializers.ValidationError({"property_id": ["Property does not exist"]})
+            property_obj = Property.objects.get(id=property_id)
+            
+            assignment = {'property': property_obj, 'lease_start': lease_start, 'lease_end': lease_end}
+            current = Tenant.objects.filter(user=user).values_list('id', 'property__landlord_id', 'property_id').first()
+            if current:
+                tenant_id, previous_landlord_id, previous_unit = current
+                Tenant.objects.filter(id=tenant_id).update(**assignment, updated_at=timezone.now())
+                delta.touch_properties([previous_unit])
+                tenant = Tenant(id=tenant_id, user=user, **assignment)
+            else:
+                previous_landlord_id = None
+                tenant = Tenant.objects.create(user=user, **assignment)
+            portfolio.tenants_assigned([property_obj.landlord_id], previous_landlord_ids=[previous_landlord_id])
         
         return tenant
 
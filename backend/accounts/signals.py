@@ -1,11 +1,33 @@
-from django.db.models.signals import post_save
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from dashboard import sharding
 from dashboard.models import Tenant
 from datetime import datetime, timedelta
+import logging
 
+logger = logging.getLogger(__name__)
 User = get_user_model()
 
+def default_lease():
+    """(lease_start, lease_end) for a new, unassigned tenant: a one year lease from today"""
+    return datetime.now().date(), (datetime.now() + timedelta(days=365)).date()
+
+@receiver(post_save, sender=User)
+def replicate_user(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Keep the shards' copy of the user current; connected before
+    create_tenant_profile so the copy exists when the profile is written
+    """
+    if not raw and using == DEFAULT_DB_ALIAS:
+        sharding.replicate_users([instance])
+
+@receiver(post_delete, sender=User)
+def remove_replicated_user(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        sharding.remove_users([instance.pk])
+
 @receiver(post_save, sender=User)
 def create_tenant_profile(sender, instance, created, **kwargs):
     """
@@ -14,10 +36,25 @@ def create_tenant_profile(sender, instance, created, **kwargs):
     if created and instance.tenant and not instance.landlord:
         # Create tenant profile without property assignment initially
         # Property will be assigned later through a separate process
+        lease_start, lease_end = default_lease()
         tenant = Tenant.objects.create(
             user=instance,
-            lease_start=datetime.now().date(),
-            lease_end=(datetime.now() + timedelta(days=365)).date(),  # Default 1 year lease
+            lease_start=lease_start,
+            lease_end=lease_end,
             property=None  # Will be assigned later
         )
-        print(f"Tenant profile created for {instance.email}")
+        logger.info(f"Tenant profile created for {instance.email}")
+
+def create_tenant_profiles(users):
+    """
+    Batched equivalent of create_tenant_profile for users inserted with
+    bulk_create, which never sends post_save. Returns the new profiles.
+    """
+    lease_start, lease_end = default_lease()
+    profiles = Tenant.objects.bulk_create([
+        Tenant(user=user, lease_start=lease_start, lease_end=lease_end, property=None)
+        for user in users
+        if user.tenant and not user.landlord
+    ])
+    logger.info(f"Tenant profiles created for {len(profiles)} imported users")
+    return profiles
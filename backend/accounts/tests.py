@@ -1,3 +1,249 @@
-from django.test import TestCase
+import threading
+import time
+from io import StringIO
+from tempfile import NamedTemporaryFile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from dashboard.models import Property, Tenant
+from dashboard.testing import QueryBudgetTestCase, TEST_PASSWORD
+from . import importer
+from .importer import import_users
+from .models import User
+from .serializers import TenantAssignmentSerializer
+
+
+class AccountsQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_register(self):
+        def make_request(portfolio):
+            return self.client.post(reverse('user-register'), {
+                'email': f'{portfolio.label}-signup@example.com',
+                'password': TEST_PASSWORD,
+                'password2': TEST_PASSWORD,
+                'phone_number': '+254711111111',
+                'landlord': False,
+                'tenant': True,
+            }, format='json')
+        self.assertQueryBudget(4, make_request, expected_status=201)
+
+    def test_token_obtain(self):
+        def make_request(portfolio):
+            return self.client.post(reverse('token_obtain_pair'), {
+                'email': portfolio.landlord.email,
+                'password': TEST_PASSWORD,
+            }, format='json')
+        self.assertQueryBudget(3, make_request)
+
+    def test_token_refresh(self):
+        refresh_tokens = {}
+        for portfolio in self.portfolios:
+            response = self.client.post(reverse('token_obtain_pair'), {
+                'email': portfolio.landlord.email,
+                'password': TEST_PASSWORD,
+            }, format='json')
+            refresh_tokens[portfolio.label] = response.data['refresh']
+
+        def make_request(portfolio):
+            return self.client.post(reverse('token_refresh'), {
+                'refresh': refresh_tokens[portfolio.label],
+            }, format='json')
+        self.assertQueryBudget(2, make_request)
+
+    def test_user_info(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.get(reverse('user-info'))
+        self.assertQueryBudget(1, make_request)
+
+    def test_assign_tenant(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.unassigned_tenant.user)
+            return self.client.post(reverse('assign-tenant'), {
+                'property_id': portfolio.vacant_properties[0].id,
+            }, format='json')
+        self.assertQueryBudget(9, make_request, expected_status=201)
+
+        for portfolio in self.portfolios:
+            self.assertFalse(Property.objects.get(id=portfolio.vacant_properties[0].id).is_vacant)
+
+    def test_available_properties(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.primary_tenant.user)
+            return self.client.get(reverse('available-properties'))
+        self.assertQueryBudget(2, make_request)
+
+    def test_tenant_profile(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.primary_tenant.user)
+            return self.client.get(reverse('tenant-profile'))
+        self.assertQueryBudget(3, make_request)
+
+
+IMPORT_CSV = """email,password,first_name,last_name,phone_number,role
+amina@example.com,Secret-pass-1,Amina,Otieno,+254711000001,tenant
+brian@example.com,,Brian,Kamau,,landlord
+not-an-email,Secret-pass-1,,,,tenant
+AMINA@example.com,Secret-pass-1,,,,tenant
+carol@example.com,Secret-pass-1,,,12345,tenant
+existing@example.com,Secret-pass-1,,,,tenant
+dan@example.com,Secret-pass-1,,,,caretaker
+"""
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserImportTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(email='existing@example.com', password=TEST_PASSWORD, tenant=True)
+
+    def test_import_creates_users_and_tenant_profiles(self):
+        result = import_users(StringIO(IMPORT_CSV), workers=1)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.tenant_profiles, 1)
+        self.assertEqual([error['line'] for error in result.errors], [4, 5, 6, 7, 8])
+        amina = User.objects.get(email='amina@example.com')
+        self.assertTrue(amina.check_password('Secret-pass-1'))
+        self.assertEqual(str(amina.phone_number), '+254711000001')
+        self.assertIsNone(amina.tenant_profile.property)
+        brian = User.objects.get(email='brian@example.com')
+        self.assertFalse(brian.has_usable_password())
+        self.assertFalse(Tenant.objects.filter(user=brian).exists())
+
+    def test_passwords_are_hashed_in_a_process_pool(self):
+        rows = ''.join(f'user{i}@example.com,Secret-pass-{i},,,,tenant\n' for i in range(40))
+        result = import_users(StringIO('email,password,first_name,last_name,phone_number,role\n' + rows),
+                              batch_size=15, workers=2)
+
+        self.assertEqual((result.created, result.tenant_profiles, result.errors), (40, 40, []))
+        self.assertTrue(User.objects.get(email='user39@example.com').check_password('Secret-pass-39'))
+        self.assertGreater(result.users_per_second, 0)
+
+    def test_emails_taken_during_the_import_become_row_errors(self):
+        real_hash = importer._hash_password
+
+        def hash_after_a_concurrent_signup(password):
+            # Amina signs up between validation and the insert
+            if not User.objects.filter(email='amina@example.com').exists():
+                User.objects.create_user(email='amina@example.com', password=TEST_PASSWORD, tenant=True)
+            return real_hash(password)
+
+        with mock.patch.object(importer, '_hash_password', side_effect=hash_after_a_concurrent_signup):
+            result = import_users(StringIO(IMPORT_CSV), workers=1)
+
+        self.assertEqual((result.created, result.tenant_profiles), (1, 0))
+        self.assertEqual([error['line'] for error in result.errors], [2, 4, 5, 6, 7, 8])
+        self.assertEqual(result.errors[0]['error'], 'user amina@example.com already exists')
+        self.assertTrue(User.objects.filter(email='brian@example.com').exists())
+        self.assertEqual(User.objects.filter(email='amina@example.com').count(), 1)
+
+    def test_endpoint_hashes_in_the_shared_pool(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(email='admin@example.com', password=TEST_PASSWORD, is_staff=True))
+        pool = mock.Mock(map=mock.Mock(side_effect=lambda function, passwords, chunksize: map(function, passwords)))
+        with mock.patch.object(importer, 'request_pool', return_value=pool), \
+                mock.patch.object(importer, 'ProcessPoolExecutor') as per_request_pool:
+            for upload_number in range(2):
+                rows = ''.join(f'web{upload_number}-{i}@example.com,Secret-pass-{i},,,,tenant\n' for i in range(6))
+                upload = SimpleUploadedFile('users.csv', ('email,password,first_name,last_name,phone_number,role\n' + rows).encode())
+                self.assertEqual(client.post(reverse('import-users'), {'file': upload}).data['created'], 6)
+        per_request_pool.assert_not_called()
+        self.assertEqual(pool.map.call_count, 2)
+        pool.shutdown.assert_not_called()
+
+    def test_import_endpoint_is_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(email='existing@example.com'))
+        upload = SimpleUploadedFile('users.csv', IMPORT_CSV.encode(), content_type='text/csv')
+        self.assertEqual(client.post(reverse('import-users'), {'file': upload}).status_code, 403)
+
+        client.force_authenticate(User.objects.create_user(email='admin@example.com', password=TEST_PASSWORD, is_staff=True))
+        upload = SimpleUploadedFile('users.csv', IMPORT_CSV.encode(), content_type='text/csv')
+        response = client.post(reverse('import-users'), {'file': upload})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertIn('users_per_second', response.data)
+
+    def test_import_users_command(self):
+        with NamedTemporaryFile('w', suffix='.csv') as csv_file:
+            csv_file.write(IMPORT_CSV)
+            csv_file.flush()
+            out, err = StringIO(), StringIO()
+            call_command('import_users', csv_file.name, workers=1, stdout=out, stderr=err)
+
+        self.assertIn('Created 2 users', out.getvalue())
+        self.assertIn('users/s', out.getvalue())
+        self.assertIn('line 4: invalid email', err.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TenantAssignmentRaceTests(TransactionTestCase):
+    THREADS = 24
+    UNITS = 3
+    MAX_ATTEMPTS = 50
+    GAVE_UP = 'gave up'
+
+    def setUp(self):
+        landlord = User.objects.create_user(email='race-landlord@example.com', password=TEST_PASSWORD, landlord=True)
+        self.units = [
+            Property.objects.create(landlord=landlord, address=f'Race unit {i}', monthly_rent=10000, is_vacant=True)
+            for i in range(self.UNITS)
+        ]
+        self.users = [
+            User.objects.create_user(email=f'racer-{i}@example.com', password=TEST_PASSWORD, tenant=True)
+            for i in range(self.THREADS)
+        ]
+
+    def assign(self, user, unit, barrier, outcomes):
+        serializer = TenantAssignmentSerializer(
+            data={'property_id': unit.id}, context={'request': SimpleNamespace(user=user)}
+        )
+        serializer.is_valid(raise_exception=True)
+        barrier.wait()
+        try:
+            for attempt in range(self.MAX_ATTEMPTS):
+                try:
+                    serializer.save()
+                    outcomes.append((unit.id, user.id, 'won'))
+                    return
+                except OperationalError:
+                    # SQLite reports lock contention instead of waiting; a client would back off and retry
+                    time.sleep(0.002 * (attempt + 1))
+                except serializers.ValidationError as e:
+                    outcomes.append((unit.id, user.id, e.detail['property_id'][0]))
+                    return
+            outcomes.append((unit.id, user.id, self.GAVE_UP))
+        finally:
+            connection.close()
+
+    def test_each_unit_goes_to_exactly_one_of_many_concurrent_tenants(self):
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+        threads = [
+            threading.Thread(target=self.assign, args=(user, self.units[i % self.UNITS], barrier, outcomes))
+            for i, user in enumerate(self.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), self.THREADS)
+        self.assertNotIn(self.GAVE_UP, [result for _, _, result in outcomes], f"still locked after {self.MAX_ATTEMPTS} attempts")
+        for unit in self.units:
+            results = [result for unit_id, _, result in outcomes if unit_id == unit.id]
+            self.assertEqual(results.count('won'), 1, results)
+            self.assertEqual(set(results) - {'won'}, {'This property is not available'})
+            winner = next(user_id for unit_id, user_id, result in outcomes if unit_id == unit.id and result == 'won')
+            self.assertEqual(list(Tenant.objects.filter(property=unit).values_list('user_id', flat=True)), [winner])
+            unit.refresh_from_db()
+            self.assertFalse(unit.is_vacant)
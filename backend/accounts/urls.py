@@ -5,7 +5,8 @@ from .views import (
     UserInfoView,
     TenantAssignmentView,
     AvailablePropertiesView,
-    TenantProfileView
+    TenantProfileView,
+    UserImportView
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -17,4 +18,5 @@ urlpatterns = [
     path('assign-tenant/', TenantAssignmentView.as_view(), name='assign-tenant'),
     path('available-properties/', AvailablePropertiesView.as_view(), name='available-properties'),
     path('tenant-profile/', TenantProfileView.as_view(), name='tenant-profile'),
+    path('import-users/', UserImportView.as_view(), name='import-users'),
 ]
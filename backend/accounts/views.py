@@ -1,3 +1,4 @@
+import io
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import generics
@@ -6,21 +7,26 @@ from .serializers import UserRegistrationSerializer, TenantAssignmentSerializer,
 from .serializers import MyTokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from dashboard import sharding
 from dashboard.models import Property, Tenant
 from django.contrib.auth import get_user_model
+from .importer import import_users
 
 User = get_user_model()
 
 class MyTokenObtainPairView(TokenObtainPairView):
+    throttle_scope = 'auth'
     serializer_class = MyTokenObtainPairSerializer
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class UserRegistrationView(generics.CreateAPIView):
+    throttle_scope = 'auth'
     serializer_class = UserRegistrationSerializer
 
     def post(self, request):
@@ -73,7 +79,12 @@ class AvailablePropertiesView(APIView):
     
     def get(self, request):
         """Get all available properties for tenant assignment"""
-        available_properties = Property.objects.filter(is_vacant=True)
+        # Every landlord's vacant units, whichever shard they live on
+        available_properties = [
+            prop
+            for alias in sharding.each_database()
+            for prop in Property.objects.using(alias).filter(is_vacant=True)
+        ]
         serializer = PropertySerializer(available_properties, many=True)
         return Response(serializer.data)
 
@@ -95,3 +106,27 @@ class TenantProfileView(APIView):
                 {"error": "Tenant profile not found"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+
+class UserImportView(APIView):
+    """Staff-only CSV onboarding; see accounts.importer for the expected columns"""
+    throttle_scope = 'bulk'
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {"error": "Upload the CSV as the 'file' field"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            # One small pool shared by all requests, rather than a CPU-wide pool per upload
+            result = import_users(lines, dry_run=request.data.get('dry_run') in ('1', 'true', 'True'), shared_pool=True)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response(
+                {"error": str(e)}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
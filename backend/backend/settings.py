@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 from django.conf import settings
 import os
 from dotenv import load_dotenv
@@ -54,17 +55,36 @@ INSTALLED_APPS = [
     'accounts',
     'payments',
     'dashboard',
+    'monitoring',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES':( 
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'dashboard.sharding.ShardRoutingJWTAuthentication',
         'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
-        )
+        ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'monitoring.throttling.TokenBucketThrottle',
+        ),
 }
 
+# Token-bucket rates per view `throttle_scope`: "user" buckets are per
+# authenticated user, "anon" buckets per client IP (None: not limited).
+# Views that fan out to Stripe or aggregate whole portfolios get less.
+THROTTLE_SCOPES = {
+    'default': {'user': '300/min', 'anon': '120/min'},
+    'expensive': {'user': '20/min', 'anon': '10/min'},
+    'payments': {'user': '30/min', 'anon': '10/min'},
+    'bulk': {'user': '5/min', 'anon': '5/min'},
+    'auth': {'user': '30/min', 'anon': '30/min'},
+}
+# 'local' keeps buckets per process; 'cache' shares them through CACHES['default']
+THROTTLE_STORE = 'local'
+
 
 MIDDLEWARE = [
+    'monitoring.middleware.MetricsMiddleware',
+    'dashboard.sharding.ShardContextMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -75,6 +95,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'X-Sync-Watermark']
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -107,6 +129,22 @@ DATABASES = {
     }
 }
 
+# Landlord-keyed sharding (see dashboard.sharding). SHARD_COUNT local SQLite
+# shards are always configured so they can be migrated and tested; landlord
+# data only goes to them once listed in SHARD_DATABASES, e.g.
+# SHARD_DATABASES=shard_1,shard_2 (then run rebalance_shards --sync-users).
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 2))
+for shard in range(1, SHARD_COUNT + 1):
+    DATABASES[f'shard_{shard}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_shard_{shard}.sqlite3',
+    }
+SHARD_DATABASES = [alias for alias in os.getenv('SHARD_DATABASES', '').split(',') if alias]
+DATABASE_ROUTERS = ['dashboard.sharding.LandlordShardRouter']
+SHARD_DIRECTORY_CACHE_SECONDS = 60 * 60
+# Rows copied per insert when rebalance_shards moves a landlord
+SHARD_MOVE_BATCH_SIZE = 1000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -133,6 +171,92 @@ STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', 'sk_test_your_stripe_secret_k
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', 'pk_test_your_stripe_publishable_key_here')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', 'whsec_your_webhook_secret_here')
 
+# Stripe client tuning: (connect, read) timeouts in seconds per operation,
+# retries for transient errors, and the circuit breaker that skips calls
+# after repeated failures
+STRIPE_TIMEOUTS = {
+    'default': (3.05, 10),
+    'create': (3.05, 15),
+    'retrieve': (3.05, 5),
+}
+STRIPE_MAX_RETRIES = 2
+STRIPE_CIRCUIT_FAILURE_THRESHOLD = 5
+STRIPE_CIRCUIT_RESET_SECONDS = 30
+STRIPE_HTTP_POOL_SIZE = 10
+
+# Terminal payments older than this move to the PaymentArchive table
+PAYMENT_ARCHIVE_AFTER_DAYS = 365
+PAYMENT_ARCHIVE_BATCH_SIZE = 1000
+
+# Monthly rent billing: charges are due on this day of the month
+RENT_DUE_DAY = 5
+BILLING_BATCH_SIZE = 5000
+
+# Reminder emails (send_rent_reminders): rent reminders go out this many
+# days before RENT_DUE_DAY, lease-end reminders this many days before the
+# lease ends; messages per send_messages() call on the shared connection
+RENT_REMINDER_DAYS = 3
+LEASE_END_REMINDER_DAYS = 30
+REMINDER_BATCH_SIZE = 500
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Nyumbani <no-reply@nyumbani.local>')
+
+# Bulk user import: users per insert batch and password hashing processes
+# (None: one per CPU). Uploads through the web endpoint share one pool of
+# USER_IMPORT_REQUEST_WORKERS processes instead.
+USER_IMPORT_BATCH_SIZE = 1000
+USER_IMPORT_WORKERS = None
+USER_IMPORT_REQUEST_WORKERS = 2
+
+# Monthly landlord statements (generate_statements): output folder and
+# rendering processes (None: one per CPU)
+STATEMENTS_ROOT = Path(os.getenv('STATEMENTS_ROOT', BASE_DIR / 'statements'))
+STATEMENT_WORKERS = None
+
+# Income chart series are cached per landlord until a payment changes state;
+# use a shared backend (e.g. Redis) when running several workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+INCOME_SERIES_CACHE_SECONDS = 60 * 60 * 24
+
+# Responses to requests sent with an Idempotency-Key are replayed for retries this long
+# (purge expired ones with the purge_idempotency_keys command)
+IDEMPOTENCY_KEY_TTL_SECONDS = 60 * 60 * 24
+
+# Most GET sub-requests accepted by /batch/ in one call
+BATCH_MAX_REQUESTS = 10
+
+# Payment status Server-Sent Events (payments/stream/, ASGI only). The
+# in-process broker only reaches streams on the same worker; point this at a
+# cross-process backend when running several.
+PAYMENT_EVENTS_BACKEND = 'payments.streams.InProcessBroker'
+PAYMENT_STREAM_KEEPALIVE_SECONDS = 15
+# Below ACCESS_TOKEN_LIFETIME: the client reconnects with a freshly refreshed
+# token when the stream ends, before the one it opened with expires
+PAYMENT_STREAM_MAX_SECONDS = 240
+PAYMENT_STREAM_RETRY_MS = 3000
+
+# Payment change feed (payments/changes/). Entries are numbered in commit
+# order when read; compact_payment_changes drops entries past retention.
+PAYMENT_CHANGES_PAGE_SIZE = 500
+PAYMENT_CHANGES_RETENTION_DAYS = 30
+
+# Delta sync (?since= on the property and payment lists). The watermark
+# handed back lags the read by the overlap so rows committed during it are
+# resent; deletions are remembered for the tombstone window, older
+# watermarks get a full list.
+DELTA_SYNC_OVERLAP_SECONDS = 2
+DELTA_SYNC_TOMBSTONE_DAYS = 30
+
+# Admin changelists on large tables count at most this many rows (above it an
+# unfiltered PostgreSQL table reports the planner's estimate instead)
+ADMIN_COUNT_LIMIT = 10000
+
+# Metrics (served at /internal/metrics/ to these addresses and to staff users)
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -7,6 +7,7 @@ urlpatterns = [
     path('auth/', include('accounts.urls')),
     path('',include('dashboard.urls')),
     path('payments/', include('payments.urls')),
+    path('internal/', include('monitoring.urls')),
     # Redirect /api/payments/ to /payments/ for backward compatibility
     path('api/payments/', RedirectView.as_view(url='/payments/', permanent=True)),
 ]
@@ -1,5 +1,24 @@
 from django.contrib import admin
+
+from .large_admin import LargeTableAdmin
 from .models import Tenant, Property
 
-admin.site.register(Property)
-admin.site.register(Tenant)
\ No newline at end of file
+
+@admin.register(Property)
+class PropertyAdmin(LargeTableAdmin):
+    list_display = ('id', 'address', 'landlord', 'monthly_rent', 'is_vacant', 'updated_at')
+    list_select_related = ('landlord',)
+    search_fields = ('landlord__email__exact',)
+    search_help_text = 'Exact landlord email'
+    raw_id_fields = ('landlord',)
+
+
+@admin.register(Tenant)
+class TenantAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'property', 'lease_start', 'lease_end')
+    list_select_related = ('user', 'property')
+    # tenant_lease_end_idx
+    list_filter = (('lease_end', admin.DateFieldListFilter),)
+    search_fields = ('user__email__exact',)
+    search_help_text = 'Exact tenant email'
+    raw_id_fields = ('user', 'property')
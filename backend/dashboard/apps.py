@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    def ready(self):
+        import dashboard.signals
+        from django.db.models.signals import post_migrate
+        from dashboard.sharding import reserve_id_ranges
+        post_migrate.connect(reserve_id_ranges, sender=self)
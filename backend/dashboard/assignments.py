@@ -0,0 +1,110 @@
+"""
+Landlord-side bulk tenant assignment.
+
+Tenants (by email) and the landlord's units are each resolved with one
+query, every row is checked against the whole batch (unknown or
+ineligible tenant, unknown unit, unit not vacant, the same tenant or unit
+twice), and the valid rows
+are applied together: one conditional UPDATE claims the units, one
+bulk_update moves the tenants and the portfolio counters are adjusted
+once per landlord.
+"""
+import logging
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from accounts.signals import default_lease
+from . import delta, portfolio, sharding
+from .models import Property, Tenant
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+# Same answer for unknown emails and other landlords' tenants, so the
+# endpoint can't be used to find out who is a tenant elsewhere
+INELIGIBLE_TENANT = "No tenant with this email can be assigned"
+
+
+class UnitsTaken(Exception):
+    """A unit in the batch was claimed by someone else while the batch was being applied"""
+
+
+def assign_tenants(landlord, rows):
+    """
+    Assign validated `rows` (dicts with email, property_id and optional
+    lease_start/lease_end) to the landlord's units. Returns one result per
+    row, in order: {'email', 'property_id', 'status': 'assigned'} or with
+    'status': 'error' and 'errors'. Only unassigned tenants and the
+    landlord's own tenants can be assigned. Raises UnitsTaken, with nothing
+    applied, if a unit stopped being vacant between validation and update.
+    """
+    emails = {User.objects.normalize_email(row['email']) for row in rows}
+    if sharding.enabled():
+        # Newcomers' profiles may still be on another shard than the landlord's
+        user_ids = list(User.objects.filter(email__in=emails).values_list('id', flat=True))
+        sharding.move_tenant_profiles(user_ids, sharding.current_shard())
+    tenants = {
+        email: (tenant_id, previous_landlord_id, previous_unit)
+        for tenant_id, email, previous_landlord_id, previous_unit in Tenant.objects.filter(user__email__in=emails)
+        .values_list('id', 'user__email', 'property__landlord_id', 'property_id')
+    }
+    vacancy = dict(
+        Property.objects.filter(landlord=landlord, id__in={row['property_id'] for row in rows})
+        .values_list('id', 'is_vacant')
+    )
+
+    default_start, default_end = default_lease()
+    results, assignments, previous_units, seen_emails, seen_units = [], [], [], set(), set()
+    for row in rows:
+        email = User.objects.normalize_email(row['email'])
+        unit = row['property_id']
+        errors = {}
+        if email not in tenants or tenants[email][1] not in (None, landlord.id):
+            errors['email'] = [INELIGIBLE_TENANT]
+        elif email in seen_emails:
+            errors['email'] = ["This tenant appears more than once in the batch"]
+        if unit not in vacancy:
+            errors['property_id'] = ["Property does not exist"]
+        elif unit in seen_units:
+            errors['property_id'] = ["This property appears more than once in the batch"]
+        elif not vacancy[unit]:
+            errors['property_id'] = ["This property is not available"]
+        result = {'email': email, 'property_id': unit}
+        if errors:
+            results.append({**result, 'status': 'error', 'errors': errors})
+            continue
+        seen_emails.add(email)
+        seen_units.add(unit)
+        tenant_id, previous_landlord_id, previous_unit = tenants[email]
+        previous_units.append(previous_unit)
+        assignments.append((
+            Tenant(
+                id=tenant_id,
+                property_id=unit,
+                lease_start=row.get('lease_start') or default_start,
+                lease_end=row.get('lease_end') or default_end,
+            ),
+            previous_landlord_id,
+        ))
+        results.append({**result, 'status': 'assigned'})
+
+    if assignments:
+        units = [tenant.property_id for tenant, _ in assignments]
+        now = timezone.now()
+        with sharding.atomic():
+            # Same guard as single assignment: only units that are still vacant flip
+            claimed = Property.objects.filter(id__in=units, is_vacant=True).update(is_vacant=False, updated_at=now)
+            if claimed != len(units):
+                raise UnitsTaken(f"{len(units) - claimed} of {len(units)} units were taken concurrently")
+            for tenant, _ in assignments:
+                tenant.updated_at = now
+            Tenant.objects.bulk_update([tenant for tenant, _ in assignments], ['property', 'lease_start', 'lease_end', 'updated_at'])
+            # Units the tenants moved off list them no more
+            delta.touch_properties(previous_units)
+            portfolio.tenants_assigned(
+                [landlord.id] * len(assignments),
+                previous_landlord_ids=[previous for _, previous in assignments],
+            )
+        logger.info(f"Landlord {landlord.id} assigned {len(assignments)} tenants in bulk")
+    return results
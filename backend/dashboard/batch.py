@@ -0,0 +1,86 @@
+"""
+In-process dispatch of batched GET requests.
+
+A dashboard needs several endpoints on load; sent through /batch/ they are
+resolved and run one after another inside the batch request, so the JWT is
+decoded and the user loaded once, middleware runs once and every
+sub-request uses the same database connection. Sub-requests are handed the
+batch's authenticated user the same way DRF's force_authenticate does, so
+each view still applies its own permissions and throttling.
+
+Sub-requests skip middleware, so only DRF APIViews (which authenticate
+themselves) are dispatched; other paths, and any sub-request that raises,
+get an error result of their own without failing the rest of the batch.
+"""
+import io
+import json
+import logging
+from urllib.parse import urlsplit
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import Http404
+from django.urls import Resolver404, resolve
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# Keys of the batch request's environ that must not leak into sub-requests
+BODY_KEYS = ('CONTENT_LENGTH', 'CONTENT_TYPE', 'HTTP_CONTENT_LENGTH', 'HTTP_CONTENT_TYPE')
+
+
+def _error(path, status, message):
+    return {'path': path, 'status': status, 'body': {'error': message}}
+
+
+def _sub_request(request, path, query_string):
+    environ = {key: value for key, value in request.META.items() if key not in BODY_KEYS}
+    environ.update({
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query_string,
+        'wsgi.input': io.BytesIO(b''),
+    })
+    sub_request = WSGIRequest(environ)
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def dispatch(request, path, batch_view):
+    """Run one GET sub-request and return {'path', 'status', 'body'}"""
+    if not isinstance(path, str) or not path.startswith('/'):
+        return _error(path, 400, 'Each request must be an absolute path such as /properties/count/')
+    url = urlsplit(path)
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        return _error(path, 404, 'Not found')
+
+    view_class = getattr(match.func, 'view_class', None)
+    if view_class is batch_view:
+        return _error(path, 400, 'Batches cannot be nested')
+    if view_class is not None and view_class.view_is_async:
+        return _error(path, 400, 'Streaming endpoints cannot be batched')
+    if view_class is None or not issubclass(view_class, APIView):
+        return _error(path, 400, 'Only API endpoints can be batched')
+
+    sub_request = _sub_request(request, url.path, url.query)
+    sub_request.resolver_match = match
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+    except Http404:
+        return _error(path, 404, 'Not found')
+    except Exception:
+        logger.exception(f"Batched request to {path} failed")
+        return _error(path, 500, 'Internal server error')
+
+    if response.streaming:
+        return _error(path, 400, 'Streaming endpoints cannot be batched')
+    # DRF responses are passed on as data, without rendering and re-parsing them
+    if hasattr(response, 'data'):
+        body = response.data
+    elif response.get('Content-Type', '').startswith('application/json'):
+        body = json.loads(response.content or b'null')
+    else:
+        body = response.content.decode(response.charset)
+    return {'path': path, 'status': response.status_code, 'body': body}
@@ -0,0 +1,81 @@
+"""
+Delta sync for list endpoints.
+
+Clients send back the watermark of their last load as ?since= and get only
+rows whose updated_at is later, plus the ids of rows deleted since
+(DeletedRow tombstones). The new watermark is taken when the read starts,
+minus DELTA_SYNC_OVERLAP_SECONDS, so a row committed by a transaction that
+stamped it just before the read is sent again next time rather than missed.
+Clients upsert by id, so the overlap only costs a few repeated rows.
+
+A watermark older than the tombstone retention gets a full list instead,
+flagged with "full": true, since deletions before it are gone.
+
+Changes that matter to a property row but happen on another table (tenants
+assigned to, moved off or deleted from the unit) bump the property's
+updated_at through touch_properties().
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import DeletedRow, Property
+
+
+class InvalidWatermark(ValueError):
+    pass
+
+
+def parse_since(request):
+    """The ?since= watermark as an aware datetime, or None when absent"""
+    value = request.query_params.get('since')
+    if not value:
+        return None
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        since = None
+    if since is None:
+        raise InvalidWatermark('since must be a watermark returned by a previous load')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def watermark(started):
+    return (started - timedelta(seconds=settings.DELTA_SYNC_OVERLAP_SECONDS)).isoformat()
+
+
+def needs_full_sync(since):
+    return since < timezone.now() - timedelta(days=settings.DELTA_SYNC_TOMBSTONE_DAYS)
+
+
+def deleted_since(model, since, **owner):
+    """Ids of `model` rows deleted after `since`, filtered by landlord_id or tenant_id"""
+    return list(
+        DeletedRow.objects.filter(model=model._meta.label_lower, deleted_at__gt=since, **owner)
+        .order_by('deleted_at').values_list('object_id', flat=True)
+    )
+
+
+def record_deleted(model, rows):
+    """Tombstones for (object_id, landlord_id, tenant_id) triples"""
+    DeletedRow.objects.bulk_create([
+        DeletedRow(model=model._meta.label_lower, object_id=object_id, landlord_id=landlord_id, tenant_id=tenant_id)
+        for object_id, landlord_id, tenant_id in rows
+    ])
+
+
+def touch_properties(ids):
+    """Bump updated_at of properties whose tenant list changed"""
+    ids = [id for id in set(ids) if id is not None]
+    if ids:
+        Property.objects.filter(id__in=ids).update(updated_at=timezone.now())
+
+
+def purge_tombstones(days=None):
+    days = settings.DELTA_SYNC_TOMBSTONE_DAYS if days is None else days
+    deleted, _ = DeletedRow.objects.filter(deleted_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
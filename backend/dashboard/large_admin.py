@@ -0,0 +1,135 @@
+"""
+ModelAdmin base for tables with millions of rows (payments, properties,
+tenants).
+
+The stock changelist runs an exact COUNT(*) twice per page (filtered and
+full), computes facet counts and pages with OFFSET, all of which scale with
+the table. LargeTableAdmin instead:
+
+- counts through EstimatedCountPaginator: the planner's row estimate for an
+  unfiltered PostgreSQL table, otherwise a COUNT capped at
+  ADMIN_COUNT_LIMIT rows;
+- skips the full result count and filter facets;
+- orders by descending primary key and links to the next page with
+  ?before=<last pk>, a keyset cursor that stays an index range scan however
+  deep staff browse (shown while the default ordering is in use);
+- with sharding enabled, shows one shard at a time: ?shard=<alias> picks it
+  and the choice is kept in the session, so change, delete and history
+  pages of a row open on the shard it was listed from.
+
+Subclasses should still set list_select_related, raw_id_fields and
+search_fields/list_filter on indexed columns.
+"""
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from . import sharding
+
+CURSOR_VAR = 'before'
+SHARD_VAR = 'shard'
+SHARD_SESSION_KEY = 'admin_shard'
+
+
+def estimated_rows(model, using):
+    """The planner's row estimate for the model's table, where the backend keeps one"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)', [model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 until the table is first analyzed
+    return int(row[0]) if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_COUNT_LIMIT
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        # COUNT over a LIMITed subquery: stops after `limit` rows
+        return queryset.order_by()[:limit].count()
+
+
+class KeysetChangeList(ChangeList):
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        cursor = getattr(request, 'keyset_cursor', None)
+        if cursor is not None and ORDER_VAR not in self.params:
+            queryset = queryset.filter(pk__lt=cursor)
+        return queryset
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_cursor_url = None
+        if ORDER_VAR in self.params or self.show_all:
+            return
+        results = list(self.result_list)
+        if len(results) == self.list_per_page:
+            self.next_cursor_url = self.get_query_string({CURSOR_VAR: results[-1].pk}, [PAGE_VAR])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    ordering = ('-pk',)
+    list_per_page = 100
+    change_list_template = 'admin/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def _pop_param(self, request, name):
+        # Taken out of GET so the changelist does not treat it as a field lookup
+        if name not in request.GET:
+            return None
+        request.GET = request.GET.copy()
+        return request.GET.pop(name)[-1]
+
+    def _shard(self, request):
+        """using_shard() for the shard this admin session browses (a no-op when not sharded)"""
+        if not sharding.enabled():
+            return nullcontext()
+        shards = sharding.shards()
+        chosen = self._pop_param(request, SHARD_VAR)
+        if chosen in shards:
+            request.session[SHARD_SESSION_KEY] = chosen
+        alias = request.session.get(SHARD_SESSION_KEY)
+        if alias not in shards:
+            alias = shards[0]
+        return sharding.using_shard(alias)
+
+    def changelist_view(self, request, extra_context=None):
+        with self._shard(request) as alias:
+            cursor = self._pop_param(request, CURSOR_VAR)
+            try:
+                request.keyset_cursor = int(cursor) if cursor is not None else None
+            except ValueError:
+                request.keyset_cursor = None
+            extra_context = {**(extra_context or {}), 'shards': sharding.shards(), 'current_shard': alias}
+            return super().changelist_view(request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        with self._shard(request):
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        with self._shard(request):
+            return super().delete_view(request, object_id, extra_context)
+
+    def history_view(self, request, object_id, extra_context=None):
+        with self._shard(request):
+            return super().history_view(request, object_id, extra_context)
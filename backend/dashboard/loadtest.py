@@ -0,0 +1,220 @@
+"""
+In-process load-test scenarios for the main user journeys.
+
+Requests go through the full Django stack (middleware, JWT auth, views,
+serializers, database) via the test client, with Stripe replaced by a stub
+that answers after a configurable delay. Requests carry a Host header that
+ALLOWED_HOSTS accepts (see default_host) instead of the test client's
+'testserver', which only the test runner allows.
+
+Throttled responses (429) are counted apart from errors: they show the rate
+limits working, not the endpoint failing. Raise --sample-size to spread the
+journeys over more users when the per-user limits dominate a run.
+"""
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest import mock
+
+import stripe
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from payments.models import Payment
+from payments.stripe_client import StripeGateway
+from .models import Property, Tenant
+
+User = get_user_model()
+
+
+def default_host():
+    """The first concrete ALLOWED_HOSTS entry, else localhost (allowed when DEBUG is on and the list is empty)"""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@contextmanager
+def stub_stripe(latency=0.0):
+    """Replace the Stripe gateway's network calls with an in-memory fake"""
+    intents = {}
+    lock = threading.Lock()
+
+    def construct(intent_id, amount, status):
+        return stripe.PaymentIntent.construct_from({
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': amount,
+            'currency': 'kes',
+            'status': status,
+            'client_secret': f'{intent_id}_secret',
+            'payment_method': 'pm_card_visa',
+            'charges': {'data': [{'id': f'ch_{intent_id}', 'receipt_url': None}] if status == 'succeeded' else []},
+            'metadata': {},
+            'created': int(time.time()),
+        }, 'sk_test_stub')
+
+    def create(params, idempotency_key=None):
+        time.sleep(latency)
+        with lock:
+            intent_id = f'pi_load_{len(intents) + 1}_{random.getrandbits(32):08x}'
+            intents[intent_id] = params['amount']
+        return construct(intent_id, params['amount'], 'requires_payment_method')
+
+    def retrieve(intent_id):
+        time.sleep(latency)
+        return construct(intent_id, intents.get(intent_id, 0), 'succeeded')
+
+    with mock.patch.object(StripeGateway, 'create_payment_intent', side_effect=create), \
+            mock.patch.object(StripeGateway, 'retrieve_payment_intent', side_effect=retrieve):
+        yield
+
+
+class Session:
+    """An authenticated client that records the latency of every request"""
+
+    def __init__(self, user, recorder, host='localhost'):
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}', HTTP_HOST=host)
+        self.recorder = recorder
+
+    def request(self, method, url_name, path=None, **kwargs):
+        path = path or reverse(url_name)
+        if method == 'post':
+            kwargs.setdefault('content_type', 'application/json')
+        started = time.perf_counter()
+        try:
+            response = getattr(self.client, method)(path, **kwargs)
+            outcome = 'ok' if response.status_code < 400 else 'throttled' if response.status_code == 429 else 'error'
+        except Exception:
+            response, outcome = None, 'error'
+        self.recorder.record(url_name, (time.perf_counter() - started) * 1000, outcome)
+        return response
+
+
+def tenant_dashboard(session, tenant):
+    session.request('get', 'tenant-data')
+    session.request('get', 'tenant_payment_summary')
+    session.request('get', 'payment_list', path=f"{reverse('payment_list')}?tenant_id={tenant.id}")
+
+
+def landlord_dashboard(session, landlord):
+    session.request('get', 'landlord-data')
+    session.request('get', 'property-count')
+    session.request('get', 'property-list')
+
+
+def payment_creation(session, tenant):
+    response = session.request('post', 'create_payment_intent', data={
+        'amount': str(tenant.property.monthly_rent),
+        'property_id': tenant.property_id,
+    })
+    if response is not None and response.status_code == 200:
+        payment = Payment.objects.only('stripe_payment_intent_id').get(id=response.json()['payment_id'])
+        session.request('post', 'confirm_payment', data={'payment_intent_id': payment.stripe_payment_intent_id})
+
+
+# Scenario name -> (journey, actor kind)
+SCENARIOS = {
+    'tenant_dashboard': (tenant_dashboard, 'tenant'),
+    'landlord_dashboard': (landlord_dashboard, 'landlord'),
+    'payment_creation': (payment_creation, 'tenant'),
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.throttled = defaultdict(int)
+
+    def record(self, endpoint, elapsed_ms, outcome):
+        with self.lock:
+            self.samples[endpoint].append(elapsed_ms)
+            if outcome == 'error':
+                self.errors[endpoint] += 1
+            elif outcome == 'throttled':
+                self.throttled[endpoint] += 1
+
+    def report(self):
+        rows = []
+        for endpoint in sorted(self.samples):
+            values = sorted(self.samples[endpoint])
+            rows.append({
+                'endpoint': endpoint,
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'throttled': self.throttled[endpoint],
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': values[-1],
+            })
+        return rows
+
+
+def load_actors(sample_size):
+    tenants = list(
+        Tenant.objects.filter(property__isnull=False)
+        .select_related('user', 'property').order_by('?')[:sample_size]
+    )
+    landlords = list(
+        User.objects.filter(landlord=True, id__in=Property.objects.values('landlord_id'))
+        .order_by('?')[:sample_size]
+    )
+    return {'tenant': tenants, 'landlord': landlords}
+
+
+def run_load_test(scenarios, iterations, concurrency=1, stripe_latency=0.0, sample_size=100, host=None):
+    """
+    Run each scenario `iterations` times spread across `concurrency` worker
+    threads and return per-endpoint latency percentiles in milliseconds.
+    """
+    host = host or default_host()
+    actors = load_actors(sample_size)
+    recorder = Recorder()
+    jobs = []
+    for name in scenarios:
+        journey, kind = SCENARIOS[name]
+        if not actors[kind]:
+            raise ValueError(f'No {kind}s available for scenario {name!r}; run seed_scale first')
+        jobs.extend((journey, actors[kind][i % len(actors[kind])]) for i in range(iterations))
+    random.shuffle(jobs)
+
+    def run(job):
+        journey, actor = job
+        user = actor.user if isinstance(actor, Tenant) else actor
+        journey(Session(user, recorder, host), actor)
+
+    def run_in_worker(job):
+        try:
+            run(job)
+        finally:
+            connection.close()
+
+    with stub_stripe(stripe_latency):
+        if concurrency <= 1:
+            for job in jobs:
+                run(job)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(run_in_worker, jobs))
+
+    return recorder.report()
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.loadtest import SCENARIOS, run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the tenant dashboard, landlord dashboard and payment creation journeys '
+        'in-process against the configured database and report p50/p95/p99 per endpoint. '
+        'Stripe is stubbed; payment creation writes pending payments.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), dest='scenarios',
+                            help='Scenario to run (repeatable, default: all)')
+        parser.add_argument('--iterations', type=int, default=50, help='Journeys per scenario')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--stripe-latency', type=float, default=0.0, help='Simulated Stripe latency in ms')
+        parser.add_argument('--sample-size', type=int, default=100, help='Distinct users to draw from per role')
+        parser.add_argument('--host', help='Host header to send (must pass ALLOWED_HOSTS; default: the first allowed host)')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or sorted(SCENARIOS)
+        started = time.perf_counter()
+        try:
+            rows = run_load_test(
+                scenarios,
+                iterations=options['iterations'],
+                concurrency=options['concurrency'],
+                stripe_latency=options['stripe_latency'] / 1000,
+                sample_size=options['sample_size'],
+                host=options['host'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{'endpoint':<28}{'requests':>10}{'errors':>8}{'429s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:<28}{row['requests']:>10}{row['errors']:>8}{row['throttled']:>8}"
+                f"{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}{row['max']:>10.1f}"
+            )
+        total = sum(row['requests'] for row in rows)
+        throttled = sum(row['throttled'] for row in rows)
+        if throttled:
+            self.stdout.write(self.style.WARNING(
+                f'{throttled} requests were rate limited; raise --sample-size to spread the load over more users'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)'))
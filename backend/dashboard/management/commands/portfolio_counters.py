@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.portfolio import verify_portfolios
+
+
+class Command(BaseCommand):
+    help = 'Check the denormalized landlord portfolio counters against the property and tenant tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Rewrite rows that are wrong or missing')
+
+    def handle(self, *args, **options):
+        mismatches = verify_portfolios(repair=options['repair'])
+        for landlord_id, field, stored, actual in mismatches:
+            self.stdout.write(f'landlord {landlord_id}: {field} is {stored}, expected {actual}')
+
+        landlords = len({landlord_id for landlord_id, *_ in mismatches})
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('All portfolio counters are correct'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired counters for {landlords} landlords'))
+        else:
+            raise CommandError(f'Counters are wrong for {landlords} landlords; rerun with --repair')
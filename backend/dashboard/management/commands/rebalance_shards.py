@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from dashboard import sharding
+from dashboard.models import LandlordShard, Property
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = "Show how landlords are spread over SHARD_DATABASES, or move a landlord to another shard"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--landlord', type=int, help='Id of the landlord to move')
+        parser.add_argument('--to', help='Shard alias to move the landlord to')
+        parser.add_argument('--sync-users', action='store_true',
+                            help='Copy every user to every shard first (needed once when enabling sharding)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows copied per insert (default: SHARD_MOVE_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding is not enabled: SHARD_DATABASES is empty')
+
+        if options['sync_users']:
+            copied = sharding.sync_users()
+            self.stdout.write(self.style.SUCCESS(f'Copied {copied} users to {len(sharding.shards())} shards'))
+
+        if options['landlord'] is not None:
+            if not options['to']:
+                raise CommandError('--to is required with --landlord')
+            try:
+                moved = sharding.move_landlord(options['landlord'], options['to'], batch_size=options['batch_size'])
+            except sharding.ShardMoveError as e:
+                raise CommandError(str(e))
+            if not moved:
+                self.stdout.write(f"Landlord {options['landlord']} is already on {options['to']}")
+                return
+            summary = ', '.join(f'{count} {label}' for label, count in moved.items())
+            self.stdout.write(self.style.SUCCESS(f"Moved landlord {options['landlord']} to {options['to']}: {summary}"))
+            return
+
+        pinned = dict(LandlordShard.objects.values_list('alias').annotate(n=Count('pk')).order_by())
+        for alias in sharding.shards():
+            self.stdout.write(
+                f'{alias}: {pinned.get(alias, 0)} landlords, '
+                f'{Property.objects.using(alias).count()} properties, '
+                f'{Payment.objects.using(alias).count()} payments'
+            )
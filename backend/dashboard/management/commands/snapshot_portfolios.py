@@ -0,0 +1,25 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.analytics import take_portfolio_snapshots
+
+
+class Command(BaseCommand):
+    help = "Write the day's occupancy, vacancy, rent and collection snapshot for every landlord (run nightly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Snapshot date as YYYY-MM-DD (default: today)')
+
+    def handle(self, *args, **options):
+        try:
+            as_of = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError('--date must look like YYYY-MM-DD')
+
+        started = time.perf_counter()
+        written = take_portfolio_snapshots(as_of)
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {written} portfolio snapshots in {time.perf_counter() - started:.2f}s'
+        ))
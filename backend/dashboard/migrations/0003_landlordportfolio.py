@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_portfolios(apps, schema_editor):
+    Property = apps.get_model('dashboard', 'Property')
+    Tenant = apps.get_model('dashboard', 'Tenant')
+    LandlordPortfolio = apps.get_model('dashboard', 'LandlordPortfolio')
+
+    tenant_counts = dict(
+        Tenant.objects.filter(property__isnull=False)
+        .values_list('property__landlord_id').annotate(n=Count('id')).order_by()
+    )
+    rows = Property.objects.values('landlord_id').annotate(
+        property_count=Count('id'),
+        vacant_count=Count('id', filter=Q(is_vacant=True)),
+        total_monthly_rent=Sum('monthly_rent'),
+    ).order_by()
+    LandlordPortfolio.objects.bulk_create([
+        LandlordPortfolio(
+            landlord_id=row['landlord_id'],
+            property_count=row['property_count'],
+            vacant_count=row['vacant_count'],
+            occupied_count=row['property_count'] - row['vacant_count'],
+            tenant_count=tenant_counts.get(row['landlord_id'], 0),
+            total_monthly_rent=row['total_monthly_rent'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_rename_is_landlord_user_landlord_and_more'),
+        ('dashboard', '0002_delete_payment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LandlordPortfolio',
+            fields=[
+                ('landlord', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='portfolio', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('property_count', models.PositiveIntegerField(default=0)),
+                ('vacant_count', models.PositiveIntegerField(default=0)),
+                ('occupied_count', models.PositiveIntegerField(default=0)),
+                ('tenant_count', models.PositiveIntegerField(default=0)),
+                ('total_monthly_rent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_portfolios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_landlordportfolio'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('property_count', models.PositiveIntegerField()),
+                ('occupied_count', models.PositiveIntegerField()),
+                ('occupancy_rate', models.DecimalField(decimal_places=4, max_digits=5, null=True)),
+                ('average_rent', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('avg_vacancy_days', models.FloatField(help_text='Mean days vacant units have been empty since their last lease ended', null=True)),
+                ('rent_charged', models.DecimalField(decimal_places=2, help_text='Billed for the month so far', max_digits=14)),
+                ('rent_collected', models.DecimalField(decimal_places=2, help_text='Completed payments in the month so far', max_digits=14)),
+                ('collection_rate', models.DecimalField(decimal_places=4, max_digits=7, null=True)),
+                ('landlord', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='portfolio_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['landlord', 'date'],
+                'constraints': [models.UniqueConstraint(fields=('landlord', 'date'), name='portfoliosnapshot_landlord_date_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_rename_is_landlord_user_landlord_and_more'),
+        ('dashboard', '0004_portfoliosnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LandlordShard',
+            fields=[
+                ('landlord', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('alias', models.CharField(db_index=True, max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
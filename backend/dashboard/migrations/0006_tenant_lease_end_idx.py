@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_landlordshard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['lease_end'], name='tenant_lease_end_idx'),
+        ),
+    ]
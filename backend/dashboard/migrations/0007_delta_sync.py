@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_tenant_lease_end_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='app_label.model of the deleted row', max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('landlord_id', models.BigIntegerField(null=True)),
+                ('tenant_id', models.BigIntegerField(null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['landlord', 'updated_at'], name='property_landlord_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['property', 'updated_at'], name='tenant_property_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedrow',
+            index=models.Index(fields=['model', 'landlord_id', 'deleted_at'], name='deletedrow_landlord_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedrow',
+            index=models.Index(fields=['model', 'tenant_id', 'deleted_at'], name='deletedrow_tenant_idx'),
+        ),
+    ]
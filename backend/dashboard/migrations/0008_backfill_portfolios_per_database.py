@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+
+def backfill_portfolios(apps, schema_editor):
+    """
+    Portfolio counters for landlords whose rows live on the database being
+    migrated. 0003 only backfilled through the router; this one reads and
+    writes the migrated database directly and skips landlords that already
+    have counters, so it is a no-op where 0003 did the work.
+    """
+    Property = apps.get_model('dashboard', 'Property')
+    Tenant = apps.get_model('dashboard', 'Tenant')
+    LandlordPortfolio = apps.get_model('dashboard', 'LandlordPortfolio')
+    db_alias = schema_editor.connection.alias
+
+    existing = set(LandlordPortfolio.objects.using(db_alias).values_list('landlord_id', flat=True))
+    tenant_counts = dict(
+        Tenant.objects.using(db_alias).filter(property__isnull=False)
+        .values_list('property__landlord_id').annotate(n=Count('id')).order_by()
+    )
+    rows = Property.objects.using(db_alias).values('landlord_id').annotate(
+        property_count=Count('id'),
+        vacant_count=Count('id', filter=Q(is_vacant=True)),
+        total_monthly_rent=Sum('monthly_rent'),
+    ).order_by()
+    LandlordPortfolio.objects.using(db_alias).bulk_create([
+        LandlordPortfolio(
+            landlord_id=row['landlord_id'],
+            property_count=row['property_count'],
+            vacant_count=row['vacant_count'],
+            occupied_count=row['property_count'] - row['vacant_count'],
+            tenant_count=tenant_counts.get(row['landlord_id'], 0),
+            total_monthly_rent=row['total_monthly_rent'] or 0,
+        )
+        for row in rows
+        if row['landlord_id'] not in existing
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_delta_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_portfolios, migrations.RunPython.noop, hints={'shard_aware': True}),
+    ]
@@ -8,6 +8,30 @@ class Property(models.Model):
     address = models.CharField(max_length=255)
     monthly_rent = models.DecimalField(max_digits=10, decimal_places=2)
     is_vacant = models.BooleanField(default=False)
+    # Delta-sync watermark; also bumped when the unit's tenants change (see dashboard.delta)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # ?since= reads: WHERE landlord_id = ? AND updated_at > ?
+            models.Index(fields=['landlord', 'updated_at'], name='property_landlord_updated_idx'),
+        ]
+    
+    # Fields the landlord's portfolio counters depend on
+    COUNTED_FIELDS = ('landlord_id', 'is_vacant', 'monthly_rent')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the post_save handler can adjust the counters by the difference
+        instance._loaded_counted = instance.counted_values()
+        return instance
+    
+    def counted_values(self):
+        """COUNTED_FIELDS as loaded on this instance, or None if any of them is deferred"""
+        if any(name not in self.__dict__ for name in self.COUNTED_FIELDS):
+            return None
+        return tuple(self.__dict__[name] for name in self.COUNTED_FIELDS)
     
     def __str__(self):
         return self.address
@@ -17,7 +41,90 @@ class Tenant(models.Model):
     property = models.ForeignKey(Property, on_delete=models.SET_NULL, null=True, related_name='tenants')
     lease_start = models.DateField()
     lease_end = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Range scans for leases ending soon (rent reminders)
+            models.Index(fields=['lease_end'], name='tenant_lease_end_idx'),
+            models.Index(fields=['property', 'updated_at'], name='tenant_property_updated_idx'),
+        ]
     
     def __str__(self):
         return self.user.get_full_name()
 
+
+class LandlordPortfolio(models.Model):
+    """
+    Denormalized per-landlord counters, kept in step with properties and
+    tenant assignments by dashboard.portfolio. Verify or rebuild them with
+    the portfolio_counters command.
+    """
+    landlord = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='portfolio')
+    property_count = models.PositiveIntegerField(default=0)
+    vacant_count = models.PositiveIntegerField(default=0)
+    occupied_count = models.PositiveIntegerField(default=0)
+    tenant_count = models.PositiveIntegerField(default=0)
+    total_monthly_rent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Portfolio of {self.landlord_id}: {self.property_count} properties"
+
+class PortfolioSnapshot(models.Model):
+    """One row per landlord per day, written by the snapshot_portfolios job"""
+    landlord = models.ForeignKey(User, on_delete=models.CASCADE, related_name='portfolio_snapshots')
+    date = models.DateField()
+    property_count = models.PositiveIntegerField()
+    occupied_count = models.PositiveIntegerField()
+    occupancy_rate = models.DecimalField(max_digits=5, decimal_places=4, null=True)
+    average_rent = models.DecimalField(max_digits=10, decimal_places=2)
+    avg_vacancy_days = models.FloatField(null=True, help_text='Mean days vacant units have been empty since their last lease ended')
+    rent_charged = models.DecimalField(max_digits=14, decimal_places=2, help_text='Billed for the month so far')
+    rent_collected = models.DecimalField(max_digits=14, decimal_places=2, help_text='Completed payments in the month so far')
+    collection_rate = models.DecimalField(max_digits=7, decimal_places=4, null=True)
+    
+    class Meta:
+        ordering = ['landlord', 'date']
+        constraints = [
+            # Also the index trend reads use: (landlord, date range)
+            models.UniqueConstraint(fields=['landlord', 'date'], name='portfoliosnapshot_landlord_date_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.landlord_id} on {self.date}"
+
+class LandlordShard(models.Model):
+    """
+    Which SHARD_DATABASES alias holds a landlord's partitioned rows (see
+    dashboard.sharding). Lives on 'default'; a landlord is pinned here the
+    first time they are routed and moved with the rebalance_shards command.
+    """
+    landlord = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=64, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.landlord_id} on {self.alias}"
+
+
+class DeletedRow(models.Model):
+    """
+    Tombstone of a deleted (or archived) row, so ?since= list reads can tell
+    clients what to drop. Lives on 'default' whatever shard the row was on,
+    and is purged after DELTA_SYNC_TOMBSTONE_DAYS.
+    """
+    model = models.CharField(max_length=100, help_text='app_label.model of the deleted row')
+    object_id = models.BigIntegerField()
+    landlord_id = models.BigIntegerField(null=True)
+    tenant_id = models.BigIntegerField(null=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'landlord_id', 'deleted_at'], name='deletedrow_landlord_idx'),
+            models.Index(fields=['model', 'tenant_id', 'deleted_at'], name='deletedrow_tenant_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted {self.deleted_at}"
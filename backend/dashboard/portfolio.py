@@ -0,0 +1,176 @@
+"""
+Maintenance of the LandlordPortfolio counters.
+
+Every change is a single UPDATE ... SET col = col + delta on the landlord's
+row, issued inside the transaction that changes the underlying rows, so
+counters never drift under concurrency. Creating and deleting properties
+is handled by signals (see dashboard.signals); code that bulk inserts
+properties or assigns tenants calls the functions here.
+
+A landlord without a row yet (e.g. created by bulk_create) is simply
+skipped by the delta updates; the row is computed from scratch the first
+time it is read.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import IntegrityError
+from django.db.models import Count, F, Q, Sum
+
+from . import sharding
+from .models import LandlordPortfolio, Property, Tenant
+
+COUNTER_FIELDS = ('property_count', 'vacant_count', 'occupied_count', 'tenant_count', 'total_monthly_rent')
+
+
+def _adjust(rows, **deltas):
+    deltas = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if deltas:
+        rows.update(**deltas)
+
+
+def _property_deltas(properties, sign=1):
+    vacant = sum(1 for prop in properties if prop.is_vacant)
+    return {
+        'property_count': sign * len(properties),
+        'vacant_count': sign * vacant,
+        'occupied_count': sign * (len(properties) - vacant),
+        'total_monthly_rent': sign * sum((Decimal(prop.monthly_rent) for prop in properties), Decimal(0)),
+    }
+
+
+def properties_added(landlord_id, properties):
+    """Record new properties (saved individually or with bulk_create)"""
+    _adjust(LandlordPortfolio.objects.filter(landlord_id=landlord_id), **_property_deltas(properties))
+
+
+def property_changed(landlord_id, before, after):
+    """
+    Record an edited property of the same landlord: `before` and `after`
+    are (is_vacant, monthly_rent) pairs
+    """
+    was_vacant, old_rent = before
+    is_vacant, rent = after
+    _adjust(
+        LandlordPortfolio.objects.filter(landlord_id=landlord_id),
+        vacant_count=int(is_vacant) - int(was_vacant),
+        occupied_count=int(was_vacant) - int(is_vacant),
+        total_monthly_rent=Decimal(rent) - Decimal(old_rent),
+    )
+
+
+def property_removed(prop, tenant_count):
+    """Record a deleted property and the tenants it had (their property becomes NULL)"""
+    _adjust(
+        LandlordPortfolio.objects.filter(landlord_id=prop.landlord_id),
+        tenant_count=-tenant_count,
+        **_property_deltas([prop], sign=-1),
+    )
+
+
+def tenants_assigned(landlord_ids, previous_landlord_ids=()):
+    """
+    Record tenants moving into units (just flipped from vacant to occupied)
+    owned by `landlord_ids`, and out of units owned by `previous_landlord_ids`.
+    Pass one entry per tenant; None entries are ignored. One UPDATE is
+    issued per affected landlord.
+    """
+    claimed = Counter(landlord_id for landlord_id in landlord_ids if landlord_id is not None)
+    moved_out = Counter(landlord_id for landlord_id in previous_landlord_ids if landlord_id is not None)
+    for landlord_id in claimed.keys() | moved_out.keys():
+        _adjust(
+            LandlordPortfolio.objects.filter(landlord_id=landlord_id),
+            vacant_count=-claimed[landlord_id],
+            occupied_count=claimed[landlord_id],
+            tenant_count=claimed[landlord_id] - moved_out[landlord_id],
+        )
+
+
+def tenant_unassigned(property_id):
+    """Record a tenant leaving `property_id` without the unit being freed (e.g. the profile is deleted)"""
+    _adjust(LandlordPortfolio.objects.filter(landlord__properties=property_id), tenant_count=-1)
+
+
+def compute_counters(landlord_ids=None):
+    """{landlord id: {counter: value}} from the source tables, grouped queries only"""
+    properties = Property.objects.all()
+    tenants = Tenant.objects.filter(property__isnull=False)
+    if landlord_ids is not None:
+        properties = properties.filter(landlord_id__in=landlord_ids)
+        tenants = tenants.filter(property__landlord_id__in=landlord_ids)
+
+    counters = {}
+    rows = properties.values('landlord_id').annotate(
+        property_count=Count('id'),
+        vacant_count=Count('id', filter=Q(is_vacant=True)),
+        total_monthly_rent=Sum('monthly_rent'),
+    ).order_by()
+    for row in rows:
+        counters[row['landlord_id']] = {
+            'property_count': row['property_count'],
+            'vacant_count': row['vacant_count'],
+            'occupied_count': row['property_count'] - row['vacant_count'],
+            'tenant_count': 0,
+            'total_monthly_rent': row['total_monthly_rent'] or Decimal(0),
+        }
+    for landlord_id, tenant_count in tenants.values_list('property__landlord_id').annotate(n=Count('id')).order_by():
+        counters[landlord_id]['tenant_count'] = tenant_count
+    return counters
+
+
+def _empty_counters():
+    return {field: 0 for field in COUNTER_FIELDS}
+
+
+def refresh_portfolios(landlord_ids):
+    """Recompute and store the counters of the given landlords"""
+    counters = compute_counters(landlord_ids)
+    with sharding.atomic():
+        for landlord_id in landlord_ids:
+            LandlordPortfolio.objects.update_or_create(
+                landlord_id=landlord_id, defaults=counters.get(landlord_id) or _empty_counters()
+            )
+
+
+def get_portfolio(landlord):
+    """The landlord's counters: a primary-key lookup, computed on first use"""
+    try:
+        return LandlordPortfolio.objects.get(landlord=landlord)
+    except LandlordPortfolio.DoesNotExist:
+        counters = compute_counters([landlord.pk]).get(landlord.pk) or _empty_counters()
+        try:
+            with sharding.atomic():
+                return LandlordPortfolio.objects.create(landlord=landlord, **counters)
+        except IntegrityError:
+            # Another request created it first
+            return LandlordPortfolio.objects.get(landlord=landlord)
+
+
+def verify_portfolios(repair=False):
+    """
+    Compare every stored row with freshly computed counters, on every shard.
+    Returns a list of (landlord id, field, stored, actual) mismatches; with
+    `repair` the rows are corrected (missing rows are created).
+    """
+    mismatches = []
+    for alias in sharding.each_database():
+        with sharding.using_shard(alias):
+            found = _verify_database()
+            if repair and found:
+                refresh_portfolios(sorted({landlord_id for landlord_id, *_ in found}))
+        mismatches += found
+    return mismatches
+
+
+def _verify_database():
+    actual = compute_counters()
+    stored = {row.landlord_id: row for row in LandlordPortfolio.objects.all()}
+    mismatches = []
+    for landlord_id in actual.keys() | stored.keys():
+        expected = actual.get(landlord_id) or _empty_counters()
+        row = stored.get(landlord_id)
+        for field in COUNTER_FIELDS:
+            value = getattr(row, field) if row else None
+            if value != expected[field]:
+                mismatches.append((landlord_id, field, value, expected[field]))
+    return mismatches
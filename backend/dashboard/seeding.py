@@ -0,0 +1,175 @@
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from payments.models import Payment
+from .models import Property, Tenant
+from .portfolio import refresh_portfolios
+
+User = get_user_model()
+
+# Share of monthly payments that end up in each state
+PAYMENT_STATUS_WEIGHTS = {
+    'completed': 90,
+    'failed': 4,
+    'pending': 3,
+    'canceled': 2,
+    'processing': 1,
+}
+RENT_CHOICES = [Decimal(rent) for rent in ('8000.00', '12000.00', '15000.00', '22000.00', '35000.00', '50000.00')]
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """
+    Temporarily turn off auto_now/auto_now_add on a model so bulk inserts
+    can write historical dates. Callers must set every timestamp themselves.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _month_starts(months, today):
+    """First day of each of the last `months` months, oldest first"""
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(months):
+        starts.append(today.replace(year=year, month=month, day=1))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(starts))
+
+
+def _batched_create(model, objects, batch_size):
+    created = []
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            created.extend(model.objects.bulk_create(batch))
+            batch = []
+    if batch:
+        created.extend(model.objects.bulk_create(batch))
+    return created
+
+
+def seed_scale(landlords, properties_per_landlord, years=2, vacancy_rate=0.1,
+               password='password', batch_size=2000, seed=None, log=None):
+    """
+    Populate the schema with synthetic landlords, properties, tenants and
+    monthly payment history using bulk inserts.
+
+    Tenant profiles are bulk created directly, the batched equivalent of the
+    create_tenant_profile signal (bulk_create does not send post_save).
+    Returns a dict of row counts per model.
+    """
+    rng = random.Random(seed)
+    run = uuid.uuid4().hex[:8] if seed is None else f'{seed}'
+    log = log or (lambda message: None)
+    password_hash = make_password(password)
+    now = timezone.now()
+    today = now.date()
+    months = _month_starts(max(1, years * 12), today)
+    statuses = list(PAYMENT_STATUS_WEIGHTS)
+    weights = list(PAYMENT_STATUS_WEIGHTS.values())
+
+    with transaction.atomic():
+        landlord_users = _batched_create(User, (
+            User(email=f'seed-{run}-landlord-{i}@example.com', password=password_hash, landlord=True)
+            for i in range(landlords)
+        ), batch_size)
+        log(f'Created {len(landlord_users)} landlords')
+
+        properties = _batched_create(Property, (
+            Property(
+                landlord=landlord,
+                address=f'{i + 1} Seed Street, Block {landlord.id}',
+                monthly_rent=rng.choice(RENT_CHOICES),
+                is_vacant=rng.random() < vacancy_rate,
+            )
+            for landlord in landlord_users
+            for i in range(properties_per_landlord)
+        ), batch_size)
+        occupied = [prop for prop in properties if not prop.is_vacant]
+        log(f'Created {len(properties)} properties ({len(occupied)} occupied)')
+
+        tenant_users = _batched_create(User, (
+            User(email=f'seed-{run}-tenant-{prop.id}@example.com', password=password_hash, tenant=True)
+            for prop in occupied
+        ), batch_size)
+        tenants = _batched_create(Tenant, (
+            Tenant(
+                user=user,
+                property=prop,
+                lease_start=months[rng.randrange(len(months))],
+                lease_end=today + timedelta(days=rng.randint(30, 365)),
+            )
+            for user, prop in zip(tenant_users, occupied)
+        ), batch_size)
+        log(f'Created {len(tenants)} tenants')
+
+        def payments():
+            for tenant in tenants:
+                rent = tenant.property.monthly_rent
+                for month_start in months:
+                    if month_start < tenant.lease_start.replace(day=1):
+                        continue
+                    status = rng.choices(statuses, weights)[0]
+                    paid_on = timezone.make_aware(
+                        datetime.combine(month_start + timedelta(days=rng.randint(0, 9)), time(rng.randint(6, 21)))
+                    )
+                    if paid_on > now:
+                        paid_on = now
+                    yield Payment(
+                        tenant=tenant,
+                        property_t=tenant.property,
+                        amount=rent if rng.random() < 0.9 else (rent / 2).quantize(Decimal('0.01')),
+                        status=status,
+                        date=paid_on,
+                        created_at=paid_on,
+                        updated_at=paid_on,
+                        stripe_payment_intent_id=f'pi_seed_{uuid.UUID(int=rng.getrandbits(128)).hex[:24]}',
+                        description=f'Rent for {month_start:%B %Y}',
+                    )
+
+        with explicit_timestamps(Payment):
+            payment_count = 0
+            batch = []
+            for payment in payments():
+                batch.append(payment)
+                if len(batch) >= batch_size:
+                    Payment.objects.bulk_create(batch)
+                    payment_count += len(batch)
+                    batch = []
+            if batch:
+                Payment.objects.bulk_create(batch)
+                payment_count += len(batch)
+        log(f'Created {payment_count} payments')
+
+        # bulk_create skips the signals that maintain the portfolio counters
+        refresh_portfolios([landlord.id for landlord in landlord_users])
+
+    return {
+        'landlords': len(landlord_users),
+        'properties': len(properties),
+        'tenants': len(tenants),
+        'payments': payment_count,
+    }
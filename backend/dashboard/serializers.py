@@ -1,7 +1,10 @@
 from rest_framework import serializers
 from .models import Property, Tenant
-from payments.models import Payment
+from .portfolio import get_portfolio
+from payments.models import Payment, PaymentArchive
+from payments.archive import UnifiedPayments
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Q, Sum
 from datetime import datetime
 
 User = get_user_model()
@@ -19,6 +22,18 @@ class PropertyCreateSerializer(serializers.ModelSerializer):
         validated_data['landlord'] = self.context['request'].user
         return super().create(validated_data)
 
+class TenantAssignmentRowSerializer(serializers.Serializer):
+    """One row of a landlord's bulk tenant assignment"""
+    email = serializers.EmailField()
+    property_id = serializers.IntegerField()
+    lease_start = serializers.DateField(required=False)
+    lease_end = serializers.DateField(required=False)
+    
+    def validate(self, attrs):
+        if attrs.get('lease_start') and attrs.get('lease_end') and attrs['lease_end'] <= attrs['lease_start']:
+            raise serializers.ValidationError({"lease_end": ["Lease must end after it starts"]})
+        return attrs
+
 class PropertySerializer(serializers.ModelSerializer):
     """Basic property serializer for listing"""
     
@@ -40,8 +55,8 @@ class PropertyListSerializer(serializers.ModelSerializer):
         ]
 
 class PaymentSerializer(serializers.ModelSerializer):
-    formatted_amount = serializers.CharField(source='formatted_amount', read_only=True)
-    is_successful = serializers.BooleanField(source='is_successful', read_only=True)
+    formatted_amount = serializers.CharField(read_only=True)
+    is_successful = serializers.BooleanField(read_only=True)
     
     class Meta:
         model = Payment
@@ -49,8 +64,8 @@ class PaymentSerializer(serializers.ModelSerializer):
 
 class TenantDashboardSerializer(serializers.Serializer):
     tenant_name = serializers.SerializerMethodField()
-    monthly_rent = serializers.DecimalField(max_digits=10, decimal_places=2)
-    paid_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    monthly_rent = serializers.DecimalField(source='property.monthly_rent', max_digits=10, decimal_places=2, read_only=True)
+    paid_amount = serializers.SerializerMethodField()
     property_address = serializers.CharField(source='property.address', read_only=True)
     lease_start = serializers.DateField()
     lease_end = serializers.DateField()
@@ -64,10 +79,17 @@ class TenantDashboardSerializer(serializers.Serializer):
         payments = obj.payments.filter(status='completed').order_by('-date')[:5]
         return PaymentSerializer(payments, many=True).data
     
+    def get_paid_amount(self, obj):
+        # Shared by paid_amount and outstanding_balance; archived history included
+        if not hasattr(obj, '_paid_amount'):
+            obj._paid_amount = UnifiedPayments(tenant=obj, status='completed').aggregate(
+                total=Sum('amount')
+            )['total'] or 0
+        return obj._paid_amount
+    
     def get_outstanding_balance(self, obj):
-        monthly_rent = obj.property.monthly_rent
-        paid_amount = sum(p.amount for p in obj.payments.filter(status='completed'))
-        return max(0, monthly_rent - paid_amount)
+        charged = obj.rent_charges.aggregate(total=Sum('amount'))['total'] or 0
+        return max(0, charged - self.get_paid_amount(obj))
 
 class LandlordDashboardSerializer(serializers.Serializer):
     landlord_name = serializers.SerializerMethodField()
@@ -84,53 +106,49 @@ class LandlordDashboardSerializer(serializers.Serializer):
     def get_properties(self, obj):
         try:
             from django.utils import timezone
-            properties = obj.properties.all()
             
             current_month = timezone.now().month
             current_year = timezone.now().year
             
+            # Aggregate tenant counts and payment totals in the same query as the
+            # property rows instead of issuing per-property/per-tenant queries.
+            completed = Q(tenants__payments__status='completed')
+            properties = obj.properties.annotate(
+                tenant_count=Count('tenants', distinct=True),
+                total_paid_amount=Sum('tenants__payments__amount', filter=completed),
+                paid_amount=Sum(
+                    'tenants__payments__amount',
+                    filter=completed & Q(
+                        tenants__payments__date__month=current_month,
+                        tenants__payments__date__year=current_year
+                    )
+                ),
+            )
+            
+            # Payments past the archive horizon live in PaymentArchive
+            archived_totals = dict(
+                PaymentArchive.objects.filter(tenant__property__landlord=obj, status='completed')
+                .values_list('tenant__property').annotate(total=Sum('amount')).order_by()
+            )
+            
             return [{
                 'id': prop.id,
                 'address': prop.address,
                 'monthly_rent': prop.monthly_rent,
-                'paid_amount': self._get_paid_amount_for_property_current_month(prop, current_month, current_year),
-                'total_paid_amount': self._get_paid_amount_for_property(prop),
-                'tenant_count': prop.tenants.count(),
+                'paid_amount': prop.paid_amount or 0,
+                'total_paid_amount': (prop.total_paid_amount or 0) + archived_totals.get(prop.id, 0),
+                'tenant_count': prop.tenant_count,
                 'vacant': getattr(prop, 'is_vacant', False),
                 'total_annual_rent': prop.monthly_rent * 12
             } for prop in properties]
         except Exception:
             return []
     
-    def _get_paid_amount_for_property(self, property_obj):
-        try:
-            return sum(
-                payment.amount 
-                for tenant in property_obj.tenants.all() 
-                for payment in tenant.payments.filter(status='completed')
-            )
-        except Exception:
-            return 0
-    
-    def _get_paid_amount_for_property_current_month(self, property_obj, month, year):
-        try:
-            return sum(
-                payment.amount 
-                for tenant in property_obj.tenants.all() 
-                for payment in tenant.payments.filter(
-                    status='completed',
-                    date__month=month,
-                    date__year=year
-                )
-            )
-        except Exception:
-            return 0
-    
     def get_recent_payments(self, obj):
         try:
             recent_payments = Payment.objects.filter(
                 tenant__property__landlord=obj
-            ).order_by('-date')[:5]
+            ).select_related('tenant__user', 'tenant__property').order_by('-date')[:5]
             
             return [{
                 'id': payment.id,
@@ -151,21 +169,27 @@ class LandlordDashboardSerializer(serializers.Serializer):
         except Exception:
             return "Unknown"
     
+    def _portfolio(self, obj):
+        # One primary-key lookup shared by the three totals
+        if not hasattr(self, '_portfolio_row'):
+            self._portfolio_row = get_portfolio(obj)
+        return self._portfolio_row
+    
     def get_total_properties(self, obj):
         try:
-            return obj.properties.count()
+            return self._portfolio(obj).property_count
         except Exception:
             return 0
     
     def get_total_tenants(self, obj):
         try:
-            return sum(prop.tenants.count() for prop in obj.properties.all())
+            return self._portfolio(obj).tenant_count
         except Exception:
             return 0
     
     def get_total_monthly_income(self, obj):
         try:
-            return sum(prop.monthly_rent for prop in obj.properties.all())
+            return self._portfolio(obj).total_monthly_rent
         except Exception:
             return 0
     
@@ -0,0 +1,484 @@
+"""
+Landlord-keyed sharding over several databases.
+
+Properties, tenants and everything hanging off them (payments, archived
+payments, rent charges, arrears, reminders and portfolio rows) are partitioned by
+landlord: each landlord lives on one of SHARD_DATABASES, picked by a stable
+hash of the landlord id the first time they are routed and pinned in
+LandlordShard, so adding shards later never silently moves anyone and the
+rebalance_shards command can move a landlord explicitly. Users and every
+other model stay on 'default'; user rows are copied to each shard so joins
+from tenants and properties to their users still work there.
+
+Requests are routed from request.user: ShardRoutingJWTAuthentication
+activates the user's shard and LandlordShardRouter sends queries on
+partitioned models to it (rows keep the shard they were loaded from). A
+tenant is routed to whichever shard holds their profile; new profiles start
+on the first shard and move to a landlord's shard when they are given a unit
+there. Code running outside a request (jobs, the shell) uses the first
+shard unless it wraps its work in using_shard().
+
+Primary keys of the partitioned tables on `shard_<n>` start at
+n * SHARD_ID_SPACING, so an id names one row across all shards.
+
+With SHARD_DATABASES empty (the default) none of this is active and
+everything stays on 'default'.
+"""
+import logging
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models import F, Q
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import delta
+from .models import LandlordPortfolio, LandlordShard, PortfolioSnapshot, Property, Tenant
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+SHARDED_MODELS = frozenset({
+    'dashboard.property', 'dashboard.tenant', 'dashboard.landlordportfolio', 'dashboard.portfoliosnapshot',
+    'payments.payment', 'payments.paymentarchive', 'payments.rentcharge', 'payments.arrearssnapshot',
+    'payments.reminderlog', 'payments.paymentchange',
+})
+SHARD_ID_SPACING = 10 ** 12
+
+_active = ContextVar('active_shard', default=None)
+
+
+def enabled():
+    return bool(settings.SHARD_DATABASES)
+
+
+def shards():
+    return list(settings.SHARD_DATABASES)
+
+
+def each_database():
+    """Every database holding partitioned rows: the shards, or just 'default' when not sharded"""
+    return shards() or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def current_shard():
+    """The active shard, else the first one (None when not sharded)"""
+    if not enabled():
+        return None
+    return _active.get() or settings.SHARD_DATABASES[0]
+
+
+def write_alias():
+    """The database that writes to partitioned models go to right now"""
+    return current_shard() or DEFAULT_DB_ALIAS
+
+
+def atomic():
+    """transaction.atomic() on the database partitioned writes go to right now"""
+    return transaction.atomic(using=write_alias())
+
+
+def activate(alias):
+    _active.set(alias)
+
+
+@contextmanager
+def using_shard(alias):
+    token = _active.set(alias)
+    try:
+        yield alias
+    finally:
+        _active.reset(token)
+
+
+def hash_shard(landlord_id, aliases=None):
+    """Stable across processes and restarts, unlike hash()"""
+    aliases = aliases or shards()
+    return aliases[zlib.crc32(str(landlord_id).encode()) % len(aliases)]
+
+
+def _landlord_key(landlord_id):
+    return f'sharding:landlord:{landlord_id}'
+
+
+def _user_key(user_id):
+    return f'sharding:user:{user_id}'
+
+
+def shard_for_landlord(landlord_id):
+    key = _landlord_key(landlord_id)
+    alias = cache.get(key)
+    if alias is None:
+        alias = LandlordShard.objects.get_or_create(
+            landlord_id=landlord_id, defaults={'alias': hash_shard(landlord_id)}
+        )[0].alias
+        cache.set(key, alias, settings.SHARD_DIRECTORY_CACHE_SECONDS)
+    return alias
+
+
+def locate(model, **filters):
+    """First shard with a `model` row matching `filters`, or None (one query per shard)"""
+    for alias in shards():
+        if model._default_manager.using(alias).filter(**filters).exists():
+            return alias
+    return None
+
+
+def shard_for_user(user):
+    if user.landlord:
+        return shard_for_landlord(user.pk)
+    key = _user_key(user.pk)
+    alias = cache.get(key)
+    if alias is None:
+        alias = locate(Tenant, user_id=user.pk) or settings.SHARD_DATABASES[0]
+        cache.set(key, alias, settings.SHARD_DIRECTORY_CACHE_SECONDS)
+    return alias
+
+
+class LandlordShardRouter:
+    """Partitioned models go to the active shard, or the shard of the row they were loaded with"""
+
+    def _route(self, model, **hints):
+        if not enabled() or not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)) and instance._state.db:
+            return instance._state.db
+        return current_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, **hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Data migrations (RunPython/RunSQL, no model_name) written before
+        # sharding query through this router rather than the database being
+        # migrated, so they only run on shards when marked shard_aware
+        if model_name is None and db != DEFAULT_DB_ALIAS and (db in shards() or shard_number(db)):
+            return bool(hints.get('shard_aware'))
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users are copied to every shard, so relations to them hold anywhere;
+        # two partitioned rows must share a database (the default rule)
+        if enabled() and not (is_sharded(type(obj1)) and is_sharded(type(obj2))):
+            return True
+        return None
+
+
+class ShardRoutingJWTAuthentication(JWTAuthentication):
+    """JWT authentication that also routes the rest of the request to the user's shard"""
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and enabled():
+            activate(shard_for_user(result[0]))
+        return result
+
+
+class ShardContextMiddleware:
+    """Start every request without an active shard, whatever ran on this thread before"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _active.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _active.reset(token)
+
+
+def shard_number(alias):
+    """n for 'shard_<n>' aliases, 0 for any other (e.g. 'default')"""
+    prefix, _, number = alias.rpartition('_')
+    return int(number) if prefix == 'shard' and number.isdigit() else 0
+
+
+def _sharded_models():
+    return [model for model in apps.get_models() if is_sharded(model)]
+
+
+def reserve_id_range(alias):
+    """Make new ids of partitioned tables on `alias` start at shard_number(alias) * SHARD_ID_SPACING"""
+    start = shard_number(alias) * SHARD_ID_SPACING
+    if not start:
+        return
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in _sharded_models():
+            if not isinstance(model._meta.pk, models.AutoField):
+                continue
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [start, table, start])
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, start, table],
+                )
+            elif connection.vendor == 'postgresql':
+                column = model._meta.pk.column
+                cursor.execute(
+                    f'SELECT setval(pg_get_serial_sequence(%s, %s), GREATEST(%s, '
+                    f'(SELECT COALESCE(MAX({connection.ops.quote_name(column)}), 0) FROM {connection.ops.quote_name(table)})))',
+                    [table, column, start],
+                )
+            else:
+                logger.warning(f"Cannot reserve an id range for {table} on {connection.vendor}; ids may clash between shards")
+                return
+
+
+def reserve_id_ranges(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate receiver: every migrated shard gets its id range"""
+    reserve_id_range(using)
+
+
+def replicate_users(users):
+    """Insert or update the shards' copies of `users` (saved rows from 'default')"""
+    targets = [alias for alias in shards() if alias != DEFAULT_DB_ALIAS]
+    if not targets or not users:
+        return
+    fields = User._meta.concrete_fields
+    update_fields = [field.name for field in fields if not field.primary_key]
+    for alias in targets:
+        # Copies, so the callers' instances keep belonging to 'default'
+        copies = [User(**{field.attname: getattr(user, field.attname) for field in fields}) for user in users]
+        User.objects.using(alias).bulk_create(
+            copies, update_conflicts=True, unique_fields=['id'], update_fields=update_fields
+        )
+
+
+def remove_users(user_ids):
+    """Delete the shards' copies of users, and with them their partitioned rows"""
+    for alias in shards():
+        if alias != DEFAULT_DB_ALIAS:
+            with using_shard(alias):
+                User.objects.using(alias).filter(pk__in=user_ids).delete()
+
+
+def sync_users(batch_size=1000):
+    """Copy every user to every shard (run once when enabling sharding). Returns the number of users"""
+    count = 0
+    batch = []
+    for user in User.objects.using(DEFAULT_DB_ALIAS).order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(user)
+        if len(batch) >= batch_size:
+            replicate_users(batch)
+            count += len(batch)
+            batch = []
+    replicate_users(batch)
+    return count + len(batch)
+
+
+class ShardMoveError(Exception):
+    """Rows cannot move to another shard without splitting history that must stay together"""
+
+
+def _history_models():
+    from payments.models import ArrearsSnapshot, Payment, PaymentArchive, ReminderLog, RentCharge
+    return [Payment, PaymentArchive, RentCharge, ArrearsSnapshot, ReminderLog]
+
+
+def _has_property(model):
+    return any(field.name == 'property_t' for field in model._meta.concrete_fields)
+
+
+def move_tenant_profiles(user_ids, target):
+    """
+    Bring the tenant profiles of `user_ids` living on other shards to
+    `target`, so they can be given units there. Only unassigned profiles
+    without payment history can move. Returns the user ids that could not.
+    """
+    stuck = set()
+    for alias in shards():
+        if alias == target:
+            continue
+        profiles = list(Tenant.objects.using(alias).filter(user_id__in=user_ids))
+        if not profiles:
+            continue
+        tied = set()
+        for model in _history_models():
+            tied.update(
+                model.objects.using(alias).filter(tenant__in=[profile.id for profile in profiles])
+                .values_list('tenant_id', flat=True)
+            )
+        movable = [profile for profile in profiles if profile.property_id is None and profile.id not in tied]
+        stuck.update(profile.user_id for profile in profiles if profile not in movable)
+        if not movable:
+            continue
+        Tenant.objects.using(target).bulk_create([
+            Tenant(user_id=profile.user_id, property=None, lease_start=profile.lease_start, lease_end=profile.lease_end)
+            for profile in movable
+        ])
+        Tenant.objects.using(alias).filter(id__in=[profile.id for profile in movable]).delete()
+        cache.delete_many([_user_key(profile.user_id) for profile in movable])
+        logger.info(f"Moved {len(movable)} tenant profiles from {alias} to {target}")
+    return stuck
+
+
+def _copy_rows(model, rows, target, remap, batch_size):
+    """
+    Insert copies of `rows` on `target` under new ids (in the target's id
+    range), with foreign keys translated through `remap` ({attname: {old:
+    new}}). Returns {old id: new id}.
+    """
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    # bulk_create stamps auto_now(_add) fields. Creation times are restored;
+    # auto_now ones (updated_at) keep the move's time, so delta-sync clients
+    # whose watermark predates the move receive the rows under their new ids
+    stamped = [field.name for field in fields if getattr(field, 'auto_now_add', False)]
+    ids = {}
+    batch = []
+
+    def flush():
+        copies = []
+        for row in batch:
+            values = {field.attname: getattr(row, field.attname) for field in fields}
+            for attname, mapping in remap.items():
+                if values[attname] is not None:
+                    values[attname] = mapping[values[attname]]
+            copies.append(model(**values))
+        created = model._default_manager.using(target).bulk_create(copies)
+        if stamped:
+            for row, copy in zip(batch, created):
+                for name in stamped:
+                    setattr(copy, name, getattr(row, name))
+            model._default_manager.using(target).bulk_update(created, stamped)
+        ids.update((row.pk, copy.pk) for row, copy in zip(batch, created))
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return ids
+
+
+def _unnumbered(change):
+    change.sequence = None
+    return change
+
+
+def _landlord_rows(alias, landlord_id):
+    """(properties, tenants, {history model: rows}) querysets of one landlord on `alias`"""
+    properties = Property.objects.using(alias).filter(landlord_id=landlord_id)
+    tenants = Tenant.objects.using(alias).filter(property__landlord_id=landlord_id)
+    history = {}
+    for model in _history_models():
+        condition = Q(tenant__property__landlord_id=landlord_id)
+        if _has_property(model):
+            condition |= Q(property_t__landlord_id=landlord_id)
+        history[model] = model.objects.using(alias).filter(condition)
+    return properties, tenants, history
+
+
+def _split_history(alias, landlord_id):
+    """History rows that tie the landlord's tenants or units to someone else's"""
+    split = {}
+    for model in _history_models():
+        if not _has_property(model):
+            continue
+        mine = Q(tenant__property__landlord_id=landlord_id)
+        unit = Q(property_t__landlord_id=landlord_id)
+        count = model.objects.using(alias).filter(
+            (mine & Q(property_t__isnull=False) & ~unit) | (unit & ~mine)
+        ).count()
+        if count:
+            split[model._meta.label] = count
+    return split
+
+
+def delete_landlord_rows(alias, landlord_id):
+    """Delete a landlord's partitioned rows from one database"""
+    from payments.models import Payment, PaymentChange
+    with using_shard(alias), transaction.atomic(using=alias):
+        properties, tenants, history = _landlord_rows(alias, landlord_id)
+        # Properties get tombstones from their post_delete signal; payments
+        # are deleted in bulk without one, so record theirs here
+        delta.record_deleted(Payment, [
+            (payment_id, None, tenant_id) for payment_id, tenant_id in history[Payment].values_list('id', 'tenant_id')
+        ])
+        for rows in history.values():
+            rows.delete()
+        tenants.delete()
+        properties.delete()
+        PortfolioSnapshot.objects.using(alias).filter(landlord_id=landlord_id).delete()
+        PaymentChange.objects.using(alias).filter(landlord_id=landlord_id).delete()
+        LandlordPortfolio.objects.using(alias).filter(landlord_id=landlord_id).delete()
+
+
+def move_landlord(landlord_id, target, batch_size=None):
+    """
+    Move a landlord, their units, tenants and history to `target`. Rows get
+    new ids in the target's range. Writes to the landlord made while the
+    move runs are lost, so run it in a quiet period for that landlord.
+    Returns {model label: rows moved}.
+    """
+    if target not in shards():
+        raise ShardMoveError(f"{target} is not one of SHARD_DATABASES")
+    batch_size = batch_size or settings.SHARD_MOVE_BATCH_SIZE
+    source = shard_for_landlord(landlord_id)
+    if source == target:
+        return {}
+    split = _split_history(source, landlord_id)
+    if split:
+        raise ShardMoveError(
+            f"Landlord {landlord_id} shares history with other landlords' tenants or units ({split}); "
+            "resolve it before moving"
+        )
+
+    tenant_user_ids = list(Tenant.objects.using(source).filter(property__landlord_id=landlord_id).values_list('user_id', flat=True))
+    replicate_users(list(User.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=[landlord_id, *tenant_user_ids])))
+    # Anything already on the target is left over from an interrupted move
+    delete_landlord_rows(target, landlord_id)
+
+    from payments.models import Payment, PaymentArchive, PaymentChange
+    properties, tenants, history = _landlord_rows(source, landlord_id)
+    moved = {}
+    copied = {}
+    with transaction.atomic(using=target):
+        property_ids = _copy_rows(Property, properties.order_by('pk').iterator(), target, {}, batch_size)
+        tenant_ids = _copy_rows(Tenant, tenants.order_by('pk').iterator(), target, {'property_id': property_ids}, batch_size)
+        moved[Property._meta.label] = len(property_ids)
+        moved[Tenant._meta.label] = len(tenant_ids)
+        for model, rows in history.items():
+            remap = {'tenant_id': tenant_ids}
+            if _has_property(model):
+                remap['property_t_id'] = property_ids
+            copied[model] = _copy_rows(model, rows.order_by('pk').iterator(), target, remap, batch_size)
+            moved[model._meta.label] = len(copied[model])
+        # The change feed follows in order, to be numbered again in the target's
+        # range. Consumers notice the new range and restart (see payments.outbox)
+        payment_ids = {**copied[PaymentArchive], **copied[Payment]}
+        changes = (
+            _unnumbered(change)
+            for change in PaymentChange.objects.using(source).filter(landlord_id=landlord_id).order_by(F('sequence').asc(nulls_last=True), 'pk').iterator()
+            if change.payment_id in payment_ids and change.tenant_id in tenant_ids
+        )
+        moved[PaymentChange._meta.label] = len(_copy_rows(
+            PaymentChange, changes, target, {'payment_id': payment_ids, 'tenant_id': tenant_ids}, batch_size
+        ))
+        snapshots = PortfolioSnapshot.objects.using(source).filter(landlord_id=landlord_id).order_by('pk')
+        moved[PortfolioSnapshot._meta.label] = len(_copy_rows(PortfolioSnapshot, snapshots.iterator(), target, {}, batch_size))
+
+    LandlordShard.objects.update_or_create(landlord_id=landlord_id, defaults={'alias': target})
+    cache.delete_many([_landlord_key(landlord_id)] + [_user_key(user_id) for user_id in tenant_user_ids])
+    delete_landlord_rows(source, landlord_id)
+    # Counters are rebuilt on the target the first time they are read
+    logger.info(f"Moved landlord {landlord_id} from {source} to {target}: {moved}")
+    return moved
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from payments.income import invalidate_income_on_commit
+from . import delta, portfolio
+from .models import Property, Tenant
+
+
+@receiver(post_save, sender=Property)
+def count_saved_property(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    # The income series lists every property and its expected rent
+    invalidate_income_on_commit([instance.landlord_id], using=using)
+    before, after = getattr(instance, '_loaded_counted', None), instance.counted_values()
+    instance._loaded_counted = after
+    if created:
+        portfolio.properties_added(instance.landlord_id, [instance])
+    elif before is None or after is None or before[0] != after[0]:
+        # Rare: values not loaded, or the unit changed landlord; recount whoever is affected
+        landlord_ids = {instance.landlord_id}
+        if before is not None:
+            landlord_ids.add(before[0])
+        portfolio.refresh_portfolios(list(landlord_ids))
+    elif before != after:
+        # Vacancy or rent edited (admin): adjust by the difference, like inserts do
+        portfolio.property_changed(instance.landlord_id, before[1:], after[1:])
+
+
+@receiver(pre_delete, sender=Property)
+def count_deleted_property(sender, instance, **kwargs):
+    # Runs inside the delete transaction, before the tenants' property is set to NULL
+    portfolio.property_removed(instance, tenant_count=instance.tenants.count())
+
+
+@receiver(post_delete, sender=Property)
+def record_deleted_property(sender, instance, using=None, **kwargs):
+    delta.record_deleted(Property, [(instance.id, instance.landlord_id, None)])
+    invalidate_income_on_commit([instance.landlord_id], using=using)
+
+
+@receiver(pre_delete, sender=Tenant)
+def count_deleted_tenant(sender, instance, **kwargs):
+    if instance.property_id is not None:
+        portfolio.tenant_unassigned(instance.property_id)
+        delta.touch_properties([instance.property_id])
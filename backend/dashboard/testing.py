@@ -0,0 +1,151 @@
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from monitoring.throttling import reset_bucket_store
+from payments.models import Payment
+from .models import Property, Tenant
+from .portfolio import refresh_portfolios
+
+User = get_user_model()
+
+TEST_PASSWORD = 'Nyumbani-test-pass-1'
+PAYMENTS_PER_TENANT = 3
+
+
+def seed_portfolio(scale, label, password_hash):
+    """
+    Seed one landlord with `scale` occupied properties (one tenant each),
+    a proportional number of vacant units and payment history.
+
+    The first tenant is the "primary" tenant whose own history also grows
+    with `scale`, so tenant-facing endpoints are exercised at size too.
+    Everything is bulk inserted, which bypasses the tenant profile signal.
+    """
+    landlord = User.objects.create(
+        email=f'{label}-landlord@example.com',
+        password=password_hash,
+        phone_number='+254700000000',
+        landlord=True,
+    )
+
+    properties = Property.objects.bulk_create([
+        Property(landlord=landlord, address=f'{label} unit {i}', monthly_rent=Decimal('15000.00'), is_vacant=False)
+        for i in range(scale)
+    ])
+    vacant_properties = Property.objects.bulk_create([
+        Property(landlord=landlord, address=f'{label} vacant unit {i}', monthly_rent=Decimal('12000.00'), is_vacant=True)
+        for i in range(max(1, scale // 5))
+    ])
+
+    users = User.objects.bulk_create([
+        User(email=f'{label}-tenant-{i}@example.com', password=password_hash, tenant=True)
+        for i in range(scale)
+    ])
+    today = timezone.now().date()
+    tenants = Tenant.objects.bulk_create([
+        Tenant(user=user, property=prop, lease_start=today - timedelta(days=90), lease_end=today + timedelta(days=275))
+        for user, prop in zip(users, properties)
+    ])
+
+    payments = [
+        Payment(tenant=tenant, property_t=tenant.property, amount=tenant.property.monthly_rent, status='completed')
+        for tenant in tenants
+        for _ in range(PAYMENTS_PER_TENANT)
+    ]
+    primary = tenants[0]
+    payments += [
+        Payment(tenant=primary, property_t=primary.property, amount=Decimal('500.00'), status='completed')
+        for _ in range(scale)
+    ]
+    payments.append(Payment(
+        tenant=primary,
+        property_t=primary.property,
+        amount=primary.property.monthly_rent,
+        status='pending',
+        stripe_payment_intent_id=f'pi_{label}_pending',
+        stripe_client_secret=f'pi_{label}_pending_secret',
+    ))
+    Payment.objects.bulk_create(payments)
+
+    # Goes through save() so the signal creates the (unassigned) tenant profile
+    unassigned_user = User.objects.create(
+        email=f'{label}-newcomer@example.com',
+        password=password_hash,
+        tenant=True,
+    )
+    unassigned_tenant = Tenant.objects.get(user=unassigned_user)
+    refresh_portfolios([landlord.id])
+
+    return SimpleNamespace(
+        label=label,
+        scale=scale,
+        landlord=landlord,
+        properties=properties,
+        vacant_properties=vacant_properties,
+        tenants=tenants,
+        primary_tenant=primary,
+        unassigned_tenant=unassigned_tenant,
+        pending_payment=Payment.objects.get(stripe_payment_intent_id=f'pi_{label}_pending'),
+    )
+
+
+class QueryBudgetTestCase(APITestCase):
+    """
+    Runs every request against a small and a large portfolio and asserts the
+    number of SQL queries is identical at both sizes and within a fixed budget.
+    """
+    SMALL_SCALE = 1
+    LARGE_SCALE = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        password_hash = make_password(TEST_PASSWORD)
+        cls.portfolios = [
+            seed_portfolio(cls.SMALL_SCALE, 'small', password_hash),
+            seed_portfolio(cls.LARGE_SCALE, 'large', password_hash),
+        ]
+
+    def setUp(self):
+        super().setUp()
+        # Cached reads (e.g. income series) and rate limits must not leak between tests
+        cache.clear()
+        reset_bucket_store()
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def assertQueryBudget(self, budget, make_request, expected_status=200):
+        """
+        `make_request` receives a portfolio and returns the response. The
+        client credentials are reset before each call.
+        """
+        counts = {}
+        for portfolio in self.portfolios:
+            self.client.credentials()
+            with CaptureQueriesContext(connection) as queries:
+                response = make_request(portfolio)
+            self.assertEqual(
+                response.status_code, expected_status,
+                f'{portfolio.label}: unexpected status {response.status_code}: {getattr(response, "data", response.content)}'
+            )
+            counts[portfolio.label] = len(queries)
+
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f'Query count grows with data size: {counts}'
+        )
+        self.assertLessEqual(
+            max(counts.values()), budget,
+            f'Query budget of {budget} exceeded: {counts}'
+        )
+        return counts
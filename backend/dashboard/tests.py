@@ -1,3 +1,744 @@
-from django.test import TestCase
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from monitoring.throttling import reset_bucket_store
+from payments.archive import archive_payments
+from payments.arrears import snapshot_arrears
+from payments.billing import run_billing
+from payments.events import process_events
+from payments.models import ArrearsSnapshot, Payment, PaymentArchive, PaymentChange, ProcessedStripeEvent, RentCharge
+from payments.outbox import change_for
+from payments.streams import tenant_channel
+from payments.views import PaymentStatusStreamView
+from .loadtest import SCENARIOS, run_load_test
+from .analytics import take_portfolio_snapshots
+from .assignments import INELIGIBLE_TENANT
+from . import sharding
+from .models import LandlordPortfolio, LandlordShard, PortfolioSnapshot, Property, Tenant
+from .portfolio import compute_counters, verify_portfolios
+from .testing import QueryBudgetTestCase
+
+User = get_user_model()
+
+
+class DashboardQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_tenant_data(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.primary_tenant.user)
+            return self.client.get(reverse('tenant-data'))
+        self.assertQueryBudget(6, make_request)
+
+    def test_landlord_data(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.get(reverse('landlord-data'))
+        self.assertQueryBudget(6, make_request)
+
+    def test_landlord_data_totals(self):
+        for portfolio in self.portfolios:
+            self.authenticate(portfolio.landlord)
+            data = self.client.get(reverse('landlord-data')).data['data']
+            self.assertEqual(data['total_properties'], len(portfolio.properties) + len(portfolio.vacant_properties))
+            self.assertEqual(data['total_tenants'], portfolio.scale)
+            self.assertEqual(len(data['properties']), data['total_properties'])
+
+    def test_property_create(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.post(reverse('property-create'), {
+                'address': f'{portfolio.label} new unit',
+                'monthly_rent': '20000.00',
+                'is_vacant': True,
+            }, format='json')
+        self.assertQueryBudget(5, make_request, expected_status=201)
+
+    def test_property_count(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.get(reverse('property-count'))
+        self.assertQueryBudget(2, make_request)
+
+    def test_property_list(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.get(reverse('property-list'))
+        self.assertQueryBudget(3, make_request)
+
+    def test_property_bulk_create(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.post(reverse('property-bulk-create'), {
+                'properties': [
+                    {'address': f'{portfolio.label} block A', 'monthly_rent': '18000.00'},
+                    {'address': f'{portfolio.label} block B', 'monthly_rent': '18000.00'},
+                ]
+            }, format='json')
+        self.assertQueryBudget(5, make_request, expected_status=201)
+
+    def test_batch(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.post(reverse('batch'), {
+                'requests': [reverse('landlord-data'), reverse('property-count'), reverse('property-list')],
+            }, format='json')
+        # The three views separately take 6 + 2 + 3 queries, each loading the user again
+        self.assertQueryBudget(9, make_request)
+
+    def test_bulk_tenant_assignment(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.post(reverse('property-bulk-assign-tenants'), {'assignments': [
+                {'email': f'{portfolio.label}-newcomer@example.com', 'property_id': portfolio.vacant_properties[0].id},
+            ]}, format='json')
+        self.assertQueryBudget(8, make_request)
+
+
+class BulkTenantAssignmentTests(QueryBudgetTestCase):
+    LARGE_SCALE = 20
+
+    def test_rows_are_validated_against_the_batch_and_applied_together(self):
+        other, portfolio = self.portfolios
+        landlord = portfolio.landlord
+        vacant = portfolio.vacant_properties
+        moving = portfolio.tenants[5]
+        self.authenticate(landlord)
+        response = self.client.post(reverse('property-bulk-assign-tenants'), {'assignments': [
+            {'email': portfolio.unassigned_tenant.user.email, 'property_id': vacant[0].id, 'lease_end': '2027-06-30'},
+            {'email': portfolio.tenants[6].user.email, 'property_id': vacant[1].id},
+            {'email': 'nobody@example.com', 'property_id': vacant[2].id},
+            {'email': moving.user.email, 'property_id': vacant[0].id},
+            {'email': portfolio.unassigned_tenant.user.email, 'property_id': vacant[3].id},
+            {'email': moving.user.email, 'property_id': portfolio.properties[0].id},
+            {'email': moving.user.email, 'property_id': other.vacant_properties[0].id},
+            {'email': moving.user.email},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['assigned', 'assigned'] + ['error'] * 6)
+        self.assertEqual(results[2]['errors'], {'email': [INELIGIBLE_TENANT]})
+        self.assertEqual(results[3]['errors'], {'property_id': ['This property appears more than once in the batch']})
+        self.assertEqual(results[4]['errors'], {'email': ['This tenant appears more than once in the batch']})
+        self.assertEqual(results[5]['errors'], {'property_id': ['This property is not available']})
+        self.assertEqual(results[6]['errors'], {'property_id': ['Property does not exist']})
+        self.assertIn('property_id', results[7]['errors'])
+        self.assertEqual((response.data['total_assigned'], response.data['total_errors']), (2, 6))
+
+        newcomer = Tenant.objects.get(id=portfolio.unassigned_tenant.id)
+        self.assertEqual((newcomer.property_id, str(newcomer.lease_end)), (vacant[0].id, '2027-06-30'))
+        self.assertEqual(Tenant.objects.get(id=portfolio.tenants[6].id).property_id, vacant[1].id)
+        self.assertFalse(Property.objects.filter(id__in=[vacant[0].id, vacant[1].id], is_vacant=True).exists())
+        for landlord_id in (landlord.id, other.landlord.id):
+            stored = LandlordPortfolio.objects.get(landlord_id=landlord_id)
+            expected = compute_counters([landlord_id])[landlord_id]
+            self.assertEqual({field: getattr(stored, field) for field in expected}, expected)
+
+    def test_other_landlords_tenants_look_like_unknown_emails(self):
+        other, portfolio = self.portfolios
+        housed = other.tenants[0]
+        self.authenticate(portfolio.landlord)
+        response = self.client.post(reverse('property-bulk-assign-tenants'), {'assignments': [
+            {'email': housed.user.email, 'property_id': portfolio.vacant_properties[0].id},
+            {'email': 'nobody@example.com', 'property_id': portfolio.vacant_properties[1].id},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [{key: result[key] for key in ('status', 'errors')} for result in response.data['results']],
+            [{'status': 'error', 'errors': {'email': [INELIGIBLE_TENANT]}}] * 2,
+        )
+        self.assertEqual(Tenant.objects.get(id=housed.id).property_id, housed.property_id)
+        self.assertTrue(Property.objects.get(id=portfolio.vacant_properties[0].id).is_vacant)
+
+    def test_concurrently_taken_units_abort_the_batch(self):
+        portfolio = self.portfolios[-1]
+        self.authenticate(portfolio.landlord)
+        unit = portfolio.vacant_properties[0]
+        real_filter = Property.objects.filter
+
+        def filter_after_a_concurrent_claim(*args, **kwargs):
+            # The unit is taken between the lookup and the claim
+            if 'is_vacant' in kwargs:
+                real_filter(id=unit.id).update(is_vacant=False)
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(Property.objects, 'filter', side_effect=filter_after_a_concurrent_claim):
+            response = self.client.post(reverse('property-bulk-assign-tenants'), {'assignments': [
+                {'email': portfolio.unassigned_tenant.user.email, 'property_id': unit.id},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNone(Tenant.objects.get(id=portfolio.unassigned_tenant.id).property_id)
+
+    def test_only_landlords(self):
+        self.authenticate(self.portfolios[0].primary_tenant.user)
+        self.assertEqual(self.client.post(reverse('property-bulk-assign-tenants'), {'assignments': []}, format='json').status_code, 403)
+
+
+class BatchTests(QueryBudgetTestCase):
+
+    def batch(self, user, paths):
+        self.authenticate(user)
+        return self.client.post(reverse('batch'), {'requests': paths}, format='json')
+
+    def test_results_match_individual_requests(self):
+        landlord = self.portfolios[0].landlord
+        paths = [reverse('property-count'), f"{reverse('portfolio-trends')}?days=0", reverse('tenant-data')]
+        response = self.batch(landlord, paths)
+        self.assertEqual(response.status_code, 200)
+
+        for path, result in zip(paths, response.json()['responses']):
+            single = self.client.get(path)
+            self.assertEqual((result['path'], result['status'], result['body']), (path, single.status_code, single.json()))
+
+    def test_invalid_sub_requests_are_reported_per_item(self):
+        tenant = self.portfolios[0].primary_tenant.user
+        results = self.batch(tenant, ['/nowhere/', 'properties/', reverse('batch'), reverse('payment_status_stream'), '/admin/']).json()['responses']
+        self.assertEqual([result['status'] for result in results], [404, 400, 400, 400, 400])
+
+    def test_a_failing_sub_request_does_not_fail_the_batch(self):
+        landlord = self.portfolios[0].landlord
+        with mock.patch('dashboard.views.PropertyListView.get', side_effect=RuntimeError('boom')), self.assertLogs('dashboard.batch', 'ERROR'):
+            results = self.batch(landlord, [reverse('property-list'), reverse('property-count')]).json()['responses']
+        self.assertEqual([result['status'] for result in results], [500, 200])
+
+    def test_limits_and_authentication(self):
+        landlord = self.portfolios[0].landlord
+        with self.settings(BATCH_MAX_REQUESTS=2):
+            self.assertEqual(self.batch(landlord, [reverse('property-count')] * 3).status_code, 400)
+        self.assertEqual(self.batch(landlord, []).status_code, 400)
+        self.client.credentials()
+        self.assertEqual(self.client.post(reverse('batch'), {'requests': ['/properties/']}, format='json').status_code, 401)
+
+
+class SeedScaleTests(TestCase):
+
+    def test_seed_scale_creates_portfolio_with_history(self):
+        out = StringIO()
+        call_command('seed_scale', landlords=2, properties_per_landlord=5, years=1,
+                     vacancy_rate=0, seed=7, stdout=out)
+
+        self.assertEqual(Property.objects.count(), 10)
+        self.assertEqual(Tenant.objects.count(), 10)
+        self.assertTrue(Payment.objects.filter(status='completed').exists())
+        oldest = Payment.objects.order_by('date').first()
+        self.assertLess(oldest.date.date(), timezone.now().date().replace(day=1))
+        self.assertIn('Seeded', out.getvalue())
+
+    def test_load_test_reports_percentiles_per_endpoint(self):
+        call_command('seed_scale', landlords=1, properties_per_landlord=3, years=1,
+                     vacancy_rate=0, seed=3, stdout=StringIO())
+
+        rows = run_load_test(sorted(SCENARIOS), iterations=2)
+
+        endpoints = {row['endpoint']: row for row in rows}
+        self.assertIn('landlord-data', endpoints)
+        self.assertIn('create_payment_intent', endpoints)
+        self.assertEqual(sum(row['errors'] for row in rows), 0)
+        for row in rows:
+            self.assertLessEqual(row['p50'], row['p99'])
+
+    @override_settings(DEBUG=True, ALLOWED_HOSTS=[], THROTTLE_SCOPES={**settings.THROTTLE_SCOPES, 'expensive': {'user': '1/min'}})
+    def test_load_test_command_runs_outside_the_test_client_host(self):
+        # The project's own settings, without the 'testserver' host the test runner adds
+        call_command('seed_scale', landlords=1, properties_per_landlord=3, years=1,
+                     vacancy_rate=0, seed=3, stdout=StringIO())
+        out = StringIO()
+        call_command('loadtest', iterations=3, sample_size=1, stdout=out)
+
+        endpoints = {
+            'tenant-data', 'tenant_payment_summary', 'payment_list', 'landlord-data', 'property-count', 'property-list',
+            'create_payment_intent', 'confirm_payment',
+        }
+        rows = {
+            fields[0]: [int(value) for value in fields[1:4]]
+            for fields in map(str.split, out.getvalue().splitlines()) if fields and fields[0] in endpoints
+        }
+        self.assertEqual(set(rows), endpoints)
+        self.assertEqual(sum(errors for _, errors, _ in rows.values()), 0)
+        # One user per role hits the 1/min limit, which is reported but not counted as an error
+        self.assertEqual(rows['landlord-data'][2], 2)
+        self.assertEqual(rows['tenant_payment_summary'][2], 2)
+        self.assertIn('rate limited', out.getvalue())
+
+
+class PortfolioCounterTests(QueryBudgetTestCase):
+    LARGE_SCALE = 20
+
+    def assertCountersCorrect(self, landlord):
+        stored = LandlordPortfolio.objects.get(landlord=landlord)
+        expected = compute_counters([landlord.id])[landlord.id]
+        self.assertEqual({field: getattr(stored, field) for field in expected}, expected)
+
+    def test_counters_follow_property_and_tenant_changes(self):
+        portfolio = self.portfolios[-1]
+        landlord = portfolio.landlord
+        self.authenticate(landlord)
+
+        self.client.post(reverse('property-create'), {'address': 'Counter unit', 'monthly_rent': '9000.00', 'is_vacant': True}, format='json')
+        self.client.post(reverse('property-bulk-create'), {'properties': [
+            {'address': 'Counter block A', 'monthly_rent': '7000.00', 'is_vacant': True},
+            {'address': 'Counter block B', 'monthly_rent': '7000.00', 'is_vacant': False},
+        ]}, format='json')
+        self.assertCountersCorrect(landlord)
+
+        self.authenticate(portfolio.unassigned_tenant.user)
+        self.client.post(reverse('assign-tenant'), {'property_id': portfolio.vacant_properties[0].id}, format='json')
+        # Moving an assigned tenant to another landlord's unit
+        self.authenticate(portfolio.tenants[1].user)
+        self.client.post(reverse('assign-tenant'), {'property_id': self.portfolios[0].vacant_properties[0].id}, format='json')
+        self.assertCountersCorrect(landlord)
+        self.assertCountersCorrect(self.portfolios[0].landlord)
+
+        portfolio.properties[2].delete()
+        portfolio.tenants[3].delete()
+        self.assertCountersCorrect(landlord)
+
+        rows = LandlordPortfolio.objects.get(landlord=landlord)
+        self.authenticate(landlord)
+        data = self.client.get(reverse('landlord-data')).data['data']
+        self.assertEqual(
+            (data['total_properties'], data['total_tenants'], data['total_monthly_income']),
+            (rows.property_count, rows.tenant_count, rows.total_monthly_rent),
+        )
+        self.assertEqual(self.client.get(reverse('property-count')).data['property_count'], rows.property_count)
+
+    def test_property_edits_adjust_counters_without_a_recount(self):
+        portfolio = self.portfolios[-1]
+        landlord = portfolio.landlord
+        unit = Property.objects.get(id=portfolio.vacant_properties[0].id)
+
+        with CaptureQueriesContext(connection) as queries:
+            unit.address = 'Renamed'
+            unit.save()
+        # The UPDATE alone: an address does not move any counter
+        self.assertEqual(len(queries), 1)
+        with mock.patch('dashboard.portfolio.compute_counters') as recount:
+            unit.is_vacant = False
+            unit.monthly_rent = '12500.00'
+            unit.save()
+            unit.monthly_rent = Decimal('12000.00')
+            unit.save()
+        recount.assert_not_called()
+        self.assertCountersCorrect(landlord)
+
+        # A unit saved without its loaded values is recounted
+        Property(id=unit.id, landlord=landlord, address='Renamed', monthly_rent=Decimal('8000.00'), is_vacant=True).save()
+        self.assertCountersCorrect(landlord)
+
+    def test_verify_and_repair(self):
+        landlord = self.portfolios[0].landlord
+        LandlordPortfolio.objects.filter(landlord=landlord).update(tenant_count=99)
+        LandlordPortfolio.objects.filter(landlord=self.portfolios[1].landlord).delete()
+
+        with self.assertRaises(CommandError):
+            call_command('portfolio_counters', stdout=StringIO())
+        out = StringIO()
+        call_command('portfolio_counters', repair=True, stdout=out)
+
+        self.assertIn(f'landlord {landlord.id}: tenant_count is 99', out.getvalue())
+        self.assertEqual(verify_portfolios(), [])
+
+
+class PortfolioSnapshotTests(QueryBudgetTestCase):
+    LARGE_SCALE = 20
+
+    def test_snapshot_metrics(self):
+        today = timezone.now().date()
+        portfolio = self.portfolios[-1]
+        # A former tenant whose lease on a now vacant unit ended last month
+        lease_end = today.replace(day=1) - timedelta(days=10)
+        Tenant.objects.filter(id=portfolio.tenants[-1].id).update(
+            property=portfolio.vacant_properties[0], lease_end=lease_end
+        )
+        run_billing(today.replace(day=1))
+
+        self.assertEqual(take_portfolio_snapshots(today), len(self.portfolios))
+        self.assertEqual(take_portfolio_snapshots(today), len(self.portfolios))
+
+        snapshot = PortfolioSnapshot.objects.get(landlord=portfolio.landlord, date=today)
+        units = portfolio.scale + len(portfolio.vacant_properties)
+        self.assertEqual((snapshot.property_count, snapshot.occupied_count), (units, portfolio.scale))
+        self.assertEqual(snapshot.occupancy_rate, (Decimal(portfolio.scale) / units).quantize(Decimal('0.0001')))
+        self.assertEqual(snapshot.avg_vacancy_days, (today - lease_end).days)
+        self.assertEqual(snapshot.rent_charged, Decimal('15000.00') * (portfolio.scale - 1))
+        self.assertGreater(snapshot.collection_rate, 1)
+
+    def test_trend_api(self):
+        today = timezone.now().date()
+        for days_ago in (0, 1, 40):
+            take_portfolio_snapshots(today - timedelta(days=days_ago))
+
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.get(reverse('portfolio-trends'), {'days': 30})
+        self.assertQueryBudget(2, make_request)
+
+        snapshots = make_request(self.portfolios[0]).data['snapshots']
+        self.assertEqual([row['date'] for row in snapshots], [today - timedelta(days=1), today])
+        self.assertIn('collection_rate', snapshots[0])
+        self.assertEqual(self.client.get(reverse('portfolio-trends'), {'days': 0}).status_code, 400)
+
+
+@override_settings(DELTA_SYNC_OVERLAP_SECONDS=0)
+class DeltaSyncTests(QueryBudgetTestCase):
+    LARGE_SCALE = 20
+
+    def sync(self, **params):
+        response = self.client.get(reverse('property-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_since_returns_changed_and_deleted_properties(self):
+        other, portfolio = self.portfolios
+        self.authenticate(portfolio.landlord)
+        watermark = self.sync()['watermark']
+        self.assertEqual(self.sync(since=watermark)['properties'], [])
+
+        moving = portfolio.tenants[5]
+        self.client.post(reverse('property-bulk-assign-tenants'), {'assignments': [
+            {'email': moving.user.email, 'property_id': portfolio.vacant_properties[0].id},
+        ]}, format='json')
+        Property.objects.filter(id=portfolio.properties[1].id).delete()
+        Property.objects.filter(id=other.properties[0].id).delete()
+
+        data = self.sync(since=watermark)
+        self.assertFalse(data['full'])
+        self.assertEqual(
+            {row['id'] for row in data['properties']},
+            {portfolio.vacant_properties[0].id, moving.property.id},
+        )
+        self.assertEqual(data['deleted'], [portfolio.properties[1].id])
+        self.assertEqual(self.sync(since=data['watermark'])['properties'], [])
+
+    def test_old_or_invalid_watermarks(self):
+        self.authenticate(self.portfolios[-1].landlord)
+        data = self.sync(since=(timezone.now() - timedelta(days=31)).isoformat())
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['properties']), Property.objects.filter(landlord=self.portfolios[-1].landlord).count())
+        self.assertEqual(self.client.get(reverse('property-list'), {'since': 'yesterday'}).status_code, 400)
+
+    def test_delta_query_budget(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.get(reverse('property-list'), {'since': timezone.now().isoformat()})
+        # Properties (none changed, so no prefetch) and tombstones
+        self.assertQueryBudget(3, make_request)
+
+
+class LargeTableAdminTests(QueryBudgetTestCase):
+    LARGE_SCALE = 150
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser(email='support@example.com', password='Nyumbani-test-pass-1'))
+
+    def test_changelists_join_related_rows(self):
+        for name in ('admin:dashboard_property_changelist', 'admin:dashboard_tenant_changelist'):
+            def make_request(portfolio):
+                return self.client.get(reverse(name), {'q': portfolio.landlord.email if 'property' in name else portfolio.primary_tenant.user.email})
+            self.assertQueryBudget(4, make_request)
+
+    def test_cursor_continues_below_the_last_row(self):
+        url = reverse('admin:dashboard_property_changelist')
+        first = self.client.get(url).context['cl']
+        self.assertEqual(len(first.result_list), 100)
+        second = self.client.get(url + first.next_cursor_url).context['cl']
+        self.assertLess(second.result_list[0].pk, first.result_list[99].pk)
+        self.assertIsNone(self.client.get(url, {'o': '2'}).context['cl'].next_cursor_url)
+
+
+@override_settings(SHARD_DATABASES=['shard_1', 'shard_2'])
+class ShardingTests(APITestCase):
+    """Two local SQLite shards (SHARD_COUNT aliases in settings) behind the landlord router"""
+    databases = {'default', 'shard_1', 'shard_2'}
+
+    def setUp(self):
+        cache.clear()
+        reset_bucket_store()
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def make_landlord(self, email, alias):
+        landlord = User.objects.create_user(email=email, password='x', landlord=True)
+        LandlordShard.objects.create(landlord=landlord, alias=alias)
+        return landlord
+
+    def test_landlords_are_hashed_once_and_pinned(self):
+        landlord = User.objects.create_user(email='hashed@example.com', password='x', landlord=True)
+        expected = sharding.hash_shard(landlord.id)
+        self.assertEqual(sharding.shard_for_landlord(landlord.id), expected)
+        self.assertEqual(LandlordShard.objects.get(landlord=landlord).alias, expected)
+        self.assertEqual(sharding.hash_shard(landlord.id, ['a', 'b', 'c']), sharding.hash_shard(landlord.id, ['a', 'b', 'c']))
+
+    def test_only_shard_aware_data_migrations_run_on_shards(self):
+        router = sharding.LandlordShardRouter()
+        self.assertFalse(router.allow_migrate('shard_2', 'dashboard'))
+        self.assertTrue(router.allow_migrate('shard_2', 'dashboard', shard_aware=True))
+        self.assertIsNone(router.allow_migrate('shard_2', 'dashboard', model_name='property'))
+        self.assertIsNone(router.allow_migrate('default', 'dashboard'))
+
+        landlord = self.make_landlord('counted@example.com', 'shard_2')
+        Property.objects.using('shard_2').create(landlord=landlord, address='Unit 1', monthly_rent=Decimal('900.00'), is_vacant=True)
+        LandlordPortfolio.objects.using('shard_2').all().delete()
+        backfill = import_module('dashboard.migrations.0008_backfill_portfolios_per_database').backfill_portfolios
+        for _ in range(2):
+            backfill(django_apps, SimpleNamespace(connection=connections['shard_2']))
+        portfolio = LandlordPortfolio.objects.using('shard_2').get()
+        self.assertEqual((portfolio.landlord_id, portfolio.property_count, portfolio.vacant_count), (landlord.id, 1, 1))
+
+    def test_requests_are_routed_to_the_landlords_shard(self):
+        first = self.make_landlord('first@example.com', 'shard_1')
+        second = self.make_landlord('second@example.com', 'shard_2')
+        # Users live on default and are copied to every shard
+        self.assertTrue(User.objects.using('shard_2').filter(pk=first.pk).exists())
+
+        for landlord, alias in ((first, 'shard_1'), (second, 'shard_2')):
+            self.authenticate(landlord)
+            response = self.client.post(reverse('property-create'), {'address': f'{alias} house', 'monthly_rent': '1000.00', 'is_vacant': True})
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertGreaterEqual(response.data['property']['id'], sharding.shard_number(alias) * sharding.SHARD_ID_SPACING)
+            self.assertEqual(self.client.get(reverse('property-count')).data['property_count'], 1)
+            self.assertEqual([row['address'] for row in self.client.get(reverse('property-list')).data['properties']], [f'{alias} house'])
+
+        self.assertEqual(list(Property.objects.using('shard_1').values_list('landlord_id', flat=True)), [first.id])
+        self.assertEqual(list(Property.objects.using('shard_2').values_list('landlord_id', flat=True)), [second.id])
+        self.assertFalse(Property.objects.using('default').exists())
+
+    def test_tenant_profile_follows_the_unit(self):
+        landlord = self.make_landlord('owner@example.com', 'shard_2')
+        unit = Property.objects.using('shard_2').create(landlord=landlord, address='Unit 1', monthly_rent=Decimal('900.00'), is_vacant=True)
+        tenant_user = User.objects.create_user(email='mover@example.com', password='x', tenant=True)
+        # New profiles start on the first shard
+        self.assertTrue(Tenant.objects.using('shard_1').filter(user=tenant_user).exists())
+
+        self.authenticate(tenant_user)
+        self.assertEqual([row['id'] for row in self.client.get(reverse('available-properties')).data], [unit.id])
+        response = self.client.post(reverse('assign-tenant'), {'property_id': unit.id})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertFalse(Tenant.objects.using('shard_1').filter(user=tenant_user).exists())
+        self.assertEqual(Tenant.objects.using('shard_2').get(user=tenant_user).property_id, unit.id)
+
+        response = self.client.get(reverse('tenant-data'))
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['property_address'], 'Unit 1')
+
+    def test_payment_stream_finds_tenants_on_any_shard(self):
+        landlord = self.make_landlord('owner@example.com', 'shard_2')
+        unit = Property.objects.using('shard_2').create(landlord=landlord, address='Unit 1', monthly_rent=Decimal('900.00'), is_vacant=True)
+        tenant_user = User.objects.create_user(email='streamer@example.com', password='x', tenant=True)
+        sharding.move_tenant_profiles([tenant_user.pk], 'shard_2')
+        Tenant.objects.using('shard_2').filter(user=tenant_user).update(property=unit)
+
+        response = self.client.get(reverse('payment_status_stream'), {'token': str(AccessToken.for_user(tenant_user))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            PaymentStatusStreamView()._channel(tenant_user),
+            tenant_channel(Tenant.objects.using('shard_2').get(user=tenant_user).id),
+        )
+
+    def test_status_changes_publish_after_the_shard_commits(self):
+        landlord = self.make_landlord('owner@example.com', 'shard_2')
+        tenant_user = User.objects.create_user(email='payer@example.com', password='x', tenant=True)
+        sharding.move_tenant_profiles([tenant_user.pk], 'shard_2')
+        with sharding.using_shard('shard_2'):
+            unit = Property.objects.create(landlord=landlord, address='Unit 1', monthly_rent=Decimal('900.00'))
+            payment = Payment.objects.create(tenant=Tenant.objects.get(user=tenant_user), property_t=unit, amount=Decimal('900.00'))
+
+        with mock.patch('payments.streams.get_broker') as get_broker, \
+                self.captureOnCommitCallbacks(using='default', execute=True), \
+                self.captureOnCommitCallbacks(using='shard_2', execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic(using='shard_2'):
+                payment.status = 'completed'
+                payment.save()
+                raise RuntimeError('rolled back')
+        get_broker.return_value.publish.assert_not_called()
+
+        payment = Payment.objects.using('shard_2').get(pk=payment.pk)
+        with mock.patch('payments.streams.get_broker') as get_broker, \
+                self.captureOnCommitCallbacks(using='shard_2', execute=True):
+            payment.status = 'completed'
+            payment.save()
+        self.assertEqual(get_broker.return_value.publish.call_count, 2)
+
+    def test_interrupted_event_batch_is_replayed_exactly_once(self):
+        payments = {}
+        for alias in ('shard_1', 'shard_2'):
+            landlord = self.make_landlord(f'{alias}-owner@example.com', alias)
+            tenant_user = User.objects.create_user(email=f'{alias}-payer@example.com', password='x', tenant=True)
+            sharding.move_tenant_profiles([tenant_user.pk], alias)
+            with sharding.using_shard(alias):
+                unit = Property.objects.create(landlord=landlord, address=f'{alias} unit', monthly_rent=Decimal('900.00'))
+                payments[alias] = Payment.objects.create(
+                    tenant=Tenant.objects.get(user=tenant_user), property_t=unit, amount=Decimal('900.00'),
+                    stripe_payment_intent_id=f'pi_{alias}',
+                )
+        events = [
+            {'id': f'evt_{alias}', 'type': 'payment_intent.succeeded', 'data': {'object': {'id': f'pi_{alias}'}}}
+            for alias in ('shard_1', 'shard_2')
+        ] + [{'id': 'evt_unknown', 'type': 'payment_intent.succeeded', 'data': {'object': {'id': 'pi_unknown'}}}]
+        real_change_for = change_for
+
+        def crash_on_shard_2(payment, *args):
+            if payment._state.db == 'shard_2':
+                raise RuntimeError('worker killed')
+            return real_change_for(payment, *args)
+
+        # default and shard_1 commit, then the batch dies on shard_2
+        with mock.patch('payments.events.change_for', side_effect=crash_on_shard_2), self.assertRaises(RuntimeError):
+            # A savepoint stands in for shard_2's own transaction inside the test's
+            with transaction.atomic(using='shard_2'):
+                process_events(events)
+        self.assertEqual(list(ProcessedStripeEvent.objects.using('shard_1').values_list('event_id', flat=True)), ['evt_shard_1'])
+        self.assertEqual(Payment.objects.using('shard_2').get(pk=payments['shard_2'].pk).status, 'pending')
+
+        # Only shard_2's event is left to apply
+        self.assertEqual(process_events(events), (1, 1))
+        self.assertEqual(process_events(events), (0, 0))
+        for alias, payment in payments.items():
+            self.assertEqual(Payment.objects.using(alias).get(pk=payment.pk).status, 'completed')
+            self.assertEqual(PaymentChange.objects.using(alias).filter(payment_id=payment.pk, status='completed').count(), 1)
+            self.assertEqual(list(ProcessedStripeEvent.objects.using(alias).values_list('event_id', flat=True)), [f'evt_{alias}'])
+        self.assertEqual(list(ProcessedStripeEvent.objects.values_list('event_id', flat=True)), ['evt_unknown'])
+
+    def test_batch_jobs_cover_every_shard(self):
+        today = timezone.now().date()
+        for alias in ('shard_1', 'shard_2'):
+            landlord = self.make_landlord(f'{alias}-owner@example.com', alias)
+            tenant_user = User.objects.create_user(email=f'{alias}-resident@example.com', password='x', tenant=True)
+            sharding.move_tenant_profiles([tenant_user.pk], alias)
+            with sharding.using_shard(alias):
+                unit = Property.objects.create(landlord=landlord, address=f'{alias} unit', monthly_rent=Decimal('800.00'))
+                Tenant.objects.filter(user=tenant_user).update(property=unit, lease_start=today - timedelta(days=400), lease_end=today + timedelta(days=30))
+                tenant = Tenant.objects.get(user=tenant_user)
+                payment = Payment.objects.create(tenant=tenant, property_t=unit, amount=Decimal('100.00'), status='completed')
+                Payment.objects.filter(pk=payment.pk).update(date=timezone.now() - timedelta(days=400))
+
+        self.assertEqual(run_billing(today), 2)
+        self.assertEqual(archive_payments(), 2)
+        self.assertEqual(snapshot_arrears(today), 2)
+        self.assertEqual(take_portfolio_snapshots(today), 2)
+        for alias in ('shard_1', 'shard_2'):
+            self.assertEqual(RentCharge.objects.using(alias).count(), 1)
+            self.assertEqual(PaymentArchive.objects.using(alias).count(), 1)
+            self.assertEqual(ArrearsSnapshot.objects.using(alias).count(), 1)
+            self.assertEqual(PortfolioSnapshot.objects.using(alias).count(), 1)
+
+    def test_admin_browses_one_shard_at_a_time(self):
+        first = self.make_landlord('first@example.com', 'shard_1')
+        second = self.make_landlord('second@example.com', 'shard_2')
+        Property.objects.using('shard_1').create(landlord=first, address='First house', monthly_rent=Decimal('900.00'))
+        house = Property.objects.using('shard_2').create(landlord=second, address='Second house', monthly_rent=Decimal('900.00'))
+        self.client.force_login(User.objects.create_superuser(email='support@example.com', password='x'))
+
+        url = reverse('admin:dashboard_property_changelist')
+        self.assertEqual([row.address for row in self.client.get(url).context['cl'].result_list], ['First house'])
+        self.assertEqual([row.address for row in self.client.get(url, {'shard': 'shard_2'}).context['cl'].result_list], ['Second house'])
+        # The choice sticks for the rest of the session
+        self.assertEqual(self.client.get(reverse('admin:dashboard_property_change', args=[house.pk])).status_code, 200)
+
+    @override_settings(DELTA_SYNC_OVERLAP_SECONDS=0)
+    def test_delta_sync_follows_a_rebalanced_landlord(self):
+        landlord = self.make_landlord('synced@example.com', 'shard_1')
+        tenant_user = User.objects.create_user(email='synced-resident@example.com', password='x', tenant=True)
+        with sharding.using_shard('shard_1'):
+            unit = Property.objects.create(landlord=landlord, address='Unit 9', monthly_rent=Decimal('800.00'))
+            Tenant.objects.filter(user=tenant_user).update(property=unit)
+            tenant = Tenant.objects.get(user=tenant_user)
+            payment = Payment.objects.create(tenant=tenant, property_t=unit, amount=Decimal('800.00'), status='completed')
+
+        self.authenticate(landlord)
+        watermark = self.client.get(reverse('property-list')).data['watermark']
+        self.authenticate(tenant_user)
+        payments_watermark = self.client.get(reverse('payment_list'), {'tenant_id': tenant.id})['X-Sync-Watermark']
+
+        call_command('rebalance_shards', landlord=landlord.id, to='shard_2', stdout=StringIO())
+
+        self.authenticate(landlord)
+        data = self.client.get(reverse('property-list'), {'since': watermark}).data
+        moved = Property.objects.using('shard_2').get(landlord=landlord)
+        self.assertEqual([row['id'] for row in data['properties']], [moved.id])
+        self.assertEqual(data['deleted'], [unit.id])
+        self.authenticate(tenant_user)
+        data = self.client.get(reverse('payment_list'), {'tenant_id': tenant.id, 'since': payments_watermark}).data
+        self.assertEqual(data['deleted'], [payment.id])
+
+    def test_change_feed_follows_a_rebalanced_landlord(self):
+        landlord = self.make_landlord('feed@example.com', 'shard_2')
+        tenant_user = User.objects.create_user(email='feed-resident@example.com', password='x', tenant=True)
+        sharding.move_tenant_profiles([tenant_user.pk], 'shard_2')
+        with sharding.using_shard('shard_2'):
+            unit = Property.objects.create(landlord=landlord, address='Unit 3', monthly_rent=Decimal('800.00'))
+            Tenant.objects.filter(user=tenant_user).update(property=unit)
+            payment = Payment.objects.create(tenant=Tenant.objects.get(user=tenant_user), property_t=unit, amount=Decimal('800.00'))
+            payment.status = 'completed'
+            payment.save()
+
+        self.authenticate(landlord)
+        page = self.client.get(reverse('payment_changes')).data['data']
+        self.assertEqual([change['status'] for change in page['changes']], ['pending', 'completed'])
+        self.assertFalse(page['reset'])
+
+        call_command('rebalance_shards', landlord=landlord.id, to='shard_1', stdout=StringIO())
+        self.assertFalse(PaymentChange.objects.using('shard_2').exists())
+        moved = Payment.objects.using('shard_1').get()
+        with sharding.using_shard('shard_1'):
+            moved.status = 'failed'
+            moved.save()
+
+        page = self.client.get(reverse('payment_changes'), {'after': page['next']}).data['data']
+        self.assertTrue(page['reset'])
+        self.assertEqual(
+            [(change['payment_id'], change['status']) for change in page['changes']],
+            [(moved.id, 'pending'), (moved.id, 'completed'), (moved.id, 'failed')],
+        )
+        page = self.client.get(reverse('payment_changes'), {'after': page['next']}).data['data']
+        self.assertEqual((page['changes'], page['reset']), ([], False))
+
+    def test_rebalance_moves_a_landlord_with_history(self):
+        landlord = self.make_landlord('moving@example.com', 'shard_1')
+        tenant_user = User.objects.create_user(email='resident@example.com', password='x', tenant=True)
+        with sharding.using_shard('shard_1'):
+            unit = Property.objects.create(landlord=landlord, address='Unit 7', monthly_rent=Decimal('800.00'))
+            Tenant.objects.filter(user=tenant_user).update(property=unit)
+            tenant = Tenant.objects.get(user=tenant_user)
+            payment = Payment.objects.create(tenant=tenant, property_t=unit, amount=Decimal('800.00'), status='completed')
+            Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(days=40))
+
+        out = StringIO()
+        call_command('rebalance_shards', landlord=landlord.id, to='shard_2', stdout=out)
+        self.assertIn('1 payments.Payment', out.getvalue())
+
+        self.assertFalse(Property.objects.using('shard_1').filter(landlord=landlord).exists())
+        self.assertFalse(Payment.objects.using('shard_1').exists())
+        moved = Payment.objects.using('shard_2').select_related('tenant', 'property_t').get()
+        self.assertEqual((moved.tenant.user_id, moved.property_t.address), (tenant_user.id, 'Unit 7'))
+        self.assertLess(moved.created_at, timezone.now() - timedelta(days=39))
+        self.assertEqual(sharding.shard_for_landlord(landlord.id), 'shard_2')
+
+        self.authenticate(landlord)
+        data = self.client.get(reverse('landlord-data')).data['data']
+        self.assertEqual((data['total_properties'], data['total_tenants']), (1, 1))
+        self.authenticate(tenant_user)
+        self.assertEqual(self.client.get(reverse('tenant-data')).data['property_address'], 'Unit 7')
+
+        with self.assertRaises(CommandError):
+            call_command('rebalance_shards', landlord=landlord.id, to='shard_9', stdout=StringIO())
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import TenantDataView, LandlordDataView, PropertyCreateView, PropertyCountView, PropertyListView, BulkPropertyCreateView
+from .views import TenantDataView, LandlordDataView, PropertyCreateView, PropertyCountView, PropertyListView, BulkPropertyCreateView, PortfolioTrendView, BatchView, BulkTenantAssignmentView
 
 urlpatterns = [
     path('auth/tenant_data', TenantDataView.as_view(), name='tenant-data'),
@@ -8,5 +8,8 @@ urlpatterns = [
     path('properties/count/', PropertyCountView.as_view(), name='property-count'),
     path('properties/', PropertyListView.as_view(), name='property-list'),
     path('properties/bulk-create/', BulkPropertyCreateView.as_view(), name='property-bulk-create'),
+    path('properties/bulk-assign-tenants/', BulkTenantAssignmentView.as_view(), name='property-bulk-assign-tenants'),
+    path('analytics/portfolio/', PortfolioTrendView.as_view(), name='portfolio-trends'),
+    path('batch/', BatchView.as_view(), name='batch'),
     # Add other URLs as needed
 ]
@@ -2,10 +2,18 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import generics
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .serializers import TenantDashboardSerializer, LandlordDashboardSerializer, PropertyCreateSerializer, PropertyListSerializer
-from .models import Property
+from .serializers import TenantDashboardSerializer, LandlordDashboardSerializer, PropertyCreateSerializer, PropertyListSerializer, TenantAssignmentRowSerializer
+from .models import PortfolioSnapshot, Property, Tenant
+from .analytics import SNAPSHOT_FIELDS
+from .assignments import UnitsTaken, assign_tenants
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
+from django.utils import timezone
+from datetime import timedelta
+from . import batch, delta, portfolio, sharding
+from .portfolio import get_portfolio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,16 +24,17 @@ class TenantDataView(APIView):
     
     def get(self, request):
         try:
-            tenant = request.user.tenant_profile
+            tenant = Tenant.objects.select_related('user', 'property').get(user=request.user)
             serializer = TenantDashboardSerializer(tenant)
             return Response(serializer.data)
-        except AttributeError:
+        except (Tenant.DoesNotExist, AttributeError):
             return Response(
                 {"error": "User is not a tenant"}, 
                 status=403
             )
 
 class LandlordDataView(APIView):
+    throttle_scope = 'expensive'
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
@@ -64,8 +73,10 @@ class PropertyCreateView(generics.CreateAPIView):
     serializer_class = PropertyCreateSerializer
     
     def perform_create(self, serializer):
-        # Automatically set the landlord to the current user
-        serializer.save(landlord=self.request.user)
+        # Automatically set the landlord to the current user; the portfolio
+        # counters are bumped by a signal in the same transaction
+        with sharding.atomic():
+            serializer.save(landlord=self.request.user)
     
     def create(self, request, *args, **kwargs):
         try:
@@ -94,7 +105,7 @@ class PropertyCountView(APIView):
     
     def get(self, request):
         try:
-            property_count = request.user.properties.count()
+            property_count = get_portfolio(request.user).property_count
             return Response({
                 'has_properties': property_count > 0,
                 'property_count': property_count
@@ -107,17 +118,39 @@ class PropertyCountView(APIView):
             )
 
 class PropertyListView(APIView):
-    """Get all properties for the authenticated landlord with tenant information"""
+    """
+    Get all properties for the authenticated landlord with tenant information.
+    With ?since=<watermark> only properties changed since then are returned,
+    plus the ids of deleted ones; every response carries the next watermark.
+    """
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
         try:
-            properties = request.user.properties.all().order_by('-id')
+            since = delta.parse_since(request)
+        except delta.InvalidWatermark as e:
+            return Response(
+                {"success": False, "error": str(e)}, 
+                status=400
+            )
+        try:
+            started = timezone.now()
+            full = since is None or delta.needs_full_sync(since)
+            properties = request.user.properties.prefetch_related(
+                Prefetch('tenants', queryset=Tenant.objects.select_related('user').order_by('id'))
+            ).order_by('-id')
+            if not full:
+                properties = properties.filter(updated_at__gt=since)
             serializer = PropertyListSerializer(properties, many=True)
-            return Response({
+            data = {
                 'success': True,
-                'properties': serializer.data
-            })
+                'properties': serializer.data,
+                'watermark': delta.watermark(started),
+            }
+            if since is not None:
+                data['full'] = full
+                data['deleted'] = [] if full else delta.deleted_since(Property, since, landlord_id=request.user.id)
+            return Response(data)
         except Exception as e:
             logger.error(f"Error getting properties: {str(e)}")
             return Response(
@@ -127,6 +160,7 @@ class PropertyListView(APIView):
 
 class BulkPropertyCreateView(APIView):
     """Create multiple properties at once for landlords"""
+    throttle_scope = 'bulk'
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
@@ -138,30 +172,26 @@ class BulkPropertyCreateView(APIView):
                     'error': 'No properties provided'
                 }, status=400)
             
-            created_properties = []
+            valid_properties = []
             errors = []
             
             for index, property_data in enumerate(properties_data):
-                try:
-                    # Ensure landlord is set
-                    property_data['landlord'] = request.user.id
-                    serializer = PropertyCreateSerializer(data=property_data)
-                    if serializer.is_valid():
-                        property_obj = serializer.save(landlord=request.user)
-                        created_properties.append(serializer.data)
-                    else:
-                        errors.append({
-                            'index': index,
-                            'data': property_data,
-                            'errors': serializer.errors
-                        })
-                except Exception as e:
+                serializer = PropertyCreateSerializer(data=property_data)
+                if serializer.is_valid():
+                    valid_properties.append(Property(landlord=request.user, **serializer.validated_data))
+                else:
                     errors.append({
                         'index': index,
                         'data': property_data,
-                        'error': str(e)
+                        'errors': serializer.errors
                     })
             
+            # One INSERT for all valid rows and one counter update, together
+            with sharding.atomic():
+                created = Property.objects.bulk_create(valid_properties)
+                portfolio.properties_added(request.user.id, created)
+            created_properties = PropertyCreateSerializer(created, many=True).data
+            
             # Always return 201 for successful creation, even with partial success
             return Response({
                 'success': len(errors) == 0,
@@ -179,3 +209,110 @@ class BulkPropertyCreateView(APIView):
                 'error': 'Failed to create properties'
             }, status=500)
 
+
+class PortfolioTrendView(APIView):
+    """Daily analytics snapshots for the landlord's trend charts"""
+    throttle_scope = 'expensive'
+    permission_classes = [IsAuthenticated]
+    MAX_DAYS = 366
+    
+    def get(self, request):
+        if not getattr(request.user, 'landlord', False):
+            return Response(
+                {"success": False, "error": "User is not a landlord"}, 
+                status=403
+            )
+        try:
+            days = int(request.query_params.get('days', 90))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= self.MAX_DAYS:
+            return Response(
+                {"success": False, "error": f"days must be between 1 and {self.MAX_DAYS}"}, 
+                status=400
+            )
+        
+        # One range scan on the (landlord, date) unique index, at most MAX_DAYS rows
+        since = timezone.now().date() - timedelta(days=days - 1)
+        snapshots = PortfolioSnapshot.objects.filter(landlord=request.user, date__gte=since).order_by('date')
+        return Response({
+            'success': True,
+            'snapshots': list(snapshots.values('date', *SNAPSHOT_FIELDS))
+        })
+
+
+class BatchView(APIView):
+    """
+    Run several GET requests in one round trip:
+    {"requests": ["/auth/landlord", "/properties/count/", "/properties/?page=2"]}
+    Each result carries the sub-request's own status code and body.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        paths = request.data.get('requests') if isinstance(request.data, dict) else None
+        if not isinstance(paths, list) or not paths:
+            return Response(
+                {"success": False, "error": "requests must be a non-empty list of paths"}, 
+                status=400
+            )
+        if len(paths) > settings.BATCH_MAX_REQUESTS:
+            return Response(
+                {"success": False, "error": f"At most {settings.BATCH_MAX_REQUESTS} requests per batch"}, 
+                status=400
+            )
+        
+        return Response({
+            'success': True,
+            'responses': [batch.dispatch(request, path, BatchView) for path in paths]
+        })
+
+
+class BulkTenantAssignmentView(APIView):
+    """
+    Move many tenants into the landlord's vacant units at once:
+    {"assignments": [{"email": ..., "property_id": ..., "lease_start": ..., "lease_end": ...}]}
+    Valid rows are applied together; every row gets a result.
+    """
+    throttle_scope = 'bulk'
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        if not getattr(request.user, 'landlord', False):
+            return Response(
+                {"success": False, "error": "User is not a landlord"}, 
+                status=403
+            )
+        rows = request.data.get('assignments') if isinstance(request.data, dict) else None
+        if not isinstance(rows, list) or not rows:
+            return Response({
+                'success': False,
+                'error': 'No assignments provided'
+            }, status=400)
+        
+        results = [None] * len(rows)
+        valid = []
+        for index, row in enumerate(rows):
+            serializer = TenantAssignmentRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'status': 'error', 'errors': serializer.errors}
+        
+        try:
+            applied = assign_tenants(request.user, [data for _, data in valid])
+        except UnitsTaken as e:
+            return Response({
+                'success': False,
+                'error': f'{e}; nothing was assigned, please retry'
+            }, status=409)
+        for (index, _), result in zip(valid, applied):
+            results[index] = result
+        
+        assigned = sum(1 for result in results if result['status'] == 'assigned')
+        return Response({
+            'success': assigned == len(rows),
+            'results': [{'index': index, **result} for index, result in enumerate(results)],
+            'total_assigned': assigned,
+            'total_errors': len(rows) - assigned
+        })
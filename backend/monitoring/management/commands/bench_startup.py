@@ -0,0 +1,50 @@
+import json
+import statistics
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from monitoring.startup import probe_startup
+
+STAGES = ('setup', 'first_request', 'second_request', 'total')
+
+
+class Command(BaseCommand):
+    help = (
+        'Time cold starts in fresh interpreters: django.setup() and the first requests. '
+        'With --history, results are appended to a JSON-lines file and compared with the previous run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/auth/available-properties/', help='URL of the first request')
+        parser.add_argument('--history', help='JSON-lines file to append this run to')
+
+    def handle(self, *args, **options):
+        probes = [probe_startup(options['path']) for _ in range(max(options['runs'], 1))]
+        result = {
+            'at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'runs': len(probes),
+            'median_ms': {stage: round(statistics.median(probe[stage] for probe in probes) * 1000, 1) for stage in STAGES},
+            'loaded': probes[-1]['loaded'],
+        }
+
+        previous = None
+        if options['history']:
+            try:
+                with open(options['history']) as history:
+                    lines = history.read().splitlines()
+                previous = json.loads(lines[-1]) if lines else None
+            except FileNotFoundError:
+                pass
+            with open(options['history'], 'a') as history:
+                history.write(json.dumps(result) + '\n')
+
+        self.stdout.write(f"Cold start over {result['runs']} runs (GET {options['path']} -> {probes[-1]['status']}):")
+        for stage in STAGES:
+            line = f"  {stage:<15} {result['median_ms'][stage]:>8.1f} ms"
+            if previous:
+                line += f"  ({result['median_ms'][stage] - previous['median_ms'][stage]:+.1f} ms vs {previous['at']})"
+            self.stdout.write(line)
+        if result['loaded']:
+            self.stdout.write(self.style.WARNING(f"Loaded by the first request: {', '.join(result['loaded'])}"))
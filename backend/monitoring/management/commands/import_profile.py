@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from monitoring.startup import import_profile, summarize_by_package
+
+
+class Command(BaseCommand):
+    help = "Report what django.setup() and the URLconf spend importing, per package and per module"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Rows per table')
+        parser.add_argument('--setup-only', action='store_true',
+                            help='Stop after django.setup() (what migrate and workers load before any view)')
+
+    def handle(self, *args, **options):
+        entries = import_profile(load_urls=not options['setup_only'])
+        total = sum(entry.self_us for entry in entries)
+        self.stdout.write(f"{len(entries)} modules imported in {total / 1000:.0f} ms\n")
+
+        self.stdout.write(f"{'package':<40} {'self ms':>9} {'share':>7}")
+        for package, self_us in summarize_by_package(entries)[:options['top']]:
+            self.stdout.write(f"{package:<40} {self_us / 1000:>9.1f} {self_us / total:>7.1%}")
+
+        self.stdout.write(f"\n{'module (incl. its imports)':<40} {'cum. ms':>9} {'self ms':>9}")
+        # Only the outermost imports: their cumulative time already covers the nested ones
+        top_level = sorted((entry for entry in entries if entry.depth == 0), key=lambda entry: entry.cumulative_us, reverse=True)
+        for entry in top_level[:options['top']]:
+            self.stdout.write(f"{entry.name:<40} {entry.cumulative_us / 1000:>9.1f} {entry.self_us / 1000:>9.1f}")
@@ -0,0 +1,75 @@
+import time
+from contextlib import contextmanager
+
+from .registry import REGISTRY
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds',
+    'Request latency by URL name and method.',
+    ('url_name', 'method'),
+)
+REQUESTS = REGISTRY.counter(
+    'http_requests',
+    'Requests served by URL name, method and status code.',
+    ('url_name', 'method', 'status'),
+)
+REQUEST_QUERIES = REGISTRY.histogram(
+    'http_request_db_queries',
+    'Database queries executed per request by URL name.',
+    ('url_name',),
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+DB_QUERIES = REGISTRY.counter(
+    'db_queries',
+    'Database queries executed while serving requests by URL name.',
+    ('url_name',),
+)
+STRIPE_LATENCY = REGISTRY.histogram(
+    'stripe_api_duration_seconds',
+    'Stripe API call latency by operation.',
+    ('operation',),
+)
+STRIPE_CALLS = REGISTRY.counter(
+    'stripe_api_calls',
+    'Stripe API calls by operation and outcome.',
+    ('operation', 'outcome'),
+)
+WEBHOOK_LAG = REGISTRY.histogram(
+    'stripe_webhook_lag_seconds',
+    'Delay between a Stripe event being created and our webhook processing it.',
+    ('event_type',),
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'cache_requests',
+    'Cache lookups by cache name and result (hit or miss).',
+    ('cache', 'result'),
+)
+THROTTLED_REQUESTS = REGISTRY.counter(
+    'throttled_requests',
+    'Requests rejected by rate limiting by throttle scope.',
+    ('scope',),
+)
+
+
+@contextmanager
+def observe_stripe_call(operation):
+    """Time a Stripe API call and count it as a success or an error"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'success'
+    finally:
+        STRIPE_LATENCY.observe(time.perf_counter() - started, operation=operation)
+        STRIPE_CALLS.inc(operation=operation, outcome=outcome)
+
+
+def observe_webhook_lag(event_type, created):
+    """`created` is the Stripe event's unix timestamp"""
+    if created:
+        WEBHOOK_LAG.observe(max(0.0, time.time() - float(created)), event_type=event_type)
+
+
+def record_cache_access(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
@@ -0,0 +1,41 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .metrics import DB_QUERIES, REQUEST_LATENCY, REQUEST_QUERIES, REQUESTS
+
+
+class QueryCounter:
+    """Database execute wrapper that only counts statements"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """Records latency, status and query count for every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.view_name if match else None) or 'unmatched'
+        REQUEST_LATENCY.observe(elapsed, url_name=url_name, method=request.method)
+        REQUESTS.inc(url_name=url_name, method=request.method, status=response.status_code)
+        REQUEST_QUERIES.observe(counter.count, url_name=url_name)
+        DB_QUERIES.inc(counter.count, url_name=url_name)
+        return response
@@ -0,0 +1,100 @@
+"""
+Cold-start measurements, taken in fresh interpreters so nothing already
+imported by the calling process skews them.
+
+import_profile() runs `python -X importtime` over django.setup() (and the
+URLconf, which is what pulls in the views) and returns per-module import
+cost. probe_startup() times the stages of a cold start up to the first
+served request; the bench_startup command records those over time.
+"""
+import json
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+
+SETUP_SCRIPT = """
+import json, os, sys, time
+sys.path.insert(0, {base_dir!r})
+os.environ['DJANGO_SETTINGS_MODULE'] = {settings_module!r}
+started = time.perf_counter()
+import django
+django.setup()
+"""
+
+IMPORT_SCRIPT = SETUP_SCRIPT + """
+if {load_urls!r}:
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+"""
+
+PROBE_SCRIPT = SETUP_SCRIPT + """
+setup_done = time.perf_counter()
+from django.test import Client
+client = Client(HTTP_HOST='localhost')
+timings = {{'setup': setup_done - started}}
+for stage in ('first_request', 'second_request'):
+    before = time.perf_counter()
+    status = client.get({path!r}).status_code
+    timings[stage] = time.perf_counter() - before
+timings['total'] = time.perf_counter() - started
+timings['status'] = status
+timings['loaded'] = sorted(name for name in {watch!r} if name in sys.modules)
+print(json.dumps(timings))
+"""
+
+# Heavy optional integrations that should only load when actually used
+WATCHED_MODULES = ('stripe', 'numpy')
+
+
+@dataclass
+class ImportEntry:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    @property
+    def package(self):
+        return self.name.split('.')[0]
+
+
+def _run(script, importtime=False):
+    options = ['-X', 'importtime'] if importtime else []
+    return subprocess.run([sys.executable, *options, '-c', script], capture_output=True, text=True, check=True)
+
+
+def _script(template, **kwargs):
+    return template.format(base_dir=str(settings.BASE_DIR), settings_module=settings.SETTINGS_MODULE, **kwargs)
+
+
+def parse_importtime(text):
+    """Parse `-X importtime` output ("import time: self | cumulative | name") into ImportEntry rows"""
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        entries.append(ImportEntry(name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def summarize_by_package(entries):
+    """Total self time per top-level package, most expensive first"""
+    totals = defaultdict(int)
+    for entry in entries:
+        totals[entry.package] += entry.self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def import_profile(load_urls=True):
+    return parse_importtime(_run(_script(IMPORT_SCRIPT, load_urls=load_urls), importtime=True).stderr)
+
+
+def probe_startup(path='/'):
+    """Stage timings (seconds) of one cold start, plus which WATCHED_MODULES ended up loaded"""
+    result = _run(_script(PROBE_SCRIPT, path=path, watch=WATCHED_MODULES))
+    return json.loads(result.stdout.strip().splitlines()[-1])
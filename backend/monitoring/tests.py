@@ -0,0 +1,139 @@
+import time
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from dashboard.testing import QueryBudgetTestCase
+from .metrics import CACHE_REQUESTS, REQUEST_LATENCY, STRIPE_CALLS, THROTTLED_REQUESTS, observe_stripe_call, observe_webhook_lag, record_cache_access
+from .registry import REGISTRY, Registry
+from .startup import parse_importtime, probe_startup, summarize_by_package
+from .throttling import LocalBucketStore, parse_rate
+
+
+class RegistryTests(SimpleTestCase):
+
+    def test_counter_and_histogram_render_prometheus_text(self):
+        registry = Registry()
+        requests = registry.counter('jobs', 'Jobs run.', ('queue',))
+        latency = registry.histogram('job_seconds', 'Job latency.', ('queue',), buckets=(0.1, 1))
+        requests.inc(queue='rent')
+        requests.inc(2, queue='rent')
+        latency.observe(0.05, queue='rent')
+        latency.observe(0.5, queue='rent')
+        latency.observe(5, queue='rent')
+
+        text = registry.render()
+
+        self.assertIn('# TYPE jobs counter', text)
+        self.assertIn('jobs_total{queue="rent"} 3', text)
+        self.assertIn('job_seconds_bucket{queue="rent",le="0.1"} 1', text)
+        self.assertIn('job_seconds_bucket{queue="rent",le="1"} 2', text)
+        self.assertIn('job_seconds_bucket{queue="rent",le="+Inf"} 3', text)
+        self.assertIn('job_seconds_count{queue="rent"} 3', text)
+
+    def test_labels_must_match_declaration(self):
+        counter = Registry().counter('jobs', 'Jobs run.', ('queue',))
+        with self.assertRaises(ValueError):
+            counter.inc(worker='a')
+
+    def test_stripe_call_outcomes(self):
+        REGISTRY.clear()
+        with observe_stripe_call('create'):
+            pass
+        with self.assertRaises(RuntimeError):
+            with observe_stripe_call('create'):
+                raise RuntimeError('timeout')
+
+        self.assertEqual(STRIPE_CALLS.value(operation='create', outcome='success'), 1)
+        self.assertEqual(STRIPE_CALLS.value(operation='create', outcome='error'), 1)
+
+    def test_webhook_lag_and_cache_ratio(self):
+        REGISTRY.clear()
+        observe_webhook_lag('payment_intent.succeeded', time.time() - 30)
+        record_cache_access('income', hit=True)
+        record_cache_access('income', hit=False)
+
+        self.assertIn('stripe_webhook_lag_seconds_bucket{event_type="payment_intent.succeeded",le="60"} 1', REGISTRY.render())
+        self.assertEqual(CACHE_REQUESTS.value(cache='income', result='hit'), 1)
+
+
+class MetricsEndpointTests(TestCase):
+
+    def test_requests_are_recorded_per_url_name(self):
+        REGISTRY.clear()
+        self.client.get(reverse('available-properties'))
+
+        self.assertEqual(REQUEST_LATENCY.count(url_name='available-properties', method='GET'), 1)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('http_requests_total{url_name="available-properties",method="GET",status="401"} 1', response.content.decode())
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_external_callers_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_bucket_allows_bursts_then_refills_at_the_rate(self):
+        store = LocalBucketStore()
+        capacity, refill_rate = parse_rate('2/s')
+        self.assertEqual([store.take('k', capacity, refill_rate, 0.0) for _ in range(3)], [0.0, 0.0, 0.5])
+        self.assertEqual(store.take('k', capacity, refill_rate, 0.5), 0.0)
+        self.assertEqual(store.take('other', capacity, refill_rate, 0.5), 0.0)
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        store = LocalBucketStore(max_keys=2)
+        for key in 'abc':
+            store.take(key, 1, 1.0, 0.0)
+        self.assertEqual(store.take('a', 1, 1.0, 0.0), 0.0)
+        self.assertEqual(store.take('c', 1, 1.0, 0.0), 1.0)
+
+
+THROTTLE_SCOPES = {'default': {'user': '100/min', 'anon': None}, 'expensive': {'user': '2/min', 'anon': None}}
+
+
+@override_settings(THROTTLE_SCOPES=THROTTLE_SCOPES)
+class ThrottlingTests(QueryBudgetTestCase):
+
+    def get(self, landlord, name='landlord_income'):
+        self.authenticate(landlord)
+        return self.client.get(reverse(name))
+
+    def assert_scope_is_throttled_per_user(self):
+        REGISTRY.clear()
+        first, second = (portfolio.landlord for portfolio in self.portfolios)
+        self.assertEqual([self.get(first).status_code for _ in range(3)], [200, 200, 429])
+        response = self.get(first)
+        # One token every 30 seconds
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(THROTTLED_REQUESTS.value(scope='expensive'), 2)
+
+        self.assertEqual(self.get(second).status_code, 200)
+        self.assertEqual(self.get(first, 'property-count').status_code, 200)
+
+    def test_expensive_scope_is_throttled_per_user(self):
+        self.assert_scope_is_throttled_per_user()
+
+    @override_settings(THROTTLE_STORE='cache')
+    def test_buckets_can_live_in_the_shared_cache(self):
+        self.assert_scope_is_throttled_per_user()
+
+
+class StartupTests(SimpleTestCase):
+
+    def test_importtime_output_is_parsed_per_module_and_package(self):
+        entries = parse_importtime(
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |     stripe._error\n'
+            'import time:       900 |       1020 |   stripe\n'
+            'import time:        50 |         50 | payments.views\n'
+        )
+        self.assertEqual([(entry.name, entry.depth) for entry in entries], [('stripe._error', 2), ('stripe', 1), ('payments.views', 0)])
+        self.assertEqual(summarize_by_package(entries), [('stripe', 1020), ('payments', 50)])
+
+    def test_cold_start_does_not_load_heavy_integrations(self):
+        probe = probe_startup('/auth/available-properties/')
+        self.assertEqual(probe['status'], 401)
+        self.assertEqual(probe['loaded'], [])
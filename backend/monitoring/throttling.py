@@ -0,0 +1,129 @@
+"""
+Token-bucket request throttling for DRF views.
+
+Each view picks a scope with a `throttle_scope` attribute ("default" when
+unset) and THROTTLE_SCOPES gives every scope a "<requests>/<period>" rate
+for authenticated users (one bucket per user) and for anonymous requests
+(one bucket per client IP). A bucket holds up to <requests> tokens, refills
+at <requests> per <period> and each request takes one, so short bursts are
+allowed while the sustained rate stays capped. Throttled requests get a 429
+with Retry-After set to when the next token arrives.
+
+Buckets live in this process by default; set THROTTLE_STORE = 'cache' to
+share them between workers through the default cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import THROTTLED_REQUESTS
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """'30/min' -> (30 tokens of capacity, 0.5 tokens refilled per second)"""
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period.strip()[0]]
+
+
+def _refill(bucket, capacity, refill_rate, now):
+    tokens, updated = bucket or (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - updated) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+class LocalBucketStore:
+    """Buckets in a dict guarded by a lock; the least recently used are dropped past max_keys"""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_rate, now):
+        """Take a token; returns 0 if one was available, else the seconds until one is"""
+        with self._lock:
+            bucket, wait = _refill(self._buckets.pop(key, None), capacity, refill_rate, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class CacheBucketStore:
+    """Buckets in the default cache, updated under a short cache.add() lock per key"""
+    lock_attempts = 20
+
+    def take(self, key, capacity, refill_rate, now):
+        lock = f'{key}:lock'
+        for _ in range(self.lock_attempts):
+            if cache.add(lock, 1, timeout=1):
+                break
+            time.sleep(0.005)
+        else:
+            # Fail open rather than stall the request on a stuck lock
+            return 0.0
+        try:
+            bucket, wait = _refill(cache.get(key), capacity, refill_rate, now)
+            # A bucket left alone this long is full again, so it can expire
+            cache.set(key, bucket, timeout=int(capacity / refill_rate) + 1)
+            return wait
+        finally:
+            cache.delete(lock)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CacheBucketStore() if settings.THROTTLE_STORE == 'cache' else LocalBucketStore()
+    return _store
+
+
+@receiver(setting_changed)
+def reset_bucket_store(setting=None, **kwargs):
+    """Start over with empty buckets (also run when tests override throttle settings)"""
+    global _store
+    if setting in (None, 'THROTTLE_STORE', 'THROTTLE_SCOPES'):
+        _store = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    timer = time.time
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        scope = getattr(view, 'throttle_scope', 'default')
+        rates = settings.THROTTLE_SCOPES.get(scope, settings.THROTTLE_SCOPES['default'])
+        if request.user and request.user.is_authenticated:
+            kind, ident = 'user', request.user.pk
+        else:
+            kind, ident = 'anon', self.get_ident(request)
+        if not rates.get(kind):
+            return True
+
+        capacity, refill_rate = parse_rate(rates[kind])
+        wait = get_bucket_store().take(f'throttle:{scope}:{kind}:{ident}', capacity, refill_rate, self.timer())
+        if wait:
+            self.wait_seconds = wait
+            THROTTLED_REQUESTS.inc(scope=scope)
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
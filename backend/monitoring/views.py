@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .registry import REGISTRY
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_view(request):
+    """Expose process metrics in the Prometheus text format to internal callers"""
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    user = getattr(request, 'user', None)
+    if request.META.get('REMOTE_ADDR') not in allowed_ips and not (user and user.is_staff):
+        return HttpResponseForbidden('Metrics are only available internally')
+    return HttpResponse(REGISTRY.render(), content_type=PROMETHEUS_CONTENT_TYPE)
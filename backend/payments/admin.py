@@ -1,4 +1,17 @@
 from django.contrib import admin
+
+from dashboard.large_admin import LargeTableAdmin
 from .models import Payment
-# Register your models here.
-admin.site.register(Payment)
\ No newline at end of file
+
+
+@admin.register(Payment)
+class PaymentAdmin(LargeTableAdmin):
+    list_display = ('id', 'tenant', 'property_t', 'amount', 'currency', 'status', 'date')
+    list_select_related = ('tenant__user', 'property_t')
+    # status: payment_status_date_idx, date: payment_date_idx
+    list_filter = ('status', ('date', admin.DateFieldListFilter))
+    # Exact matches only, so each term is an index lookup rather than a LIKE scan
+    search_fields = ('stripe_payment_intent_id__exact', 'tenant__user__email__exact')
+    search_help_text = 'Exact Stripe payment intent id or tenant email'
+    raw_id_fields = ('tenant', 'property_t')
+    readonly_fields = ('date', 'created_at', 'updated_at')
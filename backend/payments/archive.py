@@ -0,0 +1,132 @@
+"""
+Hot/cold split of payment history.
+
+Terminal payments older than PAYMENT_ARCHIVE_AFTER_DAYS are moved in batches
+from Payment into the compact PaymentArchive table. Anything that needs the
+full history (balances, rollups, exports) reads through UnifiedPayments,
+which applies the same filters to both tables. Archived ids get DeletedRow
+tombstones so delta-synced payment lists drop them.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from dashboard import delta, sharding
+from .models import Payment, PaymentArchive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVABLE_STATUSES = ('completed', 'failed', 'canceled')
+ARCHIVED_FIELDS = [
+    'id', 'tenant_id', 'property_t_id', 'amount', 'currency', 'date', 'status',
+    'stripe_payment_intent_id', 'stripe_charge_id', 'stripe_receipt_url', 'created_at',
+]
+
+
+def archive_cutoff(days=None):
+    days = settings.PAYMENT_ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_payments(before=None, batch_size=None):
+    """
+    Move terminal payments dated before `before` into PaymentArchive.
+
+    Each batch is copied and deleted in its own short transaction, so the
+    job can be interrupted and rerun; already copied rows are skipped.
+    Returns the number of payments archived.
+    """
+    before = before or archive_cutoff()
+    batch_size = batch_size or settings.PAYMENT_ARCHIVE_BATCH_SIZE
+    archived = 0
+    for alias in sharding.each_database():
+        with sharding.using_shard(alias):
+            archived += _archive_database(before, batch_size)
+    return archived
+
+
+def _archive_database(before, batch_size):
+    """archive_payments on the database partitioned rows currently go to"""
+    candidates = Payment.objects.filter(status__in=ARCHIVABLE_STATUSES, date__lt=before).order_by('id')
+    archived = 0
+    last_id = 0
+    while True:
+        rows = list(candidates.filter(id__gt=last_id).values(*ARCHIVED_FIELDS)[:batch_size])
+        if not rows:
+            break
+        ids = [row['id'] for row in rows]
+        with sharding.atomic():
+            PaymentArchive.objects.bulk_create(
+                [PaymentArchive(**row) for row in rows], ignore_conflicts=True
+            )
+            Payment.objects.filter(id__in=ids).delete()
+            delta.record_deleted(Payment, [(row['id'], None, row['tenant_id']) for row in rows])
+        archived += len(rows)
+        last_id = ids[-1]
+        logger.info(f"Archived {archived} payments (up to id {last_id})")
+    return archived
+
+
+class UnifiedPayments:
+    """
+    Read-only view over hot and archived payments.
+
+    Filters use lookups valid on both models (tenant, property_t, status,
+    date, amount and relations through them). Only additive aggregates
+    (Sum, Count) are supported since they are computed per table and added.
+    """
+    ADDITIVE = (Sum, Count)
+
+    def __init__(self, *args, **kwargs):
+        self._args = args
+        self._kwargs = kwargs
+
+    def filter(self, *args, **kwargs):
+        return UnifiedPayments(*(self._args + args), **{**self._kwargs, **kwargs})
+
+    def _querysets(self):
+        return (
+            Payment.objects.filter(*self._args, **self._kwargs),
+            PaymentArchive.objects.filter(*self._args, **self._kwargs),
+        )
+
+    def values(self, *fields):
+        """Union of both tables as dicts; order_by() may be applied to the result"""
+        hot, cold = self._querysets()
+        fields = fields or ARCHIVED_FIELDS
+        return hot.order_by().values(*fields).union(cold.order_by().values(*fields), all=True)
+
+    def aggregate(self, **aggregates):
+        for name, aggregate in aggregates.items():
+            if not isinstance(aggregate, self.ADDITIVE) or getattr(aggregate, 'distinct', False):
+                raise TypeError(f"{name}: only non-distinct Sum and Count can be combined across tables")
+        totals = {}
+        for queryset in self._querysets():
+            for name, value in queryset.aggregate(**aggregates).items():
+                if value is not None:
+                    totals[name] = totals.get(name, 0) + value
+        return {name: totals.get(name) for name in aggregates}
+
+    def sum_by(self, *group_fields, value_field='amount', **group_expressions):
+        """
+        {group: Sum(value_field)} across both tables, one grouped query each.
+        Groups are field names and/or annotations such as month=TruncMonth('date');
+        a single group gives scalar keys, several give tuples.
+        """
+        groups = group_fields + tuple(group_expressions)
+        totals = {}
+        for queryset in self._querysets():
+            rows = (
+                queryset.order_by().annotate(**group_expressions)
+                .values_list(*groups).annotate(total=Sum(value_field))
+            )
+            for *key, total in rows:
+                key = key[0] if len(key) == 1 else tuple(key)
+                totals[key] = totals.get(key, 0) + (total or 0)
+        return totals
+
+    def count(self):
+        return sum(queryset.count() for queryset in self._querysets())
@@ -0,0 +1,130 @@
+"""
+Monthly rent charges and ledger balances.
+
+A billing run issues one RentCharge per active tenant for a period. Runs are
+idempotent: the (tenant, period) unique constraint lets reruns skip tenants
+already billed. The insert relies on ON CONFLICT DO NOTHING (PostgreSQL and
+SQLite 3.24+). A tenant's balance is everything charged minus everything
+paid (completed payments, archive included). With sharding enabled each
+shard's tenants are billed on that shard.
+"""
+import calendar
+import logging
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import DateField, DateTimeField, Max, Min, Sum, Value
+from django.utils import timezone
+
+from dashboard import sharding
+from dashboard.models import Tenant
+from .archive import UnifiedPayments
+from .income import invalidate_income_on_commit
+from .models import RentCharge
+
+logger = logging.getLogger(__name__)
+
+
+def period_start(day):
+    return day.replace(day=1)
+
+
+def period_end(period):
+    return period.replace(day=calendar.monthrange(period.year, period.month)[1])
+
+
+def parse_period(value):
+    """'2026-10' -> date(2026, 10, 1)"""
+    year, month = value.split('-')[:2]
+    return date(int(year), int(month), 1)
+
+
+def active_tenants(period):
+    """Tenants with a property whose lease overlaps the billed month"""
+    return Tenant.objects.filter(
+        property__isnull=False,
+        lease_start__lte=period_end(period),
+        lease_end__gte=period,
+    )
+
+
+def run_billing(period, batch_size=None):
+    """
+    Issue the month's rent charges for every active tenant.
+
+    Each batch is a single INSERT ... SELECT over a range of tenant ids, so
+    rows never travel through Python, and ON CONFLICT DO NOTHING on the
+    (tenant, period) constraint means a rerun (or an overlapping run) never
+    double-bills. Returns the number of charges created.
+    """
+    period = period_start(period)
+    batch_size = batch_size or settings.BILLING_BATCH_SIZE
+    created = 0
+    for alias in sharding.each_database():
+        with sharding.using_shard(alias):
+            created += _bill_database(period, batch_size)
+    logger.info(f"Billing run for {period:%Y-%m} created {created} charges")
+    return created
+
+
+def _bill_database(period, batch_size):
+    """run_billing on the database partitioned rows currently go to"""
+    due_date = period + timedelta(days=settings.RENT_DUE_DAY - 1)
+    tenants = active_tenants(period)
+    bounds = tenants.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return 0
+
+    charges = RentCharge._meta
+    connection = connections[tenants.db]
+    columns = ', '.join(
+        connection.ops.quote_name(charges.get_field(name).column)
+        for name in ('tenant', 'property_t', 'amount', 'period', 'due_date', 'created_at')
+    )
+    conflict = ', '.join(
+        connection.ops.quote_name(charges.get_field(name).column) for name in ('tenant', 'period')
+    )
+    created = 0
+    with connection.cursor() as cursor:
+        for low in range(bounds['first'], bounds['last'] + 1, batch_size):
+            rows = tenants.filter(id__gte=low, id__lt=low + batch_size).annotate(
+                charge_period=Value(period, output_field=DateField()),
+                charge_due_date=Value(due_date, output_field=DateField()),
+                charge_created_at=Value(timezone.now(), output_field=DateTimeField()),
+            ).values_list(
+                'id', 'property_id', 'property__monthly_rent',
+                'charge_period', 'charge_due_date', 'charge_created_at',
+            )
+            select_sql, params = rows.query.get_compiler(connection=connection).as_sql()
+            cursor.execute(
+                f'INSERT INTO {connection.ops.quote_name(charges.db_table)} ({columns}) '
+                f'{select_sql} ON CONFLICT ({conflict}) DO NOTHING',
+                params,
+            )
+            created += cursor.rowcount
+    if created:
+        # New charges move the landlords' expected rent
+        invalidate_income_on_commit(tenants.values_list('property__landlord_id', flat=True).distinct(), using=tenants.db)
+    return created
+
+
+def tenant_balance(tenant):
+    """Total charged minus total paid for one tenant"""
+    charged = RentCharge.objects.filter(tenant=tenant).aggregate(total=Sum('amount'))['total'] or 0
+    paid = UnifiedPayments(tenant=tenant, status='completed').aggregate(total=Sum('amount'))['total'] or 0
+    return charged - paid
+
+
+def tenant_balances(tenants):
+    """{tenant id: balance} for a Tenant queryset using grouped aggregates"""
+    tenant_ids = tenants.values('id')
+    charged = dict(
+        RentCharge.objects.filter(tenant__in=tenant_ids).order_by()
+        .values_list('tenant').annotate(total=Sum('amount'))
+    )
+    paid = UnifiedPayments(tenant__in=tenant_ids, status='completed').sum_by('tenant')
+    return {
+        tenant_id: charged.get(tenant_id, 0) - paid.get(tenant_id, 0)
+        for tenant_id in set(charged) | set(paid)
+    }
@@ -0,0 +1,205 @@
+"""
+Stripe event handling shared by the webhook and the bulk replay command.
+
+apply_payment_intent_events turns payment_intent.succeeded/payment_failed
+events into payment status changes with one lookup and one bulk UPDATE per
+call, plus one insert into the PaymentChange feed in the same transaction.
+Event ids are recorded in ProcessedStripeEvent, in the same transaction as
+the change they made (on the payment's shard when sharded), so a
+redelivered or replayed event is applied once even if a batch spanning
+several shards was cut short. replay_event_file streams a JSONL export
+line by line, so memory stays bounded by the batch size whatever the file
+size, and reports the byte offset each committed batch ends at.
+
+Events are plain dicts: JSON-decoded export lines, or a verified
+stripe.Event converted with to_dict() by the webhook view.
+"""
+import json
+import logging
+import os
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from dashboard import sharding
+from .income import invalidate_income_on_commit
+from .models import Payment, PaymentChange, ProcessedStripeEvent
+from .outbox import change_for
+from .streams import publish_status_change
+
+logger = logging.getLogger(__name__)
+
+EVENT_STATUSES = {
+    'payment_intent.succeeded': 'completed',
+    'payment_intent.payment_failed': 'failed',
+}
+# Payments in these states never move again, whatever order events arrive in
+FINAL_STATUSES = ('completed', 'canceled')
+
+
+def _charge_id(payment_intent):
+    charges = (payment_intent.get('charges') or {}).get('data') or []
+    return charges[0]['id'] if charges else None
+
+
+def apply_payment_intent_events(events, mark_processed=False):
+    """
+    Apply handled events to their payments in order. Returns the number of
+    payments whose status changed. Unknown intents and event types are ignored.
+
+    Each database's changes commit in one transaction of their own. With
+    mark_processed, every event's id is recorded in the transaction of the
+    database its payment lives on (default for events matching no payment),
+    so an event is never marked without its change or changed without its
+    mark, whichever database a crash interrupts.
+    """
+    events = [event for event in events if event.get('type') in EVENT_STATUSES]
+    intent_ids = {event['data']['object']['id'] for event in events}
+    if not intent_ids:
+        return 0
+
+    # Payments are partitioned by landlord, so look on every shard
+    payments = {
+        payment.stripe_payment_intent_id: payment
+        for alias in sharding.each_database()
+        for payment in Payment.objects.using(alias).filter(stripe_payment_intent_id__in=intent_ids).select_related('property_t')
+    }
+    changed = {}
+    previous = {}
+    processed = {}
+    for event in events:
+        payment_intent = event['data']['object']
+        payment = payments.get(payment_intent['id'])
+        if mark_processed and event.get('id'):
+            processed.setdefault(payment._state.db if payment else DEFAULT_DB_ALIAS, []).append(
+                ProcessedStripeEvent(event_id=event['id'], event_type=event['type'])
+            )
+        if payment is None or payment.status in FINAL_STATUSES:
+            continue
+        previous_status = previous.setdefault(payment.id, payment.status)
+        payment.status = EVENT_STATUSES[event['type']]
+        if payment.status == 'completed':
+            payment.stripe_charge_id = _charge_id(payment_intent)
+        if payment.status == previous_status:
+            changed.pop(payment.id, None)
+        else:
+            changed[payment.id] = payment
+
+    now = timezone.now()
+    by_database = {}
+    for payment in changed.values():
+        payment.updated_at = now
+        by_database.setdefault(payment._state.db, []).append(payment)
+    for alias in sorted(set(by_database) | set(processed)):
+        rows = by_database.get(alias, [])
+        with transaction.atomic(using=alias, savepoint=False):
+            if rows:
+                Payment.objects.using(alias).bulk_update(rows, ['status', 'stripe_charge_id', 'updated_at'])
+                PaymentChange.objects.using(alias).bulk_create([
+                    change_for(payment, previous[payment.id], payment.property_t.landlord_id if payment.property_t else None, 'webhook')
+                    for payment in rows
+                ])
+            if alias in processed:
+                ProcessedStripeEvent.objects.using(alias).bulk_create(processed[alias], ignore_conflicts=True)
+            # bulk_update sends no post_save, so do what the Payment signal handler would, once this commits
+            invalidate_income_on_commit((payment.property_t.landlord_id for payment in rows if payment.property_t), using=alias)
+            for payment in rows:
+                landlord_id = payment.property_t.landlord_id if payment.property_t else None
+                publish_status_change(payment, previous[payment.id], landlord_id)
+                payment._loaded_status = payment.status
+    return len(changed)
+
+
+def _processed_event_ids(ids):
+    """Ids among `ids` already recorded, on default or on any shard"""
+    if not ids:
+        return set()
+    return {
+        event_id
+        for alias in dict.fromkeys([DEFAULT_DB_ALIAS, *sharding.each_database()])
+        for event_id in ProcessedStripeEvent.objects.using(alias).filter(event_id__in=ids).values_list('event_id', flat=True)
+    }
+
+
+def process_events(events):
+    """
+    Skip events whose id was already processed, apply the rest and record
+    their ids with the changes they made. Returns (new events, payments changed).
+    """
+    for event in events:
+        if not isinstance(event, dict):
+            raise TypeError(f"Stripe events must be plain dicts, got {type(event).__name__}; convert with to_dict()")
+    events = [event for event in events if event.get('type') in EVENT_STATUSES]
+    seen = _processed_event_ids({event['id'] for event in events if event.get('id')})
+    fresh = []
+    for event in events:
+        event_id = event.get('id')
+        if event_id in seen:
+            continue
+        if event_id:
+            seen.add(event_id)
+        fresh.append(event)
+    changed = apply_payment_intent_events(fresh, mark_processed=True)
+    return len(fresh), changed
+
+
+def replay_event_file(path, start_offset=0, batch_size=1000, on_batch=None):
+    """
+    Stream Stripe events from a JSONL file starting at `start_offset` (which
+    must be the start of a line, e.g. an offset reported by a previous run).
+
+    `on_batch(stats)` is called after every committed batch; stats['offset']
+    is where a rerun should resume. Returns the final stats.
+    """
+    stats = {'offset': start_offset, 'lines': 0, 'events': 0, 'duplicates': 0, 'changed': 0, 'invalid': 0}
+    batch = []
+
+    def flush(offset):
+        fresh, changed = process_events(batch)
+        stats['events'] += fresh
+        stats['duplicates'] += sum(1 for event in batch if event.get('type') in EVENT_STATUSES) - fresh
+        stats['changed'] += changed
+        stats['offset'] = offset
+        batch.clear()
+        if on_batch:
+            on_batch(dict(stats))
+
+    with open(path, 'rb') as stream:
+        stream.seek(start_offset)
+        offset = start_offset
+        for line in stream:
+            offset += len(line)
+            stats['lines'] += 1
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                if not isinstance(event, dict):
+                    raise ValueError('not an object')
+            except ValueError:
+                stats['invalid'] += 1
+                logger.warning(f"Skipping invalid JSON at byte {offset - len(line)}")
+                continue
+            if event.get('type') not in EVENT_STATUSES:
+                continue
+            batch.append(event)
+            if len(batch) >= batch_size:
+                flush(offset)
+        flush(offset)
+    return stats
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return int(checkpoint.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, offset):
+    # Write-then-rename so an interrupted run never leaves a torn checkpoint
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as checkpoint:
+        checkpoint.write(str(offset))
+    os.replace(temporary, path)
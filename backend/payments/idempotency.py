@@ -0,0 +1,72 @@
+"""
+Idempotency-Key support for endpoints that create things.
+
+The first successful response to a (user, key) pair is stored with a
+fingerprint of the request body; a retry with the same key gets that
+response back without running the view again, and a retry with a
+different body is rejected. Records expire after IDEMPOTENCY_KEY_TTL_SECONDS
+and are removed by the purge_idempotency_keys command.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path} {body}'.encode()).hexdigest()
+
+
+def replay(record, request_fingerprint):
+    if record.fingerprint != request_fingerprint:
+        return Response(
+            {"error": f"{HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(record.response, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def lookup(request, key):
+    """The stored response for the key (or a 422 on a body mismatch), else None"""
+    record = IdempotencyRecord.objects.filter(user=request.user, key=key).first()
+    if record is None:
+        return None
+    if record.expires_at <= timezone.now():
+        # Expired but not purged yet; the key is free again
+        record.delete()
+        return None
+    return replay(record, fingerprint(request))
+
+
+def store(request, key, response):
+    """
+    Save `response` for the key. Call it inside the transaction that made the
+    changes: if a concurrent duplicate stored first this raises IntegrityError,
+    the changes roll back and the caller should answer with lookup() instead.
+    """
+    IdempotencyRecord.objects.create(
+        user=request.user,
+        key=key,
+        fingerprint=fingerprint(request),
+        status_code=response.status_code,
+        response=response.data,
+        expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+    )
+    return response
+
+
+def purge_expired():
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
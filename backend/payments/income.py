@@ -0,0 +1,124 @@
+"""
+Monthly income series for landlord charts.
+
+Collected amounts come from one TruncMonth/property grouped aggregate per
+payment table (hot and archive) and expected rent from one grouped query
+on the RentCharge ledger. Results are cached per landlord under a version
+key that is replaced (once the writing transaction commits) whenever one
+of the landlord's payments changes status, a billing run charges their
+tenants or one of their properties is added, edited or removed.
+"""
+import uuid
+from datetime import date, datetime, time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from dashboard.models import Property
+from monitoring.metrics import record_cache_access
+from .archive import UnifiedPayments
+from .models import RentCharge
+
+MAX_MONTHS = 36
+
+
+def _version_key(landlord_id):
+    return f'payments:income-version:{landlord_id}'
+
+
+def invalidate_income(landlord_id):
+    """Drop every cached series of the landlord (call on payment state changes)"""
+    cache.set(_version_key(landlord_id), uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_income_on_commit(landlord_ids, using=None):
+    """
+    invalidate_income for each landlord once the current transaction on
+    `using` commits (immediately outside one), so a request racing the
+    write can't cache the old totals under the new version.
+    """
+    landlord_ids = {landlord_id for landlord_id in landlord_ids if landlord_id is not None}
+    if landlord_ids:
+        transaction.on_commit(lambda: [invalidate_income(landlord_id) for landlord_id in landlord_ids], using=using)
+
+
+def _month_starts(months, today):
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(months):
+        starts.append(date(year, month, 1))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(starts))
+
+
+def _point(month, collected, expected):
+    return {
+        'month': f'{month:%Y-%m}',
+        'collected': collected,
+        'expected': expected,
+        'collection_rate': round(float(collected / expected), 4) if expected else None,
+    }
+
+
+def compute_income_series(landlord, months=12, today=None):
+    months_list = _month_starts(months, today or date.today())
+    start = months_list[0]
+
+    properties = list(Property.objects.filter(landlord=landlord).order_by('id').values_list('id', 'address'))
+    collected = UnifiedPayments(
+        property_t__landlord=landlord, status='completed',
+        date__gte=timezone.make_aware(datetime.combine(start, time.min)),
+    ).sum_by('property_t', month=TruncMonth('date'))
+    expected = dict(
+        ((property_id, period), total)
+        for property_id, period, total in RentCharge.objects.filter(property_t__landlord=landlord, period__gte=start)
+        .values_list('property_t', 'period').annotate(total=Sum('amount')).order_by()
+    )
+    # TruncMonth gives datetimes on DateTimeFields; key everything by date
+    collected = {
+        (property_id, month.date() if hasattr(month, 'date') else month): total
+        for (property_id, month), total in collected.items()
+    }
+
+    series = []
+    for property_id, address in properties:
+        series.append({
+            'id': property_id,
+            'address': address,
+            'series': [
+                _point(month, collected.get((property_id, month), 0), expected.get((property_id, month), 0))
+                for month in months_list
+            ],
+        })
+    total = [
+        _point(
+            month,
+            sum(collected.get((property_id, month), 0) for property_id, _ in properties),
+            sum(expected.get((property_id, month), 0) for property_id, _ in properties),
+        )
+        for month in months_list
+    ]
+    return {
+        'months': [f'{month:%Y-%m}' for month in months_list],
+        'properties': series,
+        'total': total,
+    }
+
+
+def get_income_series(landlord, months=12):
+    """Cached compute_income_series; the key includes the current month, so it rolls over by itself"""
+    today = date.today()
+    version = cache.get(_version_key(landlord.pk), '0')
+    key = f'payments:income:{landlord.pk}:{version}:{today:%Y-%m}:{months}'
+    data = cache.get(key)
+    record_cache_access('income_series', data is not None)
+    if data is None:
+        data = compute_income_series(landlord, months, today)
+        cache.set(key, data, timeout=settings.INCOME_SERIES_CACHE_SECONDS)
+    return data
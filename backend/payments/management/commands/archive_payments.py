@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard import sharding
+from payments.archive import ARCHIVABLE_STATUSES, archive_cutoff, archive_payments
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Move terminal payments older than the archive horizon into the PaymentArchive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Archive horizon in days (default: PAYMENT_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Payments moved per transaction (default: PAYMENT_ARCHIVE_BATCH_SIZE)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many payments would move')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['older_than_days'])
+        if options['dry_run']:
+            count = sum(
+                Payment.objects.using(alias).filter(status__in=ARCHIVABLE_STATUSES, date__lt=cutoff).count()
+                for alias in sharding.each_database()
+            )
+            self.stdout.write(f'{count} payments dated before {cutoff:%Y-%m-%d} would be archived')
+            return
+
+        started = time.perf_counter()
+        archived = archive_payments(before=cutoff, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} payments dated before {cutoff:%Y-%m-%d} in {time.perf_counter() - started:.1f}s'
+        ))
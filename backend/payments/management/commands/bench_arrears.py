@@ -0,0 +1,59 @@
+import time
+from datetime import date
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from payments.arrears import compute_aging, load_arrears
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the arrears engine on a synthetic ledger (default 1M payments) and, '
+        'with --database, the full load from the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=1_000_000)
+        parser.add_argument('--tenants', type=int, default=50_000)
+        parser.add_argument('--months', type=int, default=24, help='Monthly charges per tenant')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', action='store_true', help='Also time load_arrears() on real data')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        tenants, months = options['tenants'], options['months']
+        as_of = date.today()
+
+        rent = rng.integers(50, 500, tenants) * 10_000
+        charge_tenants = np.repeat(np.arange(1, tenants + 1), months)
+        charge_cents = np.repeat(rent, months)
+        first_due = np.datetime64(as_of, 'M') - months + 1
+        charge_due = np.tile(first_due + np.arange(months), tenants).astype('datetime64[D]') + 4
+
+        payment_tenants = rng.integers(1, tenants + 1, options['payments'])
+        # Payments add up to a little less than was billed, so plenty of tenants fall behind
+        payment_cents = rent[payment_tenants - 1] * months * tenants // options['payments']
+        payment_cents = (payment_cents * rng.uniform(0.8, 1.05, options['payments'])).astype(np.int64)
+
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            report = compute_aging(charge_tenants, charge_cents, charge_due, payment_tenants, payment_cents, as_of)
+            timings.append(time.perf_counter() - started)
+        totals = report.totals()
+        self.stdout.write(
+            f"compute_aging: {len(charge_tenants):,} charges, {options['payments']:,} payments, "
+            f"{tenants:,} tenants -> best {min(timings) * 1000:.0f} ms, median {np.median(timings) * 1000:.0f} ms"
+        )
+        self.stdout.write(f"  {totals['tenants_in_arrears']:,} tenants in arrears, {totals['overdue']:,} overdue")
+
+        if options['database']:
+            started = time.perf_counter()
+            report = load_arrears(as_of=as_of)
+            self.stdout.write(
+                f"load_arrears (database): {len(report.tenant_ids):,} tenants in "
+                f"{(time.perf_counter() - started) * 1000:.0f} ms"
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
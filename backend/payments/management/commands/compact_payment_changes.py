@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.outbox import compact
+
+
+class Command(BaseCommand):
+    help = 'Delete payment change feed entries older than the retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help='Days of entries to keep (default: PAYMENT_CHANGES_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Entries deleted per statement')
+
+    def handle(self, *args, **options):
+        if options['retention_days'] is not None and options['retention_days'] < 0:
+            raise CommandError('--retention-days cannot be negative')
+        deleted = compact(options['retention_days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} payment change entries'))
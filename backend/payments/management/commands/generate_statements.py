@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payments.billing import parse_period
+from payments.statements import generate_statements
+
+
+class Command(BaseCommand):
+    help = "Write monthly CSV and PDF statements for landlords whose data changed since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help='Month as YYYY-MM (default: current month)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Rendering processes (default: STATEMENT_WORKERS, else one per CPU)')
+        parser.add_argument('--force', action='store_true', help='Re-render every landlord, changed or not')
+
+    def handle(self, *args, **options):
+        try:
+            period = parse_period(options['period']) if options['period'] else timezone.now().date().replace(day=1)
+        except ValueError:
+            raise CommandError('--period must look like YYYY-MM')
+
+        started = time.perf_counter()
+        run = generate_statements(period, workers=options['workers'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {len(run.rendered)} statements for {period:%Y-%m} ({run.unchanged} unchanged) '
+            f'in {time.perf_counter() - started:.2f}s; manifest: {run.manifest_path}'
+        ))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.events import read_checkpoint, replay_event_file, write_checkpoint
+
+
+class Command(BaseCommand):
+    help = "Apply payment_intent events from a JSONL export of Stripe events (safe to rerun)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File with one Stripe event JSON object per line')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Events applied per transaction')
+        parser.add_argument('--start-offset', type=int, default=None,
+                            help='Byte offset to resume from (a line start reported by an earlier run)')
+        parser.add_argument('--checkpoint', help='File the committed offset is written to and resumed from')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        checkpoint = options['checkpoint']
+        start = options['start_offset']
+        if start is None:
+            start = read_checkpoint(checkpoint) if checkpoint else 0
+
+        def on_batch(stats):
+            if checkpoint:
+                write_checkpoint(checkpoint, stats['offset'])
+            self.stdout.write(
+                f"offset {stats['offset']}: {stats['events']} events applied, {stats['changed']} payments updated"
+            )
+
+        started = time.perf_counter()
+        try:
+            stats = replay_event_file(options['path'], start, options['batch_size'], on_batch)
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {stats['events']} events ({stats['duplicates']} duplicates, {stats['invalid']} invalid lines), "
+            f"updated {stats['changed']} payments in {time.perf_counter() - started:.2f}s; "
+            f"resume offset {stats['offset']}"
+        ))
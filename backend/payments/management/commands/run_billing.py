@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from payments.billing import parse_period, run_billing
+
+
+class Command(BaseCommand):
+    help = "Issue the month's rent charges for every active tenant (safe to rerun)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help='Month to bill as YYYY-MM (default: current month)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Charges inserted per statement (default: BILLING_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        try:
+            period = parse_period(options['period']) if options['period'] else timezone.now().date().replace(day=1)
+        except ValueError:
+            raise CommandError('--period must look like YYYY-MM')
+
+        started = time.perf_counter()
+        created = run_billing(period, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Issued {created} rent charges for {period:%Y-%m} in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,32 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.reminders import send_reminders
+
+
+class Command(BaseCommand):
+    help = "Email tenants whose rent is due or whose lease is ending soon (safe to rerun)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Send the reminders due on this day, YYYY-MM-DD (default: today)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Messages per send on the shared connection (default: REMINDER_BATCH_SIZE)')
+        parser.add_argument('--dry-run', action='store_true', help='Count the due reminders without sending')
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError('--date must look like YYYY-MM-DD')
+
+        started = time.perf_counter()
+        stats = send_reminders(today, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        counts = ', '.join(f'{count} {kind}' for kind, count in stats.sent.items())
+        verb = 'Would send' if options['dry_run'] else 'Sent'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {stats.total} reminders ({counts}) in {time.perf_counter() - started:.2f}s'
+        ))
+        if stats.failed:
+            self.stderr.write(f'{stats.failed} reminders could not be sent and will be retried on the next run')
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_delete_payment'),
+        ('payments', '0004_alter_payment_options_payment_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(default='kes', max_length=3)),
+                ('date', models.DateTimeField()),
+                ('status', models.CharField(choices=[('completed', 'Completed'), ('pending', 'Pending'), ('failed', 'Failed'), ('processing', 'Processing'), ('canceled', 'Canceled')], max_length=20)),
+                ('stripe_payment_intent_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('stripe_charge_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('stripe_receipt_url', models.URLField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'date'], name='payment_status_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='paymentarchive',
+            name='property_t',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='property_archived_payments', to='dashboard.property'),
+        ),
+        migrations.AddField(
+            model_name='paymentarchive',
+            name='tenant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_payments', to='dashboard.tenant'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentarchive',
+            index=models.Index(fields=['tenant', 'date'], name='payarchive_tenant_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentarchive',
+            index=models.Index(fields=['property_t', 'date'], name='payarchive_property_date_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_delete_payment'),
+        ('payments', '0005_paymentarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RentCharge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(help_text='First day of the billed month')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('due_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('property_t', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rent_charges', to='dashboard.property')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rent_charges', to='dashboard.tenant')),
+            ],
+            options={
+                'ordering': ['-period'],
+                'indexes': [models.Index(fields=['period'], name='rentcharge_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tenant', 'period'), name='rentcharge_tenant_period_uniq')],
+            },
+        ),
+    ]
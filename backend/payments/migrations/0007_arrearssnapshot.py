@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_delete_payment'),
+        ('payments', '0006_rentcharge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArrearsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('days_0_29', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('days_30_59', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('days_60_89', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('days_90_plus', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arrears_snapshots', to='dashboard.tenant')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'tenant'), name='arrears_date_tenant_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0007_arrearssnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedStripeEvent',
+            fields=[
+                ('event_id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('event_type', models.CharField(max_length=100)),
+                ('processed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0006_tenant_lease_end_idx'),
+        ('payments', '0009_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('rent_due', 'Rent due'), ('lease_end', 'Lease ending')], max_length=20)),
+                ('due_on', models.DateField(help_text='Rent due date or lease end the reminder was about')),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='dashboard.tenant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tenant', 'kind', 'due_on'), name='reminderlog_tenant_kind_due_uniq')],
+            },
+        ),
+    ]
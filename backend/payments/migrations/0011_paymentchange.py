@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0010_reminderlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.BigIntegerField()),
+                ('tenant_id', models.BigIntegerField()),
+                ('landlord_id', models.BigIntegerField(null=True)),
+                ('previous_status', models.CharField(max_length=20, null=True)),
+                ('status', models.CharField(max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(max_length=3)),
+                ('source', models.CharField(choices=[('create', 'Created'), ('webhook', 'Stripe webhook'), ('confirm', 'Client confirmation'), ('sync', 'Stripe sync'), ('app', 'Other')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['landlord_id', 'id'], name='paymentchange_landlord_seq_idx'), models.Index(fields=['tenant_id', 'id'], name='paymentchange_tenant_seq_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_delta_sync'),
+        ('payments', '0011_paymentchange'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['tenant', 'updated_at'], name='payment_tenant_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_delta_sync'),
+        ('payments', '0012_payment_tenant_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['date'], name='payment_date_idx'),
+        ),
+    ]
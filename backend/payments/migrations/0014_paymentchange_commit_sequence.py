@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:21
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def number_existing_changes(apps, schema_editor):
+    """Existing entries keep their id as sequence, so cursors handed out before this stay valid"""
+    PaymentChange = apps.get_model('payments', 'PaymentChange')
+    PaymentChange.objects.using(schema_editor.connection.alias).update(sequence=F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0013_payment_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentChangeCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_sequence', models.BigIntegerField()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='paymentchange',
+            name='paymentchange_landlord_seq_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paymentchange',
+            name='paymentchange_tenant_seq_idx',
+        ),
+        migrations.AddField(
+            model_name='paymentchange',
+            name='sequence',
+            field=models.BigIntegerField(null=True, unique=True),
+        ),
+        migrations.RunPython(number_existing_changes, migrations.RunPython.noop, hints={'shard_aware': True}),
+        migrations.AddIndex(
+            model_name='paymentchange',
+            index=models.Index(fields=['landlord_id', 'sequence'], name='paymentchange_landlord_seq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentchange',
+            index=models.Index(fields=['tenant_id', 'sequence'], name='paymentchange_tenant_seq_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -21,7 +22,8 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS, default='pending')
     
     # Stripe fields
-    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True)
+    # Indexed: webhook, confirmation and admin lookups go by intent id
+    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
     stripe_client_secret = models.CharField(max_length=255, blank=True, null=True)
     stripe_charge_id = models.CharField(max_length=255, blank=True, null=True)
     stripe_receipt_url = models.URLField(blank=True, null=True)
@@ -39,10 +41,77 @@ class Payment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Archival scans for old terminal payments
+            models.Index(fields=['status', 'date'], name='payment_status_date_idx'),
+            # Date filter in the admin
+            models.Index(fields=['date'], name='payment_date_idx'),
+            # ?since= reads of a tenant's payments
+            models.Index(fields=['tenant', 'updated_at'], name='payment_tenant_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.amount} - {self.get_status_display()}"
     
+    # Recorded in the PaymentChange feed; set it before save() to say what changed the payment
+    change_source = 'app'
+    
+    def save(self, *args, **kwargs):
+        # The post_save handler appends to PaymentChange; both commit or roll back together
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so post_save handlers can tell whether the status changed
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
+    @property
+    def status_changed(self):
+        return self.status != getattr(self, '_loaded_status', None)
+    
+    @property
+    def formatted_amount(self):
+        return f"{self.currency.upper()} {self.amount:,.2f}"
+    
+    @property
+    def is_successful(self):
+        return self.status == 'completed'
+
+
+class PaymentArchive(models.Model):
+    """
+    Compact copy of a terminal payment moved out of the hot Payment table.
+
+    Keeps the original primary key and only the columns rollups, exports and
+    statements need; client secrets, failure details and metadata are dropped.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    tenant = models.ForeignKey('dashboard.Tenant', on_delete=models.CASCADE, related_name='archived_payments')
+    property_t = models.ForeignKey('dashboard.Property', on_delete=models.CASCADE, related_name='property_archived_payments', null=True, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default='kes')
+    date = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Payment.PAYMENT_STATUS)
+    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, null=True)
+    stripe_charge_id = models.CharField(max_length=255, blank=True, null=True)
+    stripe_receipt_url = models.URLField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant', 'date'], name='payarchive_tenant_date_idx'),
+            models.Index(fields=['property_t', 'date'], name='payarchive_property_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.amount} - {self.get_status_display()} (archived)"
+    
     @property
     def formatted_amount(self):
         return f"{self.currency.upper()} {self.amount:,.2f}"
@@ -50,3 +119,144 @@ class Payment(models.Model):
     @property
     def is_successful(self):
         return self.status == 'completed'
+
+
+class RentCharge(models.Model):
+    """Rent billed to a tenant for one month; one row per (tenant, period)"""
+    tenant = models.ForeignKey('dashboard.Tenant', on_delete=models.CASCADE, related_name='rent_charges')
+    property_t = models.ForeignKey('dashboard.Property', on_delete=models.SET_NULL, related_name='rent_charges', null=True, blank=True)
+    period = models.DateField(help_text='First day of the billed month')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    due_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-period']
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'period'], name='rentcharge_tenant_period_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['period'], name='rentcharge_period_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.amount} due {self.due_date}"
+
+
+class ArrearsSnapshot(models.Model):
+    """Nightly per-tenant balance and aging, kept for trend reporting"""
+    date = models.DateField()
+    tenant = models.ForeignKey('dashboard.Tenant', on_delete=models.CASCADE, related_name='arrears_snapshots')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    days_0_29 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    days_30_59 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    days_60_89 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    days_90_plus = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'tenant'], name='arrears_date_tenant_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tenant_id} owes {self.balance} on {self.date}"
+
+
+class ProcessedStripeEvent(models.Model):
+    """Ids of Stripe events already applied, so redelivered or replayed events are skipped"""
+    event_id = models.CharField(max_length=255, primary_key=True)
+    event_type = models.CharField(max_length=100)
+    processed_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.event_id
+
+
+class IdempotencyRecord(models.Model):
+    """Stored response of a request sent with an Idempotency-Key, replayed for retries until it expires"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
+
+
+class ReminderLog(models.Model):
+    """One row per reminder sent, so reruns of send_rent_reminders never mail a tenant twice"""
+    KIND_CHOICES = [
+        ('rent_due', 'Rent due'),
+        ('lease_end', 'Lease ending'),
+    ]
+    tenant = models.ForeignKey('dashboard.Tenant', on_delete=models.CASCADE, related_name='reminders')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    due_on = models.DateField(help_text='Rent due date or lease end the reminder was about')
+    sent_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            # Also the index the dispatcher's "already reminded" check uses
+            models.UniqueConstraint(fields=['tenant', 'kind', 'due_on'], name='reminderlog_tenant_kind_due_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} for {self.tenant_id} ({self.due_on})"
+
+
+class PaymentChange(models.Model):
+    """
+    Append-only feed of payment status transitions, written in the same
+    transaction as the change. `sequence` is numbered after the entry has
+    committed, in commit order (see payments.outbox.assign_sequences);
+    consumers page with /payments/changes/?after=<last sequence seen>.
+    """
+    SOURCE_CHOICES = [
+        ('create', 'Created'),
+        ('webhook', 'Stripe webhook'),
+        ('confirm', 'Client confirmation'),
+        ('sync', 'Stripe sync'),
+        ('app', 'Other'),
+    ]
+    # Plain ids rather than foreign keys: entries outlive archived payments
+    payment_id = models.BigIntegerField()
+    tenant_id = models.BigIntegerField()
+    landlord_id = models.BigIntegerField(null=True)
+    previous_status = models.CharField(max_length=20, null=True)
+    status = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # NULL until the entry is numbered; consumers never see it before then
+    sequence = models.BigIntegerField(null=True, unique=True)
+    
+    class Meta:
+        indexes = [
+            # Cursor reads per consumer: WHERE landlord_id = ? AND sequence > ? ORDER BY sequence
+            models.Index(fields=['landlord_id', 'sequence'], name='paymentchange_landlord_seq_idx'),
+            models.Index(fields=['tenant_id', 'sequence'], name='paymentchange_tenant_seq_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.sequence or '-'} payment {self.payment_id}: {self.previous_status} -> {self.status}"
+
+
+class PaymentChangeCounter(models.Model):
+    """
+    Last PaymentChange sequence number handed out on this database. Its one
+    row is locked while entries are numbered, so numbering is serialised.
+    """
+    last_sequence = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"Payment changes numbered up to {self.last_sequence}"
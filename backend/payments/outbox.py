@@ -0,0 +1,131 @@
+"""
+Append-only feed of payment status transitions (PaymentChange).
+
+Entries are written in the same transaction as the change they describe:
+Payment.save() wraps the post_save handler that records single-payment
+changes (creation, confirmation, Stripe sync), and the webhook path inserts
+its entries next to its bulk UPDATE. Consumers page on the entry's
+sequence number with ?after=.
+
+Ids are allocated at insert but become visible at commit, so a slow
+transaction can commit a lower id after a reader has moved past it.
+Sequence numbers are therefore handed out later: before every read,
+assign_sequences numbers the committed entries that have none yet, under
+a lock on the database's counter row, after every number already handed
+out. An entry committing late gets a number above every cursor issued
+before it, so no consumer can have passed it.
+
+When sharding is enabled every shard keeps its own feed, and a landlord's
+entries live on their shard. Each shard numbers from n * SHARD_ID_SPACING,
+so a cursor tells which shard's feed it belongs to. rebalance_shards copies
+a landlord's entries to the new shard, where they are numbered again. A
+cursor from another shard's range is therefore restarted from the beginning
+of the current feed and flagged as reset. Consumers get the carried-over
+entries again and should apply them idempotently (by payment id and status).
+
+compact() drops entries older than PAYMENT_CHANGES_RETENTION_DAYS; a
+consumer further behind than that has to resync from the payment list.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from dashboard import sharding
+from .models import PaymentChange, PaymentChangeCounter
+
+logger = logging.getLogger(__name__)
+
+
+def change_for(payment, previous_status, landlord_id, source):
+    return PaymentChange(
+        payment_id=payment.id,
+        tenant_id=payment.tenant_id,
+        landlord_id=landlord_id,
+        previous_status=previous_status,
+        status=payment.status,
+        amount=payment.amount,
+        currency=payment.currency,
+        source=source,
+    )
+
+
+def record_change(payment, previous_status, landlord_id, source, using=None):
+    """Append one entry; call inside the transaction that changed the payment"""
+    change = change_for(payment, previous_status, landlord_id, source)
+    change.save(using=using or payment._state.db)
+    return change
+
+
+def resolve_cursor(after):
+    """
+    (after, reset) for reading the feed partitioned writes go to now: a
+    cursor from another shard's id range restarts at 0 with reset=True
+    """
+    feed = sharding.shard_number(sharding.write_alias())
+    if after and after // sharding.SHARD_ID_SPACING != feed:
+        return 0, True
+    return after, False
+
+
+def assign_sequences(using=None, batch_size=1000):
+    """
+    Number the committed entries that have no sequence yet, in id order,
+    after the last number handed out on the database. Returns how many.
+    """
+    alias = using or sharding.write_alias()
+    pending = PaymentChange.objects.using(alias).filter(sequence__isnull=True)
+    if not pending.exists():
+        return 0
+    numbered = 0
+    with transaction.atomic(using=alias):
+        # Concurrent callers queue here; each then only sees what the one before left unnumbered
+        counter, _ = PaymentChangeCounter.objects.using(alias).select_for_update().get_or_create(
+            pk=1, defaults={'last_sequence': _first_sequence(alias)},
+        )
+        while batch := list(pending.order_by('id').only('id')[:batch_size]):
+            for change in batch:
+                counter.last_sequence += 1
+                change.sequence = counter.last_sequence
+            PaymentChange.objects.using(alias).bulk_update(batch, ['sequence'])
+            numbered += len(batch)
+        counter.save(update_fields=['last_sequence'])
+    return numbered
+
+
+def _first_sequence(alias):
+    """Where a database's numbering continues from: its highest sequence, else the bottom of its range"""
+    highest = PaymentChange.objects.using(alias).aggregate(highest=Max('sequence'))['highest']
+    return highest or sharding.shard_number(alias) * sharding.SHARD_ID_SPACING
+
+
+def changes_after(after=0, limit=None, landlord_id=None, tenant_id=None):
+    """Entries past the `after` cursor in sequence order, at most `limit` of them"""
+    limit = limit or settings.PAYMENT_CHANGES_PAGE_SIZE
+    assign_sequences()
+    changes = PaymentChange.objects.filter(sequence__gt=after)
+    if landlord_id is not None:
+        changes = changes.filter(landlord_id=landlord_id)
+    if tenant_id is not None:
+        changes = changes.filter(tenant_id=tenant_id)
+    return list(changes.order_by('sequence')[:limit])
+
+
+def compact(retention_days=None, batch_size=5000):
+    """Delete entries older than the retention window on every database. Returns the number deleted"""
+    retention_days = settings.PAYMENT_CHANGES_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted = 0
+    for alias in sharding.each_database():
+        changes = PaymentChange.objects.using(alias)
+        # Deleted in batches so a large backlog does not hold one long write lock
+        while True:
+            ids = list(changes.filter(created_at__lt=cutoff).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += changes.filter(id__in=ids).delete()[0]
+    logger.info(f"Compacted payment change feed: {deleted} entries older than {retention_days} days removed")
+    return deleted
@@ -0,0 +1,149 @@
+"""
+Rent and lease-end reminder emails, sent by the send_rent_reminders job.
+
+Due recipients come from one query over Tenant per database: tenants with a
+unit whose lease ends within LEASE_END_REMINDER_DAYS (the lease_end index),
+plus every active tenant while the month's rent due date is at most
+RENT_REMINDER_DAYS away. Reminders already in ReminderLog are filtered out
+in the same query. The query is streamed in chunks, so memory stays bounded
+for 100k tenants.
+
+Messages are rendered from templates compiled once per run. They go through
+one mail connection that stays open for the whole run, REMINDER_BATCH_SIZE
+messages per send_messages() call. Each sent batch is then recorded in
+ReminderLog. The (tenant, kind, due_on) constraint makes recording
+idempotent, so a rerun skips whoever was reminded. A batch that fails to send
+is not recorded and goes out on the next run.
+"""
+import logging
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef, Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from dashboard import sharding
+from dashboard.models import Tenant
+from .billing import period_end, period_start
+from .models import ReminderLog
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('rent_due', 'lease_end')
+CURRENCY = 'KES'
+
+
+@dataclass
+class ReminderStats:
+    sent: dict = field(default_factory=lambda: dict.fromkeys(KINDS, 0))
+    failed: int = 0
+    batches: int = 0
+
+    @property
+    def total(self):
+        return sum(self.sent.values())
+
+
+@lru_cache(maxsize=None)
+def reminder_templates(kind):
+    """(subject, body) templates of a reminder kind, loaded and compiled once per process"""
+    return (
+        get_template(f'payments/reminders/{kind}_subject.txt'),
+        get_template(f'payments/reminders/{kind}_body.txt'),
+    )
+
+
+def rent_due_date(today):
+    return period_start(today) + timedelta(days=settings.RENT_DUE_DAY - 1)
+
+
+def due_reminders(today):
+    """
+    Yield (kind, due_on, row) for every reminder still to send on `today`,
+    from the database partitioned writes currently go to. Rows are
+    dicts of the tenant fields the templates need.
+    """
+    lease_horizon = today + timedelta(days=settings.LEASE_END_REMINDER_DAYS)
+    due_on = rent_due_date(today)
+    rent_window = today <= due_on <= today + timedelta(days=settings.RENT_REMINDER_DAYS)
+
+    due = Q(lease_end__range=(today, lease_horizon))
+    if rent_window:
+        period = period_start(today)
+        due |= Q(lease_start__lte=period_end(period), lease_end__gte=period)
+    reminded = ReminderLog.objects.filter(tenant=OuterRef('pk'))
+    tenants = Tenant.objects.filter(due, property__isnull=False).annotate(
+        rent_reminded=Exists(reminded.filter(kind='rent_due', due_on=due_on)),
+        lease_reminded=Exists(reminded.filter(kind='lease_end', due_on=OuterRef('lease_end'))),
+    ).values(
+        'id', 'lease_start', 'lease_end', 'rent_reminded', 'lease_reminded',
+        'user__email', 'user__first_name', 'user__last_name', 'property__address', 'property__monthly_rent',
+    ).order_by('id')
+
+    for row in tenants.iterator(chunk_size=settings.REMINDER_BATCH_SIZE):
+        if rent_window and not row['rent_reminded'] and row['lease_start'] <= due_on <= row['lease_end']:
+            yield 'rent_due', due_on, row
+        if today <= row['lease_end'] <= lease_horizon and not row['lease_reminded']:
+            yield 'lease_end', row['lease_end'], row
+
+
+def render_reminder(kind, due_on, row):
+    subject, body = reminder_templates(kind)
+    context = {
+        'name': f"{row['user__first_name']} {row['user__last_name']}".strip() or row['user__email'],
+        'address': row['property__address'],
+        'amount': f"{row['property__monthly_rent']:,.2f}",
+        'currency': CURRENCY,
+        'due_on': due_on,
+    }
+    return EmailMessage(
+        subject=subject.render(context).strip(),
+        body=body.render(context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[row['user__email']],
+    )
+
+
+def _send_batch(connection, batch, stats):
+    try:
+        connection.send_messages([message for message, _ in batch])
+    except Exception as e:
+        stats.failed += len(batch)
+        logger.warning(f"Could not send {len(batch)} reminders, they will be retried on the next run: {e}")
+        return
+    ReminderLog.objects.bulk_create([log for _, log in batch], ignore_conflicts=True)
+    for _, log in batch:
+        stats.sent[log.kind] += 1
+    stats.batches += 1
+
+
+def send_reminders(today=None, batch_size=None, connection=None, dry_run=False):
+    """Send every reminder due on `today` (default: now). Returns ReminderStats"""
+    today = today or timezone.now().date()
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    stats = ReminderStats()
+    connection = connection or get_connection()
+
+    # Opened once, so every batch reuses the same SMTP session
+    with nullcontext() if dry_run else connection:
+        for alias in sharding.each_database():
+            with sharding.using_shard(alias):
+                batch = []
+                for kind, due_on, row in due_reminders(today):
+                    if dry_run:
+                        stats.sent[kind] += 1
+                        continue
+                    batch.append((render_reminder(kind, due_on, row), ReminderLog(tenant_id=row['id'], kind=kind, due_on=due_on)))
+                    if len(batch) >= batch_size:
+                        _send_batch(connection, batch, stats)
+                        batch = []
+                if batch:
+                    _send_batch(connection, batch, stats)
+
+    logger.info(f"Reminders for {today}: {stats.sent} sent in {stats.batches} batches, {stats.failed} failed")
+    return stats
@@ -54,15 +54,10 @@ class PaymentDetailSerializer(serializers.ModelSerializer):
 
 class TenantPaymentSummarySerializer(serializers.Serializer):
     total_payments = serializers.IntegerField()
+    archived_payments = serializers.IntegerField()
     completed_payments = serializers.IntegerField()
     total_paid = serializers.DecimalField(max_digits=10, decimal_places=2)
     pending_payments = serializers.IntegerField()
     failed_payments = serializers.IntegerField()
     monthly_rent = serializers.DecimalField(max_digits=10, decimal_places=2)
-    outstanding_balance = serializers.SerializerMethodField()
-    
-    def get_outstanding_balance(self, obj):
-        """Calculate outstanding balance based on monthly rent"""
-        monthly_rent = obj.get('monthly_rent', 0)
-        total_paid = obj.get('total_paid', 0)
-        return max(0, monthly_rent - total_paid)
+    outstanding_balance = serializers.DecimalField(max_digits=10, decimal_places=2)
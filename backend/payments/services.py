@@ -1,20 +1,25 @@
-import stripe
-from django.conf import settings
-from .models import Payment
+import logging
+from django.db.models import Count, Q, Sum
+from .models import Payment, RentCharge
+from .archive import UnifiedPayments
 from dashboard.models import Tenant, Property
+from .stripe_client import StripeUnavailable, get_stripe_gateway
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+logger = logging.getLogger(__name__)
 
 class StripePaymentService:
     """
     Service to handle Stripe payment data retrieval and synchronization
     """
     
+    FINAL_STATUSES = ('completed', 'canceled')
+    
     @staticmethod
     def get_payment_intent_details(payment_intent_id):
         """Retrieve detailed payment information from Stripe"""
+        import stripe
         try:
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            intent = get_stripe_gateway().retrieve_payment_intent(payment_intent_id)
             return {
                 'id': intent.id,
                 'amount': intent.amount / 100,  # Convert from cents
@@ -48,7 +53,7 @@ class StripePaymentService:
                 })
             except Exception as e:
                 # Log error but continue processing other payments
-                print(f"Error fetching Stripe data for payment {payment.id}: {e}")
+                logger.warning(f"Error fetching Stripe data for payment {payment.id}: {e}")
                 continue
         
         return stripe_payments
@@ -59,20 +64,34 @@ class StripePaymentService:
         if not payment.stripe_payment_intent_id:
             return False
         
+        # Completed and canceled intents never change state again on Stripe
+        if payment.status in StripePaymentService.FINAL_STATUSES:
+            return False
+        
         try:
             stripe_data = StripePaymentService.get_payment_intent_details(
                 payment.stripe_payment_intent_id
             )
             
             # Update payment with Stripe data
-            payment.status = StripePaymentService._map_stripe_status(stripe_data['status'])
-            payment.stripe_charge_id = stripe_data['charges'][0]['id'] if stripe_data['charges'] else None
-            payment.stripe_receipt_url = stripe_data['charges'][0]['receipt_url'] if stripe_data['charges'] else None
-            payment.save()
+            charge = stripe_data['charges'][0] if stripe_data['charges'] else None
+            updates = {
+                'status': StripePaymentService._map_stripe_status(stripe_data['status']),
+                'stripe_charge_id': charge['id'] if charge else None,
+                'stripe_receipt_url': charge['receipt_url'] if charge else None,
+            }
+            changed = [field for field, value in updates.items() if getattr(payment, field) != value]
+            if changed:
+                for field in changed:
+                    setattr(payment, field, updates[field])
+                payment.change_source = 'sync'
+                payment.save(update_fields=changed + ['updated_at'])
             
             return True
+        except StripeUnavailable:
+            return False
         except Exception as e:
-            print(f"Error syncing payment {payment.id}: {e}")
+            logger.warning(f"Error syncing payment {payment.id}: {e}")
             return False
     
     @staticmethod
@@ -89,6 +108,36 @@ class StripePaymentService:
         }
         return status_mapping.get(stripe_status, 'pending')
     
+    @staticmethod
+    def _sync_open_payments(payments):
+        """Sync only the payments whose status can still change on Stripe"""
+        open_payments = payments.exclude(
+            status__in=StripePaymentService.FINAL_STATUSES
+        ).exclude(stripe_payment_intent_id__isnull=True)
+        gateway = get_stripe_gateway()
+        for payment in open_payments:
+            if not gateway.available:
+                # Breaker is open: serve the locally stored statuses as they are
+                logger.info("Skipping Stripe sync while the circuit breaker is open")
+                break
+            StripePaymentService.sync_payment_with_stripe(payment)
+    
+    @staticmethod
+    def _status_totals(**filters):
+        """Count payments per status and total the completed amount, archive included"""
+        return UnifiedPayments(**filters).aggregate(
+            total_payments=Count('id'),
+            completed_payments=Count('id', filter=Q(status='completed')),
+            pending_payments=Count('id', filter=Q(status='pending')),
+            failed_payments=Count('id', filter=Q(status='failed')),
+            total_paid=Sum('amount', filter=Q(status='completed')),
+        )
+    
+    @staticmethod
+    def _charged(**filters):
+        """Total rent billed from the charge ledger"""
+        return RentCharge.objects.filter(**filters).aggregate(total=Sum('amount'))['total'] or 0
+    
     @staticmethod
     def get_tenant_payment_summary(tenant):
         """Get payment summary for tenant dashboard"""
@@ -97,34 +146,38 @@ class StripePaymentService:
         payments = Payment.objects.filter(tenant=tenant)
         
         # Sync with Stripe for latest status
-        for payment in payments:
-            StripePaymentService.sync_payment_with_stripe(payment)
+        StripePaymentService._sync_open_payments(payments)
         
-        completed_payments = payments.filter(status='completed')
+        totals = StripePaymentService._status_totals(tenant=tenant)
+        total_paid = totals['total_paid'] or 0
         
         # Get tenant's current property and monthly rent
         current_property = tenant.property
         monthly_rent = current_property.monthly_rent if current_property else 0
         
         # Serialize the payment data
+        payments = payments.select_related('property_t', 'tenant__user')
         recent_payments_serialized = PaymentSerializer(
-            completed_payments.order_by('-created_at')[:5], 
+            payments.filter(status='completed').order_by('-created_at')[:5], 
             many=True
         ).data
         
+        # all_payments lists the hot table only; archived rows are counted
+        # in total_payments and reported apart so the two add up
         all_payments_serialized = PaymentSerializer(
             payments.order_by('-created_at'), 
             many=True
         ).data
         
         return {
-            'total_payments': payments.count(),
-            'completed_payments': completed_payments.count(),
-            'total_paid': sum(p.amount for p in completed_payments),
-            'pending_payments': payments.filter(status='pending').count(),
-            'failed_payments': payments.filter(status='failed').count(),
+            'total_payments': totals['total_payments'],
+            'archived_payments': totals['total_payments'] - len(all_payments_serialized),
+            'completed_payments': totals['completed_payments'],
+            'total_paid': total_paid,
+            'pending_payments': totals['pending_payments'],
+            'failed_payments': totals['failed_payments'],
             'monthly_rent': monthly_rent,
-            'outstanding_balance': max(0, monthly_rent - sum(p.amount for p in completed_payments)),
+            'outstanding_balance': max(0, StripePaymentService._charged(tenant=tenant) - total_paid),
             'recent_payments': recent_payments_serialized,
             'all_payments': all_payments_serialized
         }
@@ -132,18 +185,23 @@ class StripePaymentService:
     @staticmethod
     def get_property_payment_summary(property_obj):
         """Get payment summary for a specific property"""
+        from .serializers import PaymentSerializer
+        
         payments = Payment.objects.filter(property_t=property_obj)
         
         # Sync all payments with Stripe
-        for payment in payments:
-            StripePaymentService.sync_payment_with_stripe(payment)
+        StripePaymentService._sync_open_payments(payments)
         
-        completed_payments = payments.filter(status='completed')
+        totals = StripePaymentService._status_totals(property_t=property_obj)
+        total_collected = totals['total_paid'] or 0
+        recent_payments = payments.filter(status='completed').select_related(
+            'property_t', 'tenant__user'
+        ).order_by('-created_at')[:10]
         
         return {
-            'total_payments': payments.count(),
-            'total_collected': sum(p.amount for p in completed_payments),
+            'total_payments': totals['total_payments'],
+            'total_collected': total_collected,
             'monthly_rent': property_obj.monthly_rent,
-            'outstanding_balance': property_obj.monthly_rent - sum(p.amount for p in completed_payments),
-            'recent_payments': completed_payments.order_by('-created_at')[:10]
+            'outstanding_balance': StripePaymentService._charged(property_t=property_obj) - total_collected,
+            'recent_payments': PaymentSerializer(recent_payments, many=True).data
         }
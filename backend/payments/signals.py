@@ -0,0 +1,31 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from dashboard.models import Property
+from .income import invalidate_income_on_commit
+from .models import Payment
+from .outbox import record_change
+from .streams import publish_status_change
+
+
+def _landlord_id(payment, using):
+    if Payment.property_t.is_cached(payment):
+        return payment.property_t.landlord_id if payment.property_t else None
+    return Property.objects.using(using).filter(id=payment.property_t_id).values_list('landlord_id', flat=True).first()
+
+
+@receiver(post_save, sender=Payment)
+def payment_state_changed(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    if not (created or instance.status_changed):
+        return
+    previous_status = None if created else instance._loaded_status
+    landlord_id = _landlord_id(instance, using)
+    # Payment.save() runs this inside its transaction, so the entry commits with the change
+    record_change(instance, previous_status, landlord_id, 'create' if created else instance.change_source, using=using)
+    instance._loaded_status = instance.status
+    # New pending payments do not move any totals; completions and reversals do
+    if not created or instance.status == 'completed':
+        invalidate_income_on_commit([landlord_id], using=using)
+        publish_status_change(instance, previous_status, landlord_id)
@@ -0,0 +1,342 @@
+"""
+Monthly landlord statements as CSV and PDF files.
+
+generate_statements(period) works landlord by landlord, with a section per
+property: rent charged for the month, completed payments received (archive
+included) with their Stripe receipt URLs, and what is still outstanding.
+
+- A grouped signature query per table (properties, payments, charges) runs
+  first, and only landlords whose signature differs from the month's
+  manifest are processed. A rerun after a few payments changed re-renders
+  just those landlords.
+- Statement data for those landlords is pulled with one query per table.
+- Rendering and file writes are spread over a process pool. The workers
+  only turn plain dicts into files and never touch the database.
+- Files land in STATEMENTS_ROOT/<YYYY-MM>/.
+- manifest.json in the same folder records each landlord's signature,
+  files, checksums and render time.
+"""
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Max, Sum
+from django.utils import timezone
+
+from dashboard import sharding
+from dashboard.models import Property
+from .archive import UnifiedPayments
+from .billing import period_end
+from .models import Payment, PaymentArchive, RentCharge
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+CURRENCY = 'KES'
+CSV_COLUMNS = [
+    'row_type', 'property_id', 'address', 'tenant', 'date', 'amount', 'receipt_url',
+    'rent_due', 'received', 'outstanding',
+]
+
+
+@dataclass
+class StatementRun:
+    period: object
+    rendered: list = field(default_factory=list)
+    unchanged: int = 0
+    manifest_path: str = ''
+
+
+def statements_dir(period):
+    return os.path.join(str(settings.STATEMENTS_ROOT), f'{period:%Y-%m}')
+
+
+def _month_bounds(period):
+    start = timezone.make_aware(datetime.combine(period, time.min))
+    return start, start + timedelta(days=(period_end(period) - period).days + 1)
+
+
+def _json_default(value):
+    return str(value)
+
+
+def landlord_signatures(period):
+    """
+    {landlord id: signature} for every landlord with properties on the
+    current database. The signature changes whenever the month's payments,
+    charges or the landlord's units do.
+    """
+    start, end = _month_bounds(period)
+    parts = {}
+
+    def collect(name, rows):
+        for row in rows:
+            landlord_id = row.pop('owner')
+            parts.setdefault(landlord_id, {})[name] = row
+
+    collect('properties', Property.objects.values(owner=F('landlord_id')).annotate(
+        n=Count('id'), rent=Sum('monthly_rent'), last=Max('id')).order_by())
+    month = {'date__gte': start, 'date__lt': end, 'property_t__isnull': False}
+    collect('payments', Payment.objects.filter(**month).values(owner=F('property_t__landlord_id')).annotate(
+        n=Count('id'), total=Sum('amount'), last=Max('updated_at')).order_by())
+    collect('archived', PaymentArchive.objects.filter(**month).values(owner=F('property_t__landlord_id')).annotate(
+        n=Count('id'), total=Sum('amount')).order_by())
+    collect('charges', RentCharge.objects.filter(period=period, property_t__isnull=False).values(
+        owner=F('property_t__landlord_id')).annotate(n=Count('id'), total=Sum('amount')).order_by())
+
+    return {
+        landlord_id: hashlib.sha256(json.dumps(part, sort_keys=True, default=_json_default).encode()).hexdigest()
+        for landlord_id, part in parts.items()
+        if 'properties' in part
+    }
+
+
+def _name(first, last, email):
+    return f'{first or ""} {last or ""}'.strip() or email
+
+
+def load_statements(landlord_ids, period):
+    """Statement data (plain dicts, picklable) of `landlord_ids` for the month, one query per table"""
+    start, end = _month_bounds(period)
+    landlords = {
+        row['id']: row for row in
+        User.objects.filter(id__in=landlord_ids).values('id', 'email', 'first_name', 'last_name')
+    }
+    properties = Property.objects.filter(landlord_id__in=landlord_ids).values(
+        'id', 'landlord_id', 'address', 'monthly_rent').order_by('landlord_id', 'id')
+    charged = dict(
+        RentCharge.objects.filter(period=period, property_t__landlord_id__in=landlord_ids)
+        .values_list('property_t').annotate(total=Sum('amount')).order_by()
+    )
+    payments = {}
+    rows = UnifiedPayments(
+        status='completed', date__gte=start, date__lt=end, property_t__landlord_id__in=landlord_ids,
+    ).values(
+        'property_t_id', 'date', 'amount', 'stripe_receipt_url',
+        'tenant__user__email', 'tenant__user__first_name', 'tenant__user__last_name',
+    ).order_by('property_t_id', 'date')
+    for row in rows:
+        payments.setdefault(row['property_t_id'], []).append({
+            'date': row['date'],
+            'amount': row['amount'],
+            'receipt_url': row['stripe_receipt_url'] or '',
+            'tenant': _name(row['tenant__user__first_name'], row['tenant__user__last_name'], row['tenant__user__email']),
+        })
+
+    statements = {
+        landlord_id: {
+            'landlord_id': landlord_id,
+            'landlord': _name(landlord['first_name'], landlord['last_name'], landlord['email']),
+            'email': landlord['email'],
+            'period': period,
+            'properties': [],
+        }
+        for landlord_id, landlord in landlords.items()
+    }
+    for prop in properties:
+        received = sum((payment['amount'] for payment in payments.get(prop['id'], ())), Decimal(0))
+        rent_due = charged.get(prop['id'], Decimal(0))
+        statements[prop['landlord_id']]['properties'].append({
+            'id': prop['id'],
+            'address': prop['address'],
+            'rent_due': rent_due,
+            'received': received,
+            'outstanding': max(Decimal(0), rent_due - received),
+            'payments': payments.get(prop['id'], []),
+        })
+    return list(statements.values())
+
+
+def _money(amount):
+    return f'{amount:,.2f}'
+
+
+def render_csv(statement):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_COLUMNS)
+    for prop in statement['properties']:
+        writer.writerow([
+            'summary', prop['id'], prop['address'], '', '', '', '',
+            prop['rent_due'], prop['received'], prop['outstanding'],
+        ])
+        for payment in prop['payments']:
+            writer.writerow([
+                'payment', prop['id'], prop['address'], payment['tenant'],
+                payment['date'].date().isoformat(), payment['amount'], payment['receipt_url'], '', '', '',
+            ])
+    return output.getvalue().encode('utf-8')
+
+
+def statement_lines(statement):
+    period = statement['period']
+    lines = [
+        f'Nyumbani statement for {period:%B %Y}',
+        f"Landlord: {statement['landlord']} <{statement['email']}>",
+        '',
+    ]
+    totals = [Decimal(0)] * 3
+    for prop in statement['properties']:
+        totals = [total + prop[key] for total, key in zip(totals, ('rent_due', 'received', 'outstanding'))]
+        lines += [
+            f"{prop['address']} (property {prop['id']})",
+            f"    Rent due {CURRENCY} {_money(prop['rent_due'])}    Received {CURRENCY} {_money(prop['received'])}"
+            f"    Outstanding {CURRENCY} {_money(prop['outstanding'])}",
+        ]
+        for payment in prop['payments']:
+            lines.append(f"    {payment['date']:%Y-%m-%d}  {payment['tenant'][:30]:<30}  {_money(payment['amount']):>12}")
+            if payment['receipt_url']:
+                lines.append(f"        Receipt: {payment['receipt_url']}")
+        lines.append('')
+    lines.append(
+        f'Total rent due {CURRENCY} {_money(totals[0])}    Received {CURRENCY} {_money(totals[1])}'
+        f'    Outstanding {CURRENCY} {_money(totals[2])}'
+    )
+    return lines
+
+
+def _pdf_text(line):
+    # Helvetica's built-in WinAnsi encoding; anything else degrades to '?'
+    text = line.encode('cp1252', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def text_pdf(lines, font_size=9, leading=12, margin=40, page_size=(595, 842)):
+    """A minimal PDF (A4, Helvetica) with `lines` of text flowed over as many pages as needed"""
+    width, height = page_size
+    per_page = int((height - 2 * margin) // leading)
+    pages = [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+    objects = []  # object bodies; object n is objects[n - 1]
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    page_tree = add(None)
+    font = add(b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    page_ids = []
+    for page in pages:
+        text = ''.join(f'({_pdf_text(line)}) Tj T* ' for line in page)
+        stream = f'BT /F1 {font_size} Tf {leading} TL {margin} {height - margin} Td {text}ET'.encode('latin-1')
+        content = add(b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream))
+        page_ids.append(add(
+            f'<< /Type /Page /Parent {page_tree} 0 R /MediaBox [0 0 {width} {height}] '
+            f'/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content} 0 R >>'.encode()
+        ))
+    objects[catalog - 1] = f'<< /Type /Catalog /Pages {page_tree} 0 R >>'.encode()
+    objects[page_tree - 1] = (
+        f"<< /Type /Pages /Kids [{' '.join(f'{page} 0 R' for page in page_ids)}] /Count {len(page_ids)} >>".encode()
+    )
+
+    output = io.BytesIO()
+    output.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    xref = output.tell()
+    output.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b'%010d 00000 n \n' % offset)
+    output.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, catalog, xref))
+    return output.getvalue()
+
+
+def render_pdf(statement):
+    return text_pdf(statement_lines(statement))
+
+
+def _write(path, data):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(data)
+    os.replace(temporary, path)
+    return hashlib.sha256(data).hexdigest()
+
+
+def write_statement(statement, directory):
+    """Render and write one landlord's CSV and PDF; runs in the pool workers"""
+    base = f"landlord-{statement['landlord_id']}"
+    files = {}
+    for extension, render in (('csv', render_csv), ('pdf', render_pdf)):
+        name = f'{base}.{extension}'
+        files[extension] = {'file': name, 'sha256': _write(os.path.join(directory, name), render(statement))}
+    return statement['landlord_id'], files
+
+
+def _init_worker(settings_module):
+    # Needed when workers are spawned rather than forked
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as manifest:
+            return json.load(manifest)
+    except FileNotFoundError:
+        return {'landlords': {}}
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, 'manifest.json')
+    _write(path, json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return path
+
+
+def generate_statements(period, workers=None, force=False):
+    """
+    Write the month's statements of every landlord whose data changed since
+    the last run (all of them with `force`). Returns a StatementRun.
+    """
+    directory = statements_dir(period)
+    os.makedirs(directory, exist_ok=True)
+    manifest = read_manifest(directory)
+    entries = manifest['landlords']
+    run = StatementRun(period=period)
+
+    pending = []
+    signatures = {}
+    for alias in sharding.each_database():
+        with sharding.using_shard(alias):
+            current = landlord_signatures(period)
+            changed = [
+                landlord_id for landlord_id, signature in current.items()
+                if force
+                or entries.get(str(landlord_id), {}).get('signature') != signature
+                or not all(os.path.exists(os.path.join(directory, f['file'])) for f in entries[str(landlord_id)]['files'].values())
+            ]
+            run.unchanged += len(current) - len(changed)
+            signatures.update(current)
+            if changed:
+                pending += load_statements(changed, period)
+
+    workers = workers or settings.STATEMENT_WORKERS or os.cpu_count() or 1
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(pending)), initializer=_init_worker, initargs=(settings.SETTINGS_MODULE,)
+        ) as pool:
+            results = list(pool.map(write_statement, pending, [directory] * len(pending)))
+    else:
+        results = [write_statement(statement, directory) for statement in pending]
+
+    rendered_at = timezone.now().isoformat()
+    for landlord_id, files in results:
+        entries[str(landlord_id)] = {'signature': signatures[landlord_id], 'files': files, 'rendered_at': rendered_at}
+        run.rendered.append(landlord_id)
+    manifest.update({'period': f'{period:%Y-%m}', 'updated_at': rendered_at})
+    run.manifest_path = _write_manifest(directory, manifest)
+    logger.info(f"Statements for {period:%Y-%m}: {len(run.rendered)} rendered, {run.unchanged} unchanged")
+    return run
@@ -0,0 +1,159 @@
+"""
+Payment status push for Server-Sent Events clients.
+
+Whenever a payment changes status (webhook, confirmation, sync), a small
+message is published on the tenant's and the landlord's channel once the
+transaction commits. PaymentStatusStreamView relays those channels to
+browsers as text/event-stream, so the frontend can wait for a payment to
+complete instead of re-polling the payment list and summaries.
+
+The broker is pluggable through PAYMENT_EVENTS_BACKEND: any class with
+publish(channel, message) and a subscribe(channel) that returns a context
+manager with an async get() will do. InProcessBroker only reaches streams
+held by the same process, which is enough for a single ASGI worker; with
+several workers use a backend that fans out between processes (e.g. Redis
+pub/sub).
+"""
+import asyncio
+import itertools
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def tenant_channel(tenant_id):
+    return f'tenant:{tenant_id}'
+
+
+def landlord_channel(landlord_id):
+    return f'landlord:{landlord_id}'
+
+
+class InProcessBroker:
+    """
+    Channels of asyncio queues, one per subscriber. publish() may be called
+    from any thread; messages are handed to each subscriber's event loop.
+    A subscriber that falls more than `max_pending` messages behind loses
+    the oldest ones rather than growing without bound.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def _deliver(self, queue, message):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, message)
+            except RuntimeError:
+                # The subscriber's loop has closed; its stream is gone
+                pass
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+    def subscribe(self, channel):
+        """Call from the event loop that will consume the messages"""
+        subscription = Subscription(self, channel, asyncio.Queue(self.max_pending))
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append((asyncio.get_running_loop(), subscription.queue))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel, [])
+            subscribers[:] = [entry for entry in subscribers if entry[1] is not subscription.queue]
+            if not subscribers:
+                self._subscribers.pop(subscription.channel, None)
+
+
+class Subscription:
+    """Messages of one channel for one consumer; use as a context manager so it is always released"""
+
+    def __init__(self, broker, channel, queue):
+        self.broker = broker
+        self.channel = channel
+        self.queue = queue
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+_sequence = itertools.count(1)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.PAYMENT_EVENTS_BACKEND)()
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting=None, **kwargs):
+    global _broker
+    if setting in (None, 'PAYMENT_EVENTS_BACKEND'):
+        _broker = None
+
+
+def status_message(payment, previous_status):
+    return {
+        'id': next(_sequence),
+        'payment_id': payment.id,
+        'status': payment.status,
+        'previous_status': previous_status,
+        'amount': str(payment.amount),
+        'currency': payment.currency,
+        'tenant_id': payment.tenant_id,
+        'property_id': payment.property_t_id,
+        'updated_at': payment.updated_at.isoformat() if payment.updated_at else None,
+    }
+
+
+def publish_status_change(payment, previous_status, landlord_id):
+    """Push the payment's new status to its tenant and landlord after the transaction commits"""
+    message = status_message(payment, previous_status)
+    channels = [tenant_channel(payment.tenant_id)]
+    if landlord_id is not None:
+        channels.append(landlord_channel(landlord_id))
+
+    def publish():
+        broker = get_broker()
+        for channel in channels:
+            try:
+                broker.publish(channel, message)
+            except Exception as e:
+                # Streams are a convenience; never fail the payment update over them
+                logger.warning(f"Could not publish payment {payment.id} status to {channel}: {e}")
+
+    # On the payment's own database: with sharding the write commits (or rolls back) there, not on default
+    transaction.on_commit(publish, using=router.db_for_write(type(payment), instance=payment))
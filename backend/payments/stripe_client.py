@@ -0,0 +1,209 @@
+"""
+Shared Stripe client with connection reuse, per-operation timeouts, bounded
+retries with jitter and a circuit breaker.
+
+All Stripe API calls go through `get_stripe_gateway()`. Every operation uses
+the same pooled requests.Session so TLS connections are kept alive between
+calls, and when Stripe keeps failing the breaker opens and calls fail fast
+with StripeUnavailable instead of tying up a worker for the full timeout.
+
+stripe and requests are only imported once a gateway is built or an error
+is handled, so processes that never call Stripe (migrations, workers,
+most management commands) do not pay for loading them.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from monitoring.metrics import STRIPE_CALLS, observe_stripe_call
+
+logger = logging.getLogger(__name__)
+
+def transient_errors():
+    """
+    Errors worth retrying and counting against the breaker. Card, validation
+    and authentication errors are the caller's problem and are raised straight away.
+    """
+    import stripe
+    return (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+
+
+def stripe_errors():
+    """Every error raised by the Stripe library"""
+    import stripe
+    return stripe.error.StripeError
+
+
+class StripeUnavailable(Exception):
+    """Raised instead of calling Stripe while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures. Once
+    `reset_timeout` seconds have passed a single trial call is let through:
+    success closes the breaker, failure opens it again.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Let another trial through when one ended without telling us whether Stripe is back"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Stripe circuit breaker opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+                self._trial_in_flight = False
+
+
+class StripeGateway:
+    def __init__(self, api_key, timeouts, max_retries=2, backoff_base=0.2, backoff_cap=2.0,
+                 breaker=None, pool_size=10, sleep=time.sleep):
+        self.api_key = api_key
+        self.timeouts = timeouts
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def _client(self, operation):
+        """One StripeClient per timeout, all sharing the pooled session"""
+        timeout = self.timeouts.get(operation, self.timeouts['default'])
+        with self._clients_lock:
+            client = self._clients.get(timeout)
+            if client is None:
+                import stripe
+                http_client = stripe.RequestsClient(timeout=timeout, session=self.session)
+                client = self._clients[timeout] = stripe.StripeClient(
+                    self.api_key, http_client=http_client, max_network_retries=0
+                )
+            return client
+
+    def _backoff(self, attempt):
+        # Full jitter: spreads retries from many workers instead of synchronising them
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _call(self, operation, request):
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow_request():
+                STRIPE_CALLS.inc(operation=operation, outcome='short_circuit')
+                raise StripeUnavailable(f"Stripe {operation} skipped: circuit breaker is open")
+            try:
+                with observe_stripe_call(operation):
+                    result = request(self._client(operation))
+            except transient_errors() as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                logger.info(f"Retrying Stripe {operation} after error: {e}")
+                self.sleep(self._backoff(attempt))
+            except stripe_errors():
+                # Declines and validation errors still mean Stripe answered
+                self.breaker.record_success()
+                raise
+            except BaseException:
+                # Every trial needs an outcome, or the half-open breaker never lets another call through
+                self.breaker.release_trial()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    def create_payment_intent(self, params, idempotency_key=None):
+        # Retries of a create must carry the same key or Stripe may create two intents
+        options = {'idempotency_key': idempotency_key or f'nyumbani-{uuid.uuid4()}'}
+        return self._call(
+            'create', lambda client: client.v1.payment_intents.create(params=params, options=options)
+        )
+
+    def retrieve_payment_intent(self, intent_id):
+        return self._call('retrieve', lambda client: client.v1.payment_intents.retrieve(intent_id))
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_stripe_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = StripeGateway(
+                    api_key=settings.STRIPE_SECRET_KEY,
+                    timeouts=settings.STRIPE_TIMEOUTS,
+                    max_retries=settings.STRIPE_MAX_RETRIES,
+                    breaker=CircuitBreaker(
+                        failure_threshold=settings.STRIPE_CIRCUIT_FAILURE_THRESHOLD,
+                        reset_timeout=settings.STRIPE_CIRCUIT_RESET_SECONDS,
+                    ),
+                    pool_size=settings.STRIPE_HTTP_POOL_SIZE,
+                )
+    return _gateway
+
+
+def reset_stripe_gateway():
+    """Drop the shared gateway so the next call picks up current settings"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is not None:
+            _gateway.session.close()
+        _gateway = None
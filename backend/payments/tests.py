@@ -1,3 +1,1103 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import stripe
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db.models import Count, Max, Sum
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from dashboard.models import Property, Tenant
+from dashboard.testing import PAYMENTS_PER_TENANT, QueryBudgetTestCase
+from .archive import UnifiedPayments, archive_payments
+from .arrears import compute_aging, load_arrears
+from .income import compute_income_series
+from .billing import run_billing, tenant_balance, tenant_balances
+from .events import process_events
+from .models import (
+    ArrearsSnapshot, IdempotencyRecord, Payment, PaymentArchive, PaymentChange, ProcessedStripeEvent, ReminderLog, RentCharge,
+)
+from .reminders import rent_due_date, send_reminders
+from .services import StripePaymentService
+from .statements import generate_statements, read_manifest, statements_dir, text_pdf
+from .stripe_client import CircuitBreaker, StripeGateway, StripeUnavailable
+from .streams import InProcessBroker, get_broker, landlord_channel, tenant_channel
+
+User = get_user_model()
+
+
+def payment_intent_payload(intent_id, status='succeeded', amount=1500000):
+    """The JSON body Stripe sends for a PaymentIntent"""
+    charges = [{'id': f'ch_{intent_id}', 'receipt_url': f'https://pay.stripe.com/receipts/{intent_id}'}]
+    return {
+        'id': intent_id,
+        'object': 'payment_intent',
+        'amount': amount,
+        'currency': 'kes',
+        'status': status,
+        'client_secret': f'{intent_id}_secret',
+        'payment_method': 'pm_card_visa',
+        'charges': {'data': charges if status == 'succeeded' else []},
+        'metadata': {},
+        'created': 1700000000,
+    }
+
+
+def fake_payment_intent(intent_id, status='succeeded', amount=1500000):
+    """Build a Stripe PaymentIntent object without touching the network"""
+    return stripe.PaymentIntent.construct_from(
+        payment_intent_payload(intent_id, status, amount), 'sk_test_stub'
+    )
+
+
+class StubStripeMixin:
+    """Patches the shared Stripe gateway for the duration of each test"""
+
+    def setUp(self):
+        super().setUp()
+        self.created_intents = 0
+        self.intent_status = 'requires_payment_method'
+
+        def create(params, idempotency_key=None):
+            self.created_intents += 1
+            return fake_payment_intent(f'pi_created_{self.created_intents}', status='requires_payment_method')
+
+        def retrieve(intent_id):
+            return fake_payment_intent(intent_id, status=self.intent_status)
+
+        for name, side_effect in (('create_payment_intent', create), ('retrieve_payment_intent', retrieve)):
+            patcher = mock.patch.object(StripeGateway, name, side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class PaymentsQueryBudgetTests(StubStripeMixin, QueryBudgetTestCase):
+
+    def test_create_payment_intent(self):
+        def make_request(portfolio):
+            tenant = portfolio.primary_tenant
+            self.authenticate(tenant.user)
+            return self.client.post(reverse('create_payment_intent'), {
+                'amount': '15000.00',
+                'property_id': tenant.property.id,
+            }, format='json')
+        # Includes the PaymentChange entry for the new payment
+        self.assertQueryBudget(5, make_request)
+        self.assertEqual(self.created_intents, len(self.portfolios))
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='')
+    def test_stripe_webhook(self):
+        def make_request(portfolio):
+            intent = payment_intent_payload(portfolio.pending_payment.stripe_payment_intent_id)
+            return self.client.post(reverse('stripe_webhook'), {
+                'id': f'evt_{intent["id"]}',
+                'type': 'payment_intent.succeeded',
+                'data': {'object': intent},
+            }, format='json')
+        # Savepoint, seen-id lookup, payment lookup, bulk update, change feed insert, event id insert, release
+        self.assertQueryBudget(7, make_request)
+
+        for portfolio in self.portfolios:
+            self.assertEqual(Payment.objects.get(id=portfolio.pending_payment.id).status, 'completed')
+        self.assertEqual(ProcessedStripeEvent.objects.count(), len(self.portfolios))
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_signed_stripe_webhook(self):
+        payment = self.portfolios[0].pending_payment
+        payload = json.dumps({
+            'id': 'evt_signed',
+            'object': 'event',
+            'type': 'payment_intent.succeeded',
+            'created': int(time.time()),
+            'data': {'object': payment_intent_payload(payment.stripe_payment_intent_id)},
+        })
+        timestamp = int(time.time())
+        signature = stripe.WebhookSignature._compute_signature(f'{timestamp}.{payload}', 'whsec_test')
+        response = self.client.post(
+            reverse('stripe_webhook'), payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}',
+        )
+        self.assertEqual(response.status_code, 200)
+        payment = Payment.objects.get(id=payment.id)
+        self.assertEqual((payment.status, payment.stripe_charge_id), ('completed', f'ch_{payment.stripe_payment_intent_id}'))
+
+        response = self.client.post(
+            reverse('stripe_webhook'), payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=f't={timestamp},v1=bad',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_confirm_payment(self):
+        self.intent_status = 'succeeded'
+
+        def make_request(portfolio):
+            return self.client.post(reverse('confirm_payment'), {
+                'payment_intent_id': portfolio.pending_payment.stripe_payment_intent_id,
+            }, format='json')
+        # Payment lookup, update, change feed insert
+        self.assertQueryBudget(3, make_request)
+
+    def test_tenant_payment_summary(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.primary_tenant.user)
+            return self.client.get(reverse('tenant_payment_summary'))
+        self.assertQueryBudget(9, make_request)
+
+    def test_tenant_payment_summary_totals(self):
+        portfolio = self.portfolios[-1]
+        self.authenticate(portfolio.primary_tenant.user)
+        data = self.client.get(reverse('tenant_payment_summary')).data
+        self.assertEqual(data['pending_payments'], 1)
+        self.assertEqual(data['archived_payments'], 0)
+        self.assertEqual(data['total_payments'], len(data['all_payments']))
+        self.assertEqual(data['completed_payments'], data['total_payments'] - 1)
+
+    def test_property_payment_summary(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.get(reverse('property_payment_summary'), {
+                'property_id': portfolio.primary_tenant.property.id,
+            })
+        self.assertQueryBudget(7, make_request)
+
+    def test_payment_list(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.primary_tenant.user)
+            return self.client.get(reverse('payment_list'), {'tenant_id': portfolio.primary_tenant.id})
+        self.assertQueryBudget(2, make_request)
+
+    def test_payment_detail(self):
+        def make_request(portfolio):
+            self.authenticate(portfolio.primary_tenant.user)
+            return self.client.get(reverse('payment_detail', args=[portfolio.pending_payment.id]))
+        self.assertQueryBudget(2, make_request)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_opens_after_threshold_and_allows_one_trial_after_timeout(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        clock.now = 10
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_reopens(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+
+
+class StripeGatewayTests(SimpleTestCase):
+
+    def make_gateway(self, responses, **kwargs):
+        gateway = StripeGateway('sk_test_stub', {'default': 1}, sleep=lambda seconds: None, **kwargs)
+        client = mock.Mock()
+        client.v1.payment_intents.retrieve.side_effect = responses
+        client.v1.payment_intents.create.side_effect = responses
+        gateway._client = mock.Mock(return_value=client)
+        return gateway, client
+
+    def test_transient_errors_are_retried(self):
+        intent = fake_payment_intent('pi_retry')
+        gateway, client = self.make_gateway([stripe.error.APIConnectionError('reset'), intent], max_retries=2)
+
+        self.assertEqual(gateway.retrieve_payment_intent('pi_retry'), intent)
+        self.assertEqual(client.v1.payment_intents.retrieve.call_count, 2)
+
+    def test_create_retries_reuse_one_idempotency_key(self):
+        gateway, client = self.make_gateway(
+            [stripe.error.APIConnectionError('reset'), fake_payment_intent('pi_new')], max_retries=1
+        )
+        gateway.create_payment_intent({'amount': 100, 'currency': 'kes'})
+
+        keys = {call.kwargs['options']['idempotency_key'] for call in client.v1.payment_intents.create.call_args_list}
+        self.assertEqual(len(keys), 1)
+
+    def test_card_errors_are_not_retried(self):
+        gateway, client = self.make_gateway([stripe.error.CardError('declined', None, 'card_declined')])
+
+        with self.assertRaises(stripe.error.CardError):
+            gateway.retrieve_payment_intent('pi_declined')
+        self.assertEqual(client.v1.payment_intents.retrieve.call_count, 1)
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_open_breaker_short_circuits(self):
+        gateway, client = self.make_gateway(
+            [stripe.error.APIConnectionError('timeout')] * 3,
+            max_retries=2, breaker=CircuitBreaker(failure_threshold=2),
+        )
+        with self.assertRaises(StripeUnavailable):
+            gateway.retrieve_payment_intent('pi_down')
+        self.assertEqual(client.v1.payment_intents.retrieve.call_count, 2)
+
+        with self.assertRaises(StripeUnavailable):
+            gateway.retrieve_payment_intent('pi_down')
+        self.assertEqual(client.v1.payment_intents.retrieve.call_count, 2)
+        self.assertFalse(gateway.available)
+
+
+    def test_declined_trial_closes_the_breaker(self):
+        clock = FakeClock()
+        gateway, client = self.make_gateway(
+            [stripe.error.APIConnectionError('timeout'), stripe.error.CardError('declined', None, 'card_declined'),
+             fake_payment_intent('pi_back')],
+            max_retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock),
+        )
+        with self.assertRaises(stripe.error.APIConnectionError):
+            gateway.retrieve_payment_intent('pi_down')
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.OPEN)
+
+        clock.now = 10
+        with self.assertRaises(stripe.error.CardError):
+            gateway.retrieve_payment_intent('pi_declined')
+        self.assertEqual(gateway.retrieve_payment_intent('pi_back').id, 'pi_back')
+        self.assertEqual(gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_trial_ending_in_another_error_lets_the_next_call_through(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        gateway, _ = self.make_gateway([ValueError('bad response'), fake_payment_intent('pi_back')], breaker=breaker)
+        with self.assertRaises(ValueError):
+            gateway.retrieve_payment_intent('pi_odd')
+        self.assertEqual(gateway.retrieve_payment_intent('pi_back').id, 'pi_back')
+
+
+class StripeOutageTests(QueryBudgetTestCase):
+    LARGE_SCALE = 20
+
+    def setUp(self):
+        super().setUp()
+        outage = mock.patch.object(
+            StripeGateway, 'retrieve_payment_intent', side_effect=StripeUnavailable('open')
+        )
+        self.retrieve = outage.start()
+        self.addCleanup(outage.stop)
+        available = mock.patch.object(StripeGateway, 'available', new_callable=mock.PropertyMock, return_value=False)
+        available.start()
+        self.addCleanup(available.stop)
+
+    def test_summary_serves_local_data_without_calling_stripe(self):
+        portfolio = self.portfolios[-1]
+        self.authenticate(portfolio.primary_tenant.user)
+        response = self.client.get(reverse('tenant_payment_summary'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['pending_payments'], 1)
+        self.retrieve.assert_not_called()
+
+    def test_confirm_returns_local_status(self):
+        portfolio = self.portfolios[-1]
+        response = self.client.post(reverse('confirm_payment'), {
+            'payment_intent_id': portfolio.pending_payment.stripe_payment_intent_id,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertTrue(response.data['stale'])
+
+
+@override_settings(DELTA_SYNC_OVERLAP_SECONDS=0)
+class PaymentDeltaSyncTests(QueryBudgetTestCase):
+    LARGE_SCALE = 5
+
+    def test_since_returns_changed_and_archived_payments(self):
+        tenant = self.portfolios[-1].primary_tenant
+        self.authenticate(tenant.user)
+        full = self.client.get(reverse('payment_list'), {'tenant_id': tenant.id})
+        watermark = full['X-Sync-Watermark']
+
+        pending = Payment.objects.get(id=self.portfolios[-1].pending_payment.id)
+        pending.status = 'completed'
+        pending.save()
+        old = Payment.objects.filter(tenant=tenant).exclude(id=pending.id).order_by('id').first()
+        Payment.objects.filter(id=old.id).update(date=timezone.now() - timedelta(days=400))
+        archive_payments()
+
+        response = self.client.get(reverse('payment_list'), {'tenant_id': tenant.id, 'since': watermark})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['payments']], [pending.id])
+        self.assertEqual(response.data['deleted'], [old.id])
+        self.assertFalse(response.data['full'])
+        self.assertEqual(self.client.get(reverse('payment_list'), {'tenant_id': tenant.id, 'since': 'soon'}).status_code, 400)
+
+
+class PaymentAdminTests(QueryBudgetTestCase):
+    LARGE_SCALE = 150
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser(email='support@example.com', password='Nyumbani-test-pass-1'))
+
+    def test_changelist_query_count_does_not_grow_with_the_table(self):
+        def make_request(portfolio):
+            return self.client.get(reverse('admin:payments_payment_changelist'), {'q': portfolio.primary_tenant.user.email})
+        # Session, user, capped count, one page of payments with tenant, user and property joined
+        self.assertQueryBudget(4, make_request)
+
+    def test_keyset_pages_cover_every_payment_once(self):
+        tenant = self.portfolios[-1].primary_tenant
+        changelist_url = reverse('admin:payments_payment_changelist')
+        query = f'?status__exact=completed&q={tenant.user.email}'
+        seen = []
+        while query:
+            response = self.client.get(changelist_url + query)
+            self.assertEqual(response.status_code, 200)
+            changelist = response.context['cl']
+            seen += [payment.pk for payment in changelist.result_list]
+            query = changelist.next_cursor_url
+        expected = list(Payment.objects.filter(tenant=tenant, status='completed').order_by('-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertGreater(len(expected), 100)
+
+
+class PaymentArchiveTests(StubStripeMixin, QueryBudgetTestCase):
+    LARGE_SCALE = 20
+
+    def test_archive_moves_only_old_terminal_payments(self):
+        portfolio = self.portfolios[-1]
+        Payment.objects.filter(tenant__property__landlord=portfolio.landlord).update(
+            date=timezone.now() - timedelta(days=400)
+        )
+        before = UnifiedPayments(tenant__property__landlord=portfolio.landlord, status='completed').aggregate(
+            total=Sum('amount'), count=Count('id')
+        )
+
+        archived = archive_payments(batch_size=7)
+
+        self.assertEqual(archived, before['count'])
+        self.assertEqual(PaymentArchive.objects.count(), archived)
+        # The pending payment is not terminal and stays hot
+        self.assertTrue(Payment.objects.filter(id=portfolio.pending_payment.id).exists())
+        after = UnifiedPayments(tenant__property__landlord=portfolio.landlord, status='completed').aggregate(
+            total=Sum('amount'), count=Count('id')
+        )
+        self.assertEqual(after, before)
+        self.assertEqual(archive_payments(), 0)
+
+    def test_rollups_include_archived_history(self):
+        tenant = self.portfolios[-1].primary_tenant
+        self.authenticate(tenant.user)
+        before = self.client.get(reverse('tenant_payment_summary')).data
+
+        Payment.objects.filter(tenant=tenant).update(date=timezone.now() - timedelta(days=400))
+        archive_payments()
+
+        after = self.client.get(reverse('tenant_payment_summary')).data
+        self.assertEqual(after['total_paid'], before['total_paid'])
+        self.assertEqual(after['completed_payments'], before['completed_payments'])
+        self.assertEqual(len(after['all_payments']), 1)
+        self.assertEqual(after['total_payments'], before['total_payments'])
+        self.assertEqual(after['archived_payments'], before['total_payments'] - 1)
+        self.assertEqual(after['total_payments'], len(after['all_payments']) + after['archived_payments'])
+
+    def test_unified_values_union(self):
+        Payment.objects.update(date=timezone.now() - timedelta(days=400))
+        total = Payment.objects.count()
+        archive_payments()
+
+        rows = UnifiedPayments().values('id', 'amount').order_by('id')
+        self.assertEqual(len(rows), total)
+
+    def test_non_additive_aggregates_are_rejected(self):
+        with self.assertRaises(TypeError):
+            UnifiedPayments().aggregate(latest=Max('date'))
+
+
+class BillingTests(StubStripeMixin, QueryBudgetTestCase):
+    LARGE_SCALE = 50
+
+    def setUp(self):
+        super().setUp()
+        self.period = timezone.now().date().replace(day=1)
+
+    def test_billing_run_is_idempotent_per_tenant_and_period(self):
+        assigned = Tenant.objects.filter(property__isnull=False).count()
+
+        self.assertEqual(run_billing(self.period, batch_size=7), assigned)
+        self.assertEqual(run_billing(self.period), 0)
+        self.assertEqual(RentCharge.objects.filter(period=self.period).count(), assigned)
+
+        next_period = (self.period + timedelta(days=32)).replace(day=1)
+        self.assertEqual(run_billing(next_period), assigned)
+
+    def test_tenants_outside_their_lease_are_not_billed(self):
+        tenant = self.portfolios[0].primary_tenant
+        Tenant.objects.filter(id=tenant.id).update(lease_end=self.period - timedelta(days=1))
+        run_billing(self.period)
+
+        self.assertFalse(RentCharge.objects.filter(tenant=tenant).exists())
+
+    def test_balance_comes_from_charge_and_payment_ledgers(self):
+        tenant = self.portfolios[-1].tenants[1]
+        run_billing(self.period)
+        run_billing((self.period - timedelta(days=1)).replace(day=1))
+
+        rent = tenant.property.monthly_rent
+        paid = rent * PAYMENTS_PER_TENANT
+        self.assertEqual(tenant_balance(tenant), 2 * rent - paid)
+        self.assertEqual(tenant_balances(Tenant.objects.filter(id=tenant.id)), {tenant.id: 2 * rent - paid})
+
+    def test_summary_outstanding_balance_uses_ledger(self):
+        tenant = self.portfolios[-1].primary_tenant
+        RentCharge.objects.create(
+            tenant=tenant, property_t=tenant.property, period=self.period,
+            amount=Decimal('1000000.00'), due_date=self.period,
+        )
+        self.authenticate(tenant.user)
+        data = self.client.get(reverse('tenant_payment_summary')).data
+
+        self.assertEqual(data['outstanding_balance'], Decimal('1000000.00') - data['total_paid'])
+
+    def test_run_billing_command(self):
+        out = StringIO()
+        call_command('run_billing', period=f'{self.period:%Y-%m}', stdout=out)
+        self.assertIn('Issued', out.getvalue())
+
+
+class RentReminderTests(QueryBudgetTestCase):
+    LARGE_SCALE = 50
+
+    def setUp(self):
+        super().setUp()
+        # The day before rent is due: every assigned tenant gets a rent reminder
+        self.today = rent_due_date(timezone.now().date()) - timedelta(days=1)
+        self.assigned = Tenant.objects.filter(property__isnull=False).count()
+        self.leaving = self.portfolios[-1].tenants[2]
+        Tenant.objects.filter(id=self.leaving.id).update(lease_end=self.today + timedelta(days=10))
+
+    def test_reminders_are_batched_on_one_connection_and_sent_once(self):
+        mail_connection = get_connection()
+        with mock.patch.object(mail_connection, 'open', wraps=mail_connection.open) as opened, \
+                mock.patch.object(mail_connection, 'send_messages', wraps=mail_connection.send_messages) as sends, \
+                CaptureQueriesContext(connection) as queries:
+            stats = send_reminders(self.today, batch_size=10, connection=mail_connection)
+
+        self.assertEqual(stats.sent, {'rent_due': self.assigned, 'lease_end': 1})
+        self.assertEqual(len(mail.outbox), self.assigned + 1)
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(sends.call_count, stats.batches)
+        self.assertEqual(stats.batches, -(-(self.assigned + 1) // 10))
+        # One recipient query, then one log insert per batch
+        self.assertEqual(len(queries), 1 + stats.batches)
+        self.assertEqual(ReminderLog.objects.count(), self.assigned + 1)
+
+        rent = next(message for message in mail.outbox if message.to == [self.leaving.user.email] and 'Rent' in message.subject)
+        self.assertIn('KES 15,000.00', rent.subject)
+        self.assertIn(self.leaving.property.address, rent.body)
+        self.assertTrue(any('lease' in message.subject for message in mail.outbox if message.to == [self.leaving.user.email]))
+
+        self.assertEqual(send_reminders(self.today).total, 0)
+        self.assertEqual(len(mail.outbox), self.assigned + 1)
+
+    def test_nothing_is_due_outside_the_reminder_windows(self):
+        self.assertEqual(send_reminders(self.today - timedelta(days=40)).total, 0)
+
+    def test_failed_batches_are_retried_on_the_next_run(self):
+        mail_connection = get_connection()
+        with mock.patch.object(mail_connection, 'send_messages', side_effect=OSError('smtp down')):
+            stats = send_reminders(self.today, connection=mail_connection)
+        self.assertEqual((stats.total, stats.failed), (0, self.assigned + 1))
+        self.assertFalse(ReminderLog.objects.exists())
+
+        self.assertEqual(send_reminders(self.today).total, self.assigned + 1)
+
+    def test_send_rent_reminders_command(self):
+        out = StringIO()
+        call_command('send_rent_reminders', date=self.today.isoformat(), dry_run=True, stdout=out)
+        self.assertIn(f'Would send {self.assigned + 1} reminders', out.getvalue())
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class StatementTests(QueryBudgetTestCase):
+    LARGE_SCALE = 20
+
+    def setUp(self):
+        super().setUp()
+        self.period = timezone.now().date().replace(day=1)
+        run_billing(self.period)
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        overrides = override_settings(STATEMENTS_ROOT=self.root.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        large = self.portfolios[-1]
+        Payment.objects.filter(tenant=large.tenants[1]).update(stripe_receipt_url='https://pay.stripe.com/receipts/rcpt_1')
+
+    def read_csv(self, landlord):
+        with open(os.path.join(statements_dir(self.period), f'landlord-{landlord.id}.csv'), newline='') as statement:
+            return list(csv.DictReader(statement))
+
+    def test_statements_per_landlord_with_property_sections(self):
+        with CaptureQueriesContext(connection) as queries:
+            run = generate_statements(self.period, workers=1)
+        # Four signature queries, then landlords, properties, charges and payments
+        self.assertEqual(len(queries), 8)
+        self.assertEqual(sorted(run.rendered), sorted(portfolio.landlord.id for portfolio in self.portfolios))
+
+        large = self.portfolios[-1]
+        rows = self.read_csv(large.landlord)
+        summaries = [row for row in rows if row['row_type'] == 'summary']
+        self.assertEqual(len(summaries), len(large.properties) + len(large.vacant_properties))
+        occupied = next(row for row in summaries if row['property_id'] == str(large.tenants[1].property_id))
+        rent = large.tenants[1].property.monthly_rent
+        self.assertEqual(Decimal(occupied['rent_due']), rent)
+        self.assertEqual(Decimal(occupied['received']), rent * PAYMENTS_PER_TENANT)
+        self.assertEqual(Decimal(occupied['outstanding']), 0)
+        self.assertIn('https://pay.stripe.com/receipts/rcpt_1', {row['receipt_url'] for row in rows})
+
+        with open(os.path.join(statements_dir(self.period), f'landlord-{large.landlord.id}.pdf'), 'rb') as pdf:
+            content = pdf.read()
+        self.assertTrue(content.startswith(b'%PDF-1.4') and content.rstrip().endswith(b'%%EOF'))
+        self.assertIn(large.properties[0].address.encode(), content)
+
+        manifest = read_manifest(statements_dir(self.period))
+        self.assertEqual(set(manifest['landlords']), {str(portfolio.landlord.id) for portfolio in self.portfolios})
+
+    def test_reruns_only_render_landlords_with_changes(self):
+        generate_statements(self.period, workers=1)
+        run = generate_statements(self.period, workers=1)
+        self.assertEqual((run.rendered, run.unchanged), ([], 2))
+
+        small = self.portfolios[0]
+        Payment.objects.create(tenant=small.primary_tenant, property_t=small.primary_tenant.property, amount=Decimal('10.00'), status='completed')
+        run = generate_statements(self.period, workers=1)
+        self.assertEqual((run.rendered, run.unchanged), ([small.landlord.id], 1))
+        self.assertEqual(len([row for row in self.read_csv(small.landlord) if row['row_type'] == 'payment']), 1 + PAYMENTS_PER_TENANT + small.scale)
+
+    def test_process_pool_output_matches_in_process_rendering(self):
+        in_process = generate_statements(self.period, workers=1)
+        files = read_manifest(statements_dir(self.period))['landlords']
+        pooled = generate_statements(self.period, workers=2, force=True)
+        self.assertEqual(sorted(pooled.rendered), sorted(in_process.rendered))
+        for landlord_id, entry in read_manifest(statements_dir(self.period))['landlords'].items():
+            self.assertEqual(entry['files']['csv']['sha256'], files[landlord_id]['files']['csv']['sha256'])
+            self.assertEqual(entry['files']['pdf']['sha256'], files[landlord_id]['files']['pdf']['sha256'])
+
+    def test_text_pdf_flows_over_pages(self):
+        content = text_pdf([f'line {i} (with parentheses)' for i in range(150)])
+        self.assertEqual(content.count(b'/Type /Page '), 3)
+        self.assertIn(b'line 149 \\(with parentheses\\)', content)
+
+    def test_generate_statements_command(self):
+        out = StringIO()
+        call_command('generate_statements', period=f'{self.period:%Y-%m}', workers=1, stdout=out)
+        self.assertIn('Rendered 2 statements', out.getvalue())
+
+
+class ComputeAgingTests(SimpleTestCase):
+    def test_payments_settle_oldest_charges_first(self):
+        as_of = date(2026, 6, 30)
+        due = np.array(['2026-02-28', '2026-03-31', '2026-04-30', '2026-05-31', '2026-06-30', '2026-07-31'],
+                       dtype='datetime64[D]')
+        report = compute_aging(
+            charge_tenants=np.array([7] * 6 + [8]),
+            charge_cents=np.array([1000] * 6 + [500]),
+            charge_due=np.concatenate([due, due[:1]]),
+            payment_tenants=np.array([7, 7, 9]),
+            payment_cents=np.array([1500, 1000, 200]),
+            as_of=as_of,
+        )
+
+        self.assertEqual(report.tenant_ids.tolist(), [7, 8, 9])
+        self.assertEqual(report.balance.tolist(), [3500, 500, -200])
+        # Tenant 7: Feb, Mar covered, Apr half covered; Jul is not due yet
+        self.assertEqual(report.aging.tolist(), [[1000, 1000, 500, 0], [0, 0, 0, 500], [0, 0, 0, 0]])
+        self.assertEqual(report.totals()['tenants_in_arrears'], 2)
+        self.assertEqual([row['tenant_id'] for row in report.rows(only_overdue=True)], [7, 8])
+
+
+class ArrearsTests(QueryBudgetTestCase):
+    LARGE_SCALE = 50
+
+    def charge(self, tenant, days_ago):
+        due_date = timezone.now().date() - timedelta(days=days_ago)
+        RentCharge.objects.create(
+            tenant=tenant, property_t=tenant.property, period=due_date.replace(day=1),
+            amount=tenant.property.monthly_rent, due_date=due_date,
+        )
+
+    def test_landlord_arrears(self):
+        for portfolio in self.portfolios:
+            # Three rent payments against five charges leaves the two newest unpaid
+            for days_ago in (150, 120, 95, 40, 3):
+                self.charge(portfolio.tenants[-1], days_ago)
+
+        def request(portfolio):
+            self.authenticate(portfolio.landlord)
+            return self.client.get(reverse('landlord_arrears'))
+
+        self.assertQueryBudget(5, request)
+        data = request(self.portfolios[-1]).data['data']
+        self.assertEqual([row['tenant_id'] for row in data['tenants']], [self.portfolios[-1].tenants[-1].id])
+        row = data['tenants'][0]
+        self.assertEqual((row['days_0_29'], row['days_30_59'], row['days_90_plus']),
+                         (Decimal('15000.00'), Decimal('15000.00'), Decimal('0.00')))
+        self.assertEqual(row['property_address'], self.portfolios[-1].tenants[-1].property.address)
+        self.assertEqual(data['totals']['overdue'], Decimal('30000.00'))
+
+    def test_arrears_requires_landlord(self):
+        self.authenticate(self.portfolios[0].primary_tenant.user)
+        self.assertEqual(self.client.get(reverse('landlord_arrears')).status_code, 403)
+
+    def test_snapshot_replaces_the_days_rows(self):
+        tenant = self.portfolios[0].primary_tenant
+        self.charge(tenant, 100)
+        RentCharge.objects.filter(tenant=tenant).update(amount=Decimal('100000.00'))
+
+        call_command('snapshot_arrears', stdout=StringIO())
+        call_command('snapshot_arrears', stdout=StringIO())
+
+        snapshot = ArrearsSnapshot.objects.get(tenant=tenant)
+        report = load_arrears()
+        self.assertEqual(ArrearsSnapshot.objects.count(), np.count_nonzero(report.balance))
+        self.assertEqual(snapshot.days_90_plus, snapshot.balance)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='')
+class IncomeSeriesTests(QueryBudgetTestCase):
+    LARGE_SCALE = 30
+
+    def request(self, portfolio, months=12):
+        self.authenticate(portfolio.landlord)
+        return self.client.get(reverse('landlord_income'), {'months': months})
+
+    def test_income_series_budget_and_cache(self):
+        self.assertQueryBudget(5, self.request)
+
+        portfolio = self.portfolios[-1]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.request(portfolio).status_code, 200)
+        # Cached: only the user lookup from authentication
+        self.assertEqual(len(queries), 1)
+
+    def test_series_totals(self):
+        portfolio = self.portfolios[-1]
+        period = timezone.now().date().replace(day=1)
+        run_billing(period)
+        data = self.request(portfolio, months=24).data['data']
+
+        self.assertEqual(len(data['months']), 24)
+        self.assertEqual(data['months'][-1], f'{period:%Y-%m}')
+        rent = portfolio.properties[0].monthly_rent
+        this_month = data['total'][-1]
+        self.assertEqual(this_month['collected'], rent * PAYMENTS_PER_TENANT * portfolio.scale + Decimal('500.00') * portfolio.scale)
+        self.assertEqual(this_month['expected'], rent * portfolio.scale)
+        self.assertEqual(data['total'][0]['collection_rate'], None)
+        unit = next(row for row in data['properties'] if row['id'] == portfolio.properties[1].id)
+        self.assertEqual(unit['series'][-1]['collection_rate'], float(PAYMENTS_PER_TENANT))
+
+    def test_payment_completion_invalidates_the_landlords_series(self):
+        portfolio = self.portfolios[-1]
+        before = self.request(portfolio).data['data']['total'][-1]['collected']
+        other = self.request(self.portfolios[0]).data['data']['total'][-1]['collected']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('stripe_webhook'), {
+                'type': 'payment_intent.succeeded',
+                'data': {'object': payment_intent_payload(portfolio.pending_payment.stripe_payment_intent_id)},
+            }, format='json')
+
+        after = self.request(portfolio).data['data']['total'][-1]['collected']
+        self.assertEqual(after, before + portfolio.pending_payment.amount)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.request(self.portfolios[0]).data['data']['total'][-1]['collected'], other)
+        self.assertEqual(len(queries), 1)
+
+    def test_invalidation_waits_for_the_commit(self):
+        portfolio = self.portfolios[-1]
+        before = self.request(portfolio).data['data']['total'][-1]['collected']
+        payment = portfolio.pending_payment
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            payment.status = 'completed'
+            payment.save()
+            # A read inside the writing transaction still gets the cached series
+            self.assertEqual(self.request(portfolio).data['data']['total'][-1]['collected'], before)
+        self.assertEqual(self.request(portfolio).data['data']['total'][-1]['collected'], before)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.request(portfolio).data['data']['total'][-1]['collected'], before + payment.amount)
+
+    def test_billing_and_property_changes_invalidate_the_series(self):
+        portfolio = self.portfolios[-1]
+        period = timezone.now().date().replace(day=1)
+        self.assertEqual(self.request(portfolio).data['data']['total'][-1]['expected'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            run_billing(period)
+        self.assertEqual(self.request(portfolio).data['data']['total'][-1]['expected'], portfolio.properties[0].monthly_rent * portfolio.scale)
+
+        count = len(self.request(portfolio).data['data']['properties'])
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Property.objects.create(
+                landlord=portfolio.landlord, address='1 New Road', monthly_rent=Decimal('900.00'),
+            )
+        self.assertEqual(len(self.request(portfolio).data['data']['properties']), count + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            added.delete()
+        self.assertEqual(len(self.request(portfolio).data['data']['properties']), count)
+
+    def test_archived_payments_are_included(self):
+        portfolio = self.portfolios[0]
+        Payment.objects.filter(tenant__property__landlord=portfolio.landlord).update(date=timezone.now() - timedelta(days=400))
+        expected = compute_income_series(portfolio.landlord, months=24)
+        archive_payments()
+
+        self.assertEqual(compute_income_series(portfolio.landlord, months=24), expected)
+        self.assertEqual(self.request(portfolio, months=99).status_code, 400)
+
+
+class StripeEventReplayTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.checkpoint = f'{self.path}.offset'
+        self.addCleanup(lambda: os.path.exists(self.checkpoint) and os.remove(self.checkpoint))
+
+    def event(self, event_id, payment, event_type='payment_intent.succeeded'):
+        intent = payment_intent_payload(payment.stripe_payment_intent_id)
+        return {'id': event_id, 'type': event_type, 'data': {'object': intent}}
+
+    def write(self, *lines):
+        with open(self.path, 'a') as export:
+            for line in lines:
+                export.write((line if isinstance(line, str) else json.dumps(line)) + '\n')
+
+    def replay(self, *args):
+        out = StringIO()
+        call_command('replay_stripe_events', self.path, '--checkpoint', self.checkpoint, '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_replay_dedupes_and_applies_webhook_transitions(self):
+        first, second = (portfolio.pending_payment for portfolio in self.portfolios)
+        self.write(
+            self.event('evt_1', first),
+            self.event('evt_1', first),
+            'not json',
+            {'id': 'evt_other', 'type': 'customer.created', 'data': {'object': {}}},
+            self.event('evt_2', second, 'payment_intent.payment_failed'),
+            # completed payments never move back to failed
+            self.event('evt_3', first, 'payment_intent.payment_failed'),
+        )
+        output = self.replay()
+
+        self.assertIn('3 events (1 duplicates, 1 invalid lines), updated 2 payments', output)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.stripe_charge_id), ('completed', f'ch_{first.stripe_payment_intent_id}'))
+        self.assertEqual(second.status, 'failed')
+        self.assertEqual(ProcessedStripeEvent.objects.count(), 3)
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_verified_stripe_event_objects_are_applied(self):
+        payment = self.portfolios[0].pending_payment
+        event = stripe.Event.construct_from(self.event('evt_verified', payment), 'sk_test_stub')
+        for _ in range(2):
+            with mock.patch('stripe.Webhook.construct_event', return_value=event):
+                response = self.client.post(reverse('stripe_webhook'), '{}', content_type='application/json', HTTP_STRIPE_SIGNATURE='t=1,v1=x')
+            self.assertEqual(response.status_code, 200)
+
+        payment.refresh_from_db()
+        self.assertEqual((payment.status, payment.stripe_charge_id), ('completed', f'ch_{payment.stripe_payment_intent_id}'))
+        self.assertEqual(list(ProcessedStripeEvent.objects.values_list('event_id', flat=True)), ['evt_verified'])
+        with self.assertRaises(TypeError):
+            process_events([event])
+
+    def test_rerun_resumes_from_the_checkpoint(self):
+        first, second = (portfolio.pending_payment for portfolio in self.portfolios)
+        self.write(self.event('evt_1', first))
+        self.replay()
+        with open(self.checkpoint) as checkpoint:
+            self.assertEqual(int(checkpoint.read()), os.path.getsize(self.path))
+
+        self.write(self.event('evt_2', second))
+        self.assertIn('Replayed 1 events (0 duplicates', self.replay())
+        # From the start again: everything is already processed
+        self.assertIn('Replayed 0 events (2 duplicates', self.replay('--start-offset', '0'))
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'completed')
+
+
+class IdempotencyKeyTests(StubStripeMixin, QueryBudgetTestCase):
+
+    def create(self, key, amount='15000.00'):
+        tenant = self.portfolios[0].primary_tenant
+        self.authenticate(tenant.user)
+        return self.client.post(reverse('create_payment_intent'), {
+            'amount': amount,
+            'property_id': tenant.property.id,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.create('checkout-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(StripeGateway.create_payment_intent.call_args.kwargs['idempotency_key'],
+                         f'nyumbani-{self.portfolios[0].primary_tenant.user.pk}-checkout-1')
+
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.create('checkout-1')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        # User lookup for authentication and the record lookup; no Stripe call, no insert
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(self.created_intents, 1)
+        self.assertEqual(Payment.objects.filter(id=first.json()['payment_id']).count(), 1)
+
+        self.assertEqual(self.create('checkout-2').status_code, 200)
+        self.assertEqual(self.created_intents, 2)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.create('checkout-1')
+        self.assertEqual(self.create('checkout-1', amount='1.00').status_code, 422)
+        self.assertEqual(self.create('x' * 256).status_code, 400)
+
+    def test_expired_records_are_ignored_and_purged(self):
+        self.create('checkout-1')
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotIn('Idempotent-Replayed', self.create('checkout-1'))
+        self.assertEqual(self.created_intents, 2)
+
+        IdempotencyRecord.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+
+class RecordingBroker:
+    """Test backend that keeps what was published"""
+    published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+@override_settings(PAYMENT_EVENTS_BACKEND='payments.tests.RecordingBroker', STRIPE_WEBHOOK_SECRET='')
+class PaymentStatusStreamTests(StubStripeMixin, QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        RecordingBroker.published = []
+
+    def published(self):
+        return [(channel, message['payment_id'], message['previous_status'], message['status'])
+                for channel, message in RecordingBroker.published]
+
+    def test_webhook_and_confirmation_publish_to_tenant_and_landlord(self):
+        first, second = self.portfolios
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('stripe_webhook'), {
+                'type': 'payment_intent.succeeded',
+                'data': {'object': payment_intent_payload(first.pending_payment.stripe_payment_intent_id)},
+            }, format='json')
+        self.intent_status = 'requires_payment_method'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('confirm_payment'), {
+                'payment_intent_id': second.pending_payment.stripe_payment_intent_id,
+            }, format='json')
+
+        self.assertEqual(self.published(), [
+            (tenant_channel(first.primary_tenant.id), first.pending_payment.id, 'pending', 'completed'),
+            (landlord_channel(first.landlord.id), first.pending_payment.id, 'pending', 'completed'),
+            (tenant_channel(second.primary_tenant.id), second.pending_payment.id, 'pending', 'failed'),
+            (landlord_channel(second.landlord.id), second.pending_payment.id, 'pending', 'failed'),
+        ])
+
+    def test_publishing_waits_for_the_commit(self):
+        payment = self.portfolios[0].pending_payment
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            payment.status = 'completed'
+            payment.save()
+        # Income invalidation and the publish
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(RecordingBroker.published, [])
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='')
+class PaymentChangeFeedTests(StubStripeMixin, QueryBudgetTestCase):
+    LARGE_SCALE = 5
+
+    def feed(self, user, **params):
+        self.authenticate(user)
+        response = self.client.get(reverse('payment_changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']
+
+    def test_webhook_confirm_and_sync_append_to_the_feed_in_order(self):
+        first, second = self.portfolios
+        self.client.post(reverse('stripe_webhook'), {
+            'type': 'payment_intent.succeeded',
+            'data': {'object': payment_intent_payload(first.pending_payment.stripe_payment_intent_id)},
+        }, format='json')
+        self.intent_status = 'requires_payment_method'
+        self.client.post(reverse('confirm_payment'), {
+            'payment_intent_id': second.pending_payment.stripe_payment_intent_id,
+        }, format='json')
+        details = {'status': 'succeeded', 'charges': [{'id': 'ch_sync', 'receipt_url': 'https://pay.stripe.com/receipts/1'}]}
+        with mock.patch.object(StripePaymentService, 'get_payment_intent_details', return_value=details):
+            StripePaymentService.sync_payment_with_stripe(Payment.objects.get(id=second.pending_payment.id))
+
+        self.assertEqual(
+            list(PaymentChange.objects.order_by('id').values_list('payment_id', 'previous_status', 'status', 'source')),
+            [
+                (first.pending_payment.id, 'pending', 'completed', 'webhook'),
+                (second.pending_payment.id, 'pending', 'failed', 'confirm'),
+                (second.pending_payment.id, 'failed', 'completed', 'sync'),
+            ],
+        )
+
+        page = self.feed(second.landlord, limit=1)
+        self.assertEqual([change['source'] for change in page['changes']], ['confirm'])
+        self.assertTrue(page['has_more'])
+        page = self.feed(second.landlord, after=page['next'])
+        self.assertEqual([change['status'] for change in page['changes']], ['completed'])
+        self.assertFalse(page['has_more'])
+        self.assertEqual(self.feed(second.landlord, after=page['next'])['changes'], [])
+
+        self.assertEqual([change['source'] for change in self.feed(first.primary_tenant.user)['changes']], ['webhook'])
+        self.assertEqual([change['source'] for change in self.feed(second.primary_tenant.user)['changes']], ['confirm', 'sync'])
+
+    def test_entries_committing_late_are_not_skipped(self):
+        portfolio = self.portfolios[0]
+        payment = portfolio.pending_payment
+        payment.status = 'completed'
+        payment.save()
+        page = self.feed(portfolio.landlord)
+        self.assertEqual(len(page['changes']), 1)
+
+        # An entry whose id was allocated before the one just read, by a transaction that only commits now
+        late = PaymentChange.objects.create(
+            id=PaymentChange.objects.get().id - 1, payment_id=payment.id, tenant_id=payment.tenant_id,
+            landlord_id=portfolio.landlord.id, status='refunded', amount=payment.amount, currency='kes', source='app',
+        )
+        page = self.feed(portfolio.landlord, after=page['next'])
+        self.assertEqual([change['status'] for change in page['changes']], ['refunded'])
+        late.refresh_from_db()
+        self.assertEqual(page['next'], late.sequence)
+        self.assertEqual(self.feed(portfolio.landlord, after=page['next'])['changes'], [])
+
+    def test_entry_rolls_back_with_the_change(self):
+        payment = self.portfolios[0].pending_payment
+        payment.status = 'completed'
+        with mock.patch('payments.signals.publish_status_change', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                payment.save()
+        self.assertEqual(Payment.objects.get(id=payment.id).status, 'pending')
+        self.assertFalse(PaymentChange.objects.exists())
+
+    def test_compaction_drops_entries_past_retention(self):
+        payment = self.portfolios[0].pending_payment
+        payment.status = 'completed'
+        payment.save()
+        kept = PaymentChange.objects.get()
+        expired = PaymentChange.objects.create(
+            payment_id=payment.id, tenant_id=payment.tenant_id, status='pending', amount=payment.amount, currency='kes', source='create',
+        )
+        PaymentChange.objects.filter(id=expired.id).update(created_at=timezone.now() - timedelta(days=31))
+
+        out = StringIO()
+        call_command('compact_payment_changes', retention_days=30, stdout=out)
+        self.assertIn('Removed 1 payment change entries', out.getvalue())
+        self.assertEqual(list(PaymentChange.objects.values_list('id', flat=True)), [kept.id])
+
+
+@override_settings(PAYMENT_STREAM_KEEPALIVE_SECONDS=0.05, PAYMENT_STREAM_MAX_SECONDS=0.3)
+class PaymentStatusStreamViewTests(QueryBudgetTestCase):
+
+    async def next_chunk(self, chunks):
+        chunk = await anext(chunks)
+        return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+    async def test_landlord_stream_relays_published_changes(self):
+        portfolio = self.portfolios[0]
+        channel = landlord_channel(portfolio.landlord.id)
+        response = await self.async_client.get(reverse('payment_status_stream'), {'token': str(AccessToken.for_user(portfolio.landlord))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        chunks = aiter(response.streaming_content)
+        self.assertTrue((await self.next_chunk(chunks)).startswith('retry:'))
+        pending = asyncio.ensure_future(self.next_chunk(chunks))
+        while get_broker().subscriber_count(channel) == 0:
+            await asyncio.sleep(0.001)
+        get_broker().publish(channel, {'id': 7, 'payment_id': 1, 'status': 'completed'})
+
+        chunk = await pending
+        self.assertIn('event: payment.status', chunk)
+        self.assertEqual(json.loads(chunk.split('data: ')[1])['status'], 'completed')
+        self.assertEqual(await self.next_chunk(chunks), ': keepalive\n\n')
+        # The stream ends after PAYMENT_STREAM_MAX_SECONDS and releases its subscription
+        async for _ in chunks:
+            pass
+        self.assertEqual(get_broker().subscriber_count(channel), 0)
+
+    @override_settings(PAYMENT_STREAM_MAX_SECONDS=30)
+    async def test_stream_ends_when_the_token_expires(self):
+        token = AccessToken.for_user(self.portfolios[0].landlord)
+        token.set_exp(lifetime=timedelta(seconds=1))
+        response = await self.async_client.get(reverse('payment_status_stream'), {'token': str(token)})
+        self.assertEqual(response.status_code, 200)
+
+        started = time.monotonic()
+        async for _ in response.streaming_content:
+            pass
+        self.assertLess(time.monotonic() - started, 2)
+
+    async def test_stream_requires_a_valid_token(self):
+        response = await self.async_client.get(reverse('payment_status_stream'), {'token': 'nope'})
+        self.assertEqual(response.status_code, 401)
+
+
+class InProcessBrokerTests(SimpleTestCase):
+
+    async def test_publish_from_another_thread_reaches_subscribers(self):
+        broker = InProcessBroker(max_pending=2)
+        with broker.subscribe('tenant:1') as subscription:
+            await asyncio.to_thread(broker.publish, 'tenant:1', {'id': 1})
+            await asyncio.to_thread(broker.publish, 'tenant:2', {'id': 2})
+            self.assertEqual(await asyncio.wait_for(subscription.get(), 1), {'id': 1})
+
+            # A slow consumer loses the oldest messages
+            for message_id in (3, 4, 5):
+                broker.publish('tenant:1', {'id': message_id})
+            await asyncio.sleep(0)
+            self.assertEqual([await subscription.get(), await subscription.get()], [{'id': 4}, {'id': 5}])
+        self.assertEqual(broker.subscriber_count('tenant:1'), 0)
@@ -6,7 +6,11 @@ from .views import (
     PaymentListView,
     PaymentDetailView,
     TenantPaymentSummaryView,
-    PropertyPaymentSummaryView
+    PropertyPaymentSummaryView,
+    LandlordArrearsView,
+    LandlordIncomeView,
+    PaymentStatusStreamView,
+    PaymentChangesView
 )
 
 urlpatterns = [
@@ -15,6 +19,10 @@ urlpatterns = [
     path('confirm-payment/', ConfirmStripePayment.as_view(), name='confirm_payment'),
     path('tenant-payment-summary/', TenantPaymentSummaryView.as_view(), name='tenant_payment_summary'),
     path('property-payment-summary/', PropertyPaymentSummaryView.as_view(), name='property_payment_summary'),
+    path('arrears/', LandlordArrearsView.as_view(), name='landlord_arrears'),
+    path('income/', LandlordIncomeView.as_view(), name='landlord_income'),
+    path('changes/', PaymentChangesView.as_view(), name='payment_changes'),
+    path('stream/', PaymentStatusStreamView.as_view(), name='payment_status_stream'),
     path('', PaymentListView.as_view(), name='payment_list'),
     path('<int:pk>/', PaymentDetailView.as_view(), name='payment_detail'),
 ]
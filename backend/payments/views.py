@@ -1,5 +1,19 @@
-import stripe
+import asyncio
+import json
+import time
+from contextlib import nullcontext
+from datetime import date
+from decimal import Decimal
+from itertools import islice
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
@@ -8,17 +22,36 @@ from rest_framework import generics
 from .models import Payment
 from .serializers import PaymentSerializer, PaymentDetailSerializer
 from .services import StripePaymentService
+from .income import MAX_MONTHS, get_income_series
+from .events import process_events
+from .outbox import changes_after, resolve_cursor
+from . import idempotency
+from dashboard import delta, sharding
 from dashboard.models import Tenant, Property
-
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from monitoring.metrics import observe_webhook_lag
+from .stripe_client import StripeUnavailable, get_stripe_gateway
+from .streams import get_broker, landlord_channel, tenant_channel
 
 class CreateStripePaymentIntent(APIView):
+    throttle_scope = 'payments'
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
         amount = request.data.get('amount')
         property_id = request.data.get('property_id')
         
+        # Retries sent with the same Idempotency-Key get the first response back
+        idempotency_key = request.headers.get(idempotency.HEADER)
+        if idempotency_key is not None:
+            if not idempotency_key or len(idempotency_key) > idempotency.MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{idempotency.HEADER} must be 1-{idempotency.MAX_KEY_LENGTH} characters"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            replayed = idempotency.lookup(request, idempotency_key)
+            if replayed is not None:
+                return replayed
+        
         try:
             tenant = request.user.tenant_profile
             property_obj = Property.objects.get(id=property_id)
@@ -37,33 +70,50 @@ class CreateStripePaymentIntent(APIView):
             # Convert amount to cents for Stripe
             amount_in_cents = int(float(amount) * 100)
             
-            # Create payment intent with Stripe
-            intent = stripe.PaymentIntent.create(
-                amount=amount_in_cents,
-                currency='kes',
-                metadata={
+            # Create payment intent with Stripe; a retried key returns the same intent
+            intent = get_stripe_gateway().create_payment_intent({
+                'amount': amount_in_cents,
+                'currency': 'kes',
+                'metadata': {
                     'tenant_id': str(tenant.id),
-                    'tenant_name': str(tenant.user.get_full_name() or tenant.user.username),
+                    'tenant_name': str(tenant.user.get_full_name() or tenant.user.email),
                     'property_id': str(property_obj.id),
                     'property_address': str(property_obj.address)
                 }
-            )
-            
-            # Create payment record
-            payment = Payment.objects.create(
-                tenant=tenant,
-                property=property_obj,
-                amount=amount,
-                stripe_payment_intent_id=intent.id,
-                stripe_client_secret=intent.client_secret
-            )
+            }, idempotency_key=f'nyumbani-{request.user.pk}-{idempotency_key}' if idempotency_key else None)
             
-            return Response({
-                "client_secret": intent.client_secret,
-                "payment_id": payment.id,
-                "payment_details": PaymentSerializer(payment).data
-            }, status=status.HTTP_200_OK)
+            # Only keyed requests need the payment and stored response to commit together
+            with transaction.atomic() if idempotency_key else nullcontext():
+                # Create payment record
+                payment = Payment.objects.create(
+                    tenant=tenant,
+                    property_t=property_obj,
+                    amount=Decimal(str(amount)),
+                    stripe_payment_intent_id=intent.id,
+                    stripe_client_secret=intent.client_secret
+                )
+                
+                response = Response({
+                    "client_secret": intent.client_secret,
+                    "payment_id": payment.id,
+                    "payment_details": PaymentSerializer(payment).data
+                }, status=status.HTTP_200_OK)
+                if idempotency_key:
+                    idempotency.store(request, idempotency_key, response)
+            return response
             
+        except IntegrityError as e:
+            # A concurrent duplicate stored its response first; ours was rolled back
+            replayed = idempotency.lookup(request, idempotency_key) if idempotency_key else None
+            return replayed or Response(
+                {"error": str(e)}, 
+                status=status.HTTP_409_CONFLICT
+            )
+        except StripeUnavailable:
+            return Response(
+                {"error": "Payment provider is temporarily unavailable, please try again shortly"}, 
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         except Exception as e:
             return Response(
                 {"error": str(e)}, 
@@ -71,6 +121,8 @@ class CreateStripePaymentIntent(APIView):
             )
 
 class StripeWebhook(APIView):
+    # Stripe's retries must never be rejected
+    throttle_classes = []
     def post(self, request):
         payload = request.body
         sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
@@ -78,57 +130,50 @@ class StripeWebhook(APIView):
         
         try:
             if endpoint_secret:
-                event = stripe.Webhook.construct_event(
-                    payload, sig_header, endpoint_secret
-                )
+                # Imported on first use so processes that never see a webhook skip loading stripe
+                import stripe
+                try:
+                    # A verified stripe.Event; everything past this point works on plain dicts
+                    event = stripe.Webhook.construct_event(
+                        payload, sig_header, endpoint_secret
+                    ).to_dict()
+                except stripe.error.SignatureVerificationError:
+                    return Response(status=status.HTTP_400_BAD_REQUEST)
             else:
                 event = request.data
                 
         except ValueError:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        except stripe.error.SignatureVerificationError:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
         
-        # Handle the event
-        if event['type'] == 'payment_intent.succeeded':
-            payment_intent = event['data']['object']
-            
-            # Update payment record
-            try:
-                payment = Payment.objects.get(
-                    stripe_payment_intent_id=payment_intent['id']
-                )
-                payment.status = 'completed'
-                payment.stripe_charge_id = payment_intent['charges']['data'][0]['id'] if payment_intent['charges']['data'] else None
-                payment.save()
-            except Payment.DoesNotExist:
-                pass
-                
-        elif event['type'] == 'payment_intent.payment_failed':
-            payment_intent = event['data']['object']
-            
-            # Update payment record
-            try:
-                payment = Payment.objects.get(
-                    stripe_payment_intent_id=payment_intent['id']
-                )
-                payment.status = 'failed'
-                payment.save()
-            except Payment.DoesNotExist:
-                pass
+        observe_webhook_lag(event.get('type', 'unknown'), event.get('created'))
+        
+        # Same transitions as the replay_stripe_events command; redelivered events are skipped
+        process_events([event])
         
         return Response({"status": "success"}, status=status.HTTP_200_OK)
 
 class ConfirmStripePayment(APIView):
+    throttle_scope = 'payments'
     def post(self, request):
         payment_intent_id = request.data.get('payment_intent_id')
         
         try:
-            payment = Payment.objects.get(stripe_payment_intent_id=payment_intent_id)
+            payment = Payment.objects.select_related('property_t', 'tenant__user').get(
+                stripe_payment_intent_id=payment_intent_id
+            )
             
             # Retrieve payment intent from Stripe
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            try:
+                intent = get_stripe_gateway().retrieve_payment_intent(payment_intent_id)
+            except StripeUnavailable:
+                # Serve the locally known status; the webhook will catch up
+                return Response({
+                    "status": payment.status,
+                    "payment_id": payment.id,
+                    "stale": True
+                })
             
+            payment.change_source = 'confirm'
             if intent.status == 'succeeded':
                 payment.status = 'completed'
                 payment.stripe_charge_id = intent['charges']['data'][0]['id'] if intent['charges']['data'] else None
@@ -163,22 +208,55 @@ class ConfirmStripePayment(APIView):
             )
 
 class PaymentListView(generics.ListAPIView):
+    """
+    A tenant's payments. With ?since=<watermark> the response is
+    {"payments", "deleted", "watermark", "full"} holding only payments
+    changed or archived since then; the plain list carries the watermark
+    in the X-Sync-Watermark header.
+    """
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         tenant_id = self.request.query_params.get('tenant_id')
         if tenant_id:
-            return Payment.objects.filter(tenant_id=tenant_id)
+            return Payment.objects.filter(tenant_id=tenant_id).select_related('property_t', 'tenant__user')
         return Payment.objects.none()
+    
+    def list(self, request, *args, **kwargs):
+        try:
+            since = delta.parse_since(request)
+        except delta.InvalidWatermark as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        started = timezone.now()
+        if since is None:
+            response = super().list(request, *args, **kwargs)
+            response['X-Sync-Watermark'] = delta.watermark(started)
+            return response
+        
+        full = delta.needs_full_sync(since)
+        payments = self.get_queryset()
+        tenant_id = request.query_params.get('tenant_id')
+        deleted = []
+        if not full:
+            payments = payments.filter(updated_at__gt=since)
+            if tenant_id:
+                deleted = delta.deleted_since(Payment, since, tenant_id=tenant_id)
+        return Response({
+            'payments': self.get_serializer(payments, many=True).data,
+            'deleted': deleted,
+            'watermark': delta.watermark(started),
+            'full': full,
+        })
 
 class PaymentDetailView(generics.RetrieveAPIView):
     serializer_class = PaymentDetailSerializer
     permission_classes = [IsAuthenticated]
-    queryset = Payment.objects.all()
+    queryset = Payment.objects.select_related('property_t', 'tenant__user')
     lookup_field = 'pk'
 
 class TenantPaymentSummaryView(APIView):
+    throttle_scope = 'expensive'
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
@@ -193,15 +271,200 @@ class TenantPaymentSummaryView(APIView):
             )
 
 class PropertyPaymentSummaryView(APIView):
+    throttle_scope = 'expensive'
     permission_classes = [IsAuthenticated]
     
-    def get(self, request, property_id):
+    def get(self, request, property_id=None):
+        property_id = property_id or request.query_params.get('property_id')
         try:
             property_obj = Property.objects.get(id=property_id)
             summary = StripePaymentService.get_property_payment_summary(property_obj)
             return Response(summary)
-        except Property.DoesNotExist:
+        except (Property.DoesNotExist, ValueError):
             return Response(
                 {"error": "Property not found"}, 
                 status=404
             )
+
+class LandlordArrearsView(APIView):
+    """Who owes what across the landlord's tenants, aged 0-29/30-59/60-89/90+ days"""
+    throttle_scope = 'expensive'
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        if not getattr(request.user, 'landlord', False):
+            return Response(
+                {"success": False, "error": "User is not a landlord"}, 
+                status=403
+            )
+        try:
+            as_of = request.query_params.get('as_of')
+            as_of = date.fromisoformat(as_of) if as_of else None
+            limit = int(request.query_params.get('limit', 100))
+        except ValueError:
+            return Response(
+                {"success": False, "error": "as_of must be YYYY-MM-DD and limit an integer"}, 
+                status=400
+            )
+        
+        # Loads numpy, so only imported once someone asks for arrears
+        from .arrears import load_arrears, tenant_labels
+        report = load_arrears(landlord=request.user, as_of=as_of)
+        rows = list(islice(report.rows(only_overdue=True), max(limit, 0)))
+        labels = tenant_labels([row['tenant_id'] for row in rows])
+        for row in rows:
+            row['tenant_name'], row['property_address'] = labels.get(row['tenant_id'], (None, None))
+        
+        return Response({
+            'success': True,
+            'data': {
+                'as_of': report.as_of,
+                'totals': report.totals(),
+                'tenants': rows,
+            }
+        })
+
+class LandlordIncomeView(APIView):
+    """Monthly collected vs expected rent per property and in total, for charts"""
+    throttle_scope = 'expensive'
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        if not getattr(request.user, 'landlord', False):
+            return Response(
+                {"success": False, "error": "User is not a landlord"}, 
+                status=403
+            )
+        try:
+            months = int(request.query_params.get('months', 12))
+        except ValueError:
+            months = 0
+        if not 1 <= months <= MAX_MONTHS:
+            return Response(
+                {"success": False, "error": f"months must be between 1 and {MAX_MONTHS}"}, 
+                status=400
+            )
+        
+        return Response({
+            'success': True,
+            'data': get_income_series(request.user, months)
+        })
+
+class PaymentChangesView(APIView):
+    """
+    Cursor over the payment change feed: a landlord gets changes on their
+    properties, a tenant their own. Pass the returned `next` as ?after= to
+    continue; `has_more` says whether another page is already waiting.
+    `reset` is true when the cursor belonged to a feed the caller's rows have
+    since moved off, and the page starts from the beginning again.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = int(request.query_params.get('limit', settings.PAYMENT_CHANGES_PAGE_SIZE))
+        except ValueError:
+            return Response(
+                {"success": False, "error": "after and limit must be integers"}, 
+                status=400
+            )
+        limit = min(max(limit, 1), settings.PAYMENT_CHANGES_PAGE_SIZE)
+        after, reset = resolve_cursor(after)
+        
+        if getattr(request.user, 'landlord', False):
+            changes = changes_after(after, limit + 1, landlord_id=request.user.id)
+        else:
+            tenant_id = Tenant.objects.filter(user=request.user).values_list('id', flat=True).first()
+            if tenant_id is None:
+                return Response(
+                    {"success": False, "error": "User is neither a landlord nor a tenant"}, 
+                    status=403
+                )
+            changes = changes_after(after, limit + 1, tenant_id=tenant_id)
+        
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return Response({
+            'success': True,
+            'data': {
+                'changes': [
+                    {
+                        'sequence': change.sequence,
+                        'payment_id': change.payment_id,
+                        'tenant_id': change.tenant_id,
+                        'previous_status': change.previous_status,
+                        'status': change.status,
+                        'amount': change.amount,
+                        'currency': change.currency,
+                        'source': change.source,
+                        'created_at': change.created_at,
+                    }
+                    for change in changes
+                ],
+                'next': changes[-1].sequence if changes else after,
+                'has_more': has_more,
+                'reset': reset,
+            }
+        })
+
+class PaymentStatusStreamView(View):
+    """
+    Server-Sent Events stream of the caller's payment status changes: a
+    landlord gets every payment on their properties, a tenant their own.
+    Browsers' EventSource cannot send headers, so the access token may also
+    be passed as ?token=. Needs an ASGI server; the stream ends after
+    PAYMENT_STREAM_MAX_SECONDS, or earlier when the token expires, and the
+    client reconnects with a fresh token.
+    """
+    
+    async def get(self, request):
+        authenticated = await sync_to_async(self._authenticate)(request)
+        if authenticated is None:
+            return JsonResponse({"error": "Authentication credentials were not provided or are invalid"}, status=401)
+        user, token = authenticated
+        channel = await sync_to_async(self._channel)(user)
+        if channel is None:
+            return JsonResponse({"error": "User is neither a landlord nor a tenant"}, status=403)
+        
+        # Never outlive the token: reconnecting is what makes the client present a fresh one
+        duration = min(settings.PAYMENT_STREAM_MAX_SECONDS, token['exp'] - time.time())
+        response = StreamingHttpResponse(self._events(channel, duration), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def _authenticate(self, request):
+        authentication = JWTAuthentication()
+        raw_token = request.GET.get('token')
+        try:
+            if raw_token:
+                token = authentication.get_validated_token(raw_token)
+                return authentication.get_user(token), token
+            return authentication.authenticate(request)
+        except (InvalidToken, AuthenticationFailed):
+            return None
+    
+    def _channel(self, user):
+        if user.landlord:
+            return landlord_channel(user.id)
+        # Plain JWT authentication does not route to the user's shard, so look the profile up there
+        with sharding.using_shard(sharding.shard_for_user(user)) if sharding.enabled() else nullcontext():
+            tenant_id = Tenant.objects.filter(user=user).values_list('id', flat=True).first()
+        return tenant_channel(tenant_id) if tenant_id else None
+    
+    async def _events(self, channel, duration):
+        keepalive = settings.PAYMENT_STREAM_KEEPALIVE_SECONDS
+        deadline = time.monotonic() + duration
+        yield f"retry: {settings.PAYMENT_STREAM_RETRY_MS}\n\n"
+        
+        with get_broker().subscribe(channel) as subscription:
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    message = await asyncio.wait_for(subscription.get(), timeout=min(keepalive, remaining))
+                except asyncio.TimeoutError:
+                    # Comment lines keep proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {message['id']}\nevent: payment.status\ndata: {json.dumps(message)}\n\n"
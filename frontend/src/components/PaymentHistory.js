@@ -1,8 +1,28 @@
 import React, { useState, useEffect } from 'react';
 import { FiDollarSign, FiCheckCircle, FiClock, FiXCircle, FiExternalLink } from 'react-icons/fi';
+import axios from 'axios';
+import { jwtDecode } from 'jwt-decode';
 import api from '../api';
 import './PaymentHistory.css';
 
+// Matches PAYMENT_STREAM_RETRY_MS on the server
+const STREAM_RECONNECT_MS = 3000;
+// Refresh the access token first when it has less than this left
+const STREAM_TOKEN_MARGIN_MS = 30000;
+
+// The stored access token, refreshed first if it is about to expire
+const streamToken = async () => {
+    const tokens = JSON.parse(localStorage.getItem('authTokens') || 'null');
+    if (!tokens) return null;
+    if (jwtDecode(tokens.access).exp * 1000 - Date.now() > STREAM_TOKEN_MARGIN_MS) return tokens.access;
+    const response = await axios.post(`${api.defaults.baseURL}/auth/api/token/refresh/`, {
+        refresh: tokens.refresh
+    });
+    const refreshed = { ...tokens, ...response.data };
+    localStorage.setItem('authTokens', JSON.stringify(refreshed));
+    return refreshed.access;
+};
+
 const PaymentHistory = ({ tenantId }) => {
     const [payments, setPayments] = useState([]);
     const [summary, setSummary] = useState(null);
@@ -13,6 +33,47 @@ const PaymentHistory = ({ tenantId }) => {
         fetchPaymentData();
     }, [tenantId]);
 
+    // Status changes are pushed by the server instead of re-fetching the list
+    useEffect(() => {
+        let source = null;
+        let retry = null;
+        let stopped = false;
+
+        const onStatus = (event) => {
+            const change = JSON.parse(event.data);
+            setPayments((current) => current.map((payment) => (
+                payment.id === change.payment_id ? { ...payment, status: change.status } : payment
+            )));
+        };
+
+        const connect = async () => {
+            let access;
+            try {
+                access = await streamToken();
+            } catch (err) {
+                console.error('Could not refresh the payment stream token:', err);
+            }
+            if (stopped || !access) return;
+            source = new EventSource(
+                `${api.defaults.baseURL}/payments/stream/?token=${encodeURIComponent(access)}`
+            );
+            source.addEventListener('payment.status', onStatus);
+            // The browser would reconnect with the same, by then expired, token and give up on
+            // the 401, so close the stream and open a new one with a fresh token instead
+            source.onerror = () => {
+                source.close();
+                if (!stopped) retry = setTimeout(connect, STREAM_RECONNECT_MS);
+            };
+        };
+
+        connect();
+        return () => {
+            stopped = true;
+            clearTimeout(retry);
+            if (source) source.close();
+        };
+    }, [tenantId]);
+
     const fetchPaymentData = async () => {
         try {
             setLoading(true);
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useContext } from 'react';
+import React, { useState, useRef, useEffect, useContext } from 'react';
 import { loadStripe } from '@stripe/stripe-js';
 import { Elements, CardElement, useStripe, useElements } from '@stripe/react-stripe-js';
 import { AuthContext } from '../context/AuthContext';
@@ -29,6 +29,8 @@ const CheckoutForm = ({ tenantId, onPaymentComplete }) => {
   const [amount, setAmount] = useState('');
   const [clientSecret, setClientSecret] = useState(null);
   const [paymentId, setPaymentId] = useState(null);
+  // One key per checkout, so a double-submit gets the same payment intent back
+  const idempotencyKey = useRef(crypto.randomUUID());
 
   const createPaymentIntent = async () => {
     try {
@@ -43,6 +45,7 @@ const CheckoutForm = ({ tenantId, onPaymentComplete }) => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey.current,
           'Authorization': `Bearer ${token}`
         },
         body: JSON.stringify({
@@ -115,6 +118,7 @@ const CheckoutForm = ({ tenantId, onPaymentComplete }) => {
         onPaymentComplete();
         setAmount('');
         setClientSecret(null);
+        idempotencyKey.current = crypto.randomUUID();
         setPaymentId(null);
         setIsLoading(false);
       } else {
@@ -134,6 +138,7 @@ const CheckoutForm = ({ tenantId, onPaymentComplete }) => {
     if (value === '' || /^\d*\.?\d*$/.test(value)) {
       setAmount(value);
       setClientSecret(null); // Reset client secret when amount changes
+      idempotencyKey.current = crypto.randomUUID();
       setError(null);
     }
   };
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useRef, useEffect } from 'react';
 import { loadStripe } from '@stripe/stripe-js';
 import { Elements, CardElement, useStripe, useElements } from '@stripe/react-stripe-js';
 import styles from './PaymentForm.module.css';
@@ -14,6 +14,8 @@ const CheckoutForm = ({ tenantId, onPaymentComplete }) => {
   const [amount, setAmount] = useState('');
   const [clientSecret, setClientSecret] = useState(null);
   const [paymentId, setPaymentId] = useState(null);
+  // One key per checkout, so a double-submit gets the same payment intent back
+  const idempotencyKey = useRef(crypto.randomUUID());
 
   const createPaymentIntent = async () => {
     try {
@@ -22,6 +24,7 @@ const CheckoutForm = ({ tenantId, onPaymentComplete }) => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKey.current,
           'Authorization': `Bearer ${token}`
         },
         body: JSON.stringify({
@@ -77,6 +80,7 @@ const CheckoutForm = ({ tenantId, onPaymentComplete }) => {
       onPaymentComplete();
       setAmount('');
       setClientSecret(null);
+      idempotencyKey.current = crypto.randomUUID();
       setPaymentId(null);
     }
   };
@@ -84,6 +88,7 @@ const CheckoutForm = ({ tenantId, onPaymentComplete }) => {
   const handleAmountChange = (e) => {
     setAmount(e.target.value);
     setClientSecret(null); // Reset client secret when amount changes
+    idempotencyKey.current = crypto.randomUUID();
   };
 
   return (